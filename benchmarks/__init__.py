@@ -0,0 +1,8 @@
+"""Benchmarks for the HAML compile phase.
+
+Run them with::
+
+    $ python -m benchmarks --seed 1 --output results.json
+
+See benchmarks.run for the available options.
+"""
@@ -0,0 +1,137 @@
+"""Generators for synthetic HAML corpora.
+
+Every generator takes a random.Random instance and a scale, and returns the
+HAML source of a single template. The same seed and scale always produce the
+same source, so results can be compared across runs and machines.
+"""
+
+import random
+
+
+__all__ = ['CORPORA', 'generate', 'generate_all']
+
+
+TAGS = ['div', 'p', 'span', 'li', 'a', 'section', 'strong', 'em', 'td']
+WORDS = ['lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing',
+         'elit', 'sed', 'do', 'eiusmod', 'tempor']
+NAMES = ['user', 'item', 'page', 'entry', 'product', 'comment']
+
+
+def _words(rng, count):
+  return ' '.join(rng.choice(WORDS) for _ in range(count))
+
+
+def _variable(rng):
+  return '%s.%s' % (rng.choice(NAMES), rng.choice(['name', 'url', 'id']))
+
+
+def deep_nesting(rng, scale):
+  """Tags nested scale levels deep, a few times over."""
+
+  lines = []
+  for _ in range(4):
+    for depth in range(scale):
+      lines.append('  ' * depth + '%%%s.level-%d' % (rng.choice(TAGS), depth))
+    lines.append('  ' * scale + _words(rng, 5))
+  return '\n'.join(lines)
+
+
+def wide_siblings(rng, scale):
+  """A single list with scale * 20 items."""
+
+  lines = ['%ul.items']
+  for index in range(scale * 20):
+    lines.append('  %%li.item-%d %s' % (index, _words(rng, 3)))
+  return '\n'.join(lines)
+
+
+def heavy_attributes(rng, scale):
+  """Tags with many attributes, classes and ids."""
+
+  lines = ['%form(action="/submit", method="post")']
+  for index in range(scale * 5):
+    attributes = ', '.join('data-%s="%s"' % (word, _words(rng, 2))
+                           for word in rng.sample(WORDS, 6))
+    lines.append('  .field.%s#field-%d(%s, title="%s")' % (
+        rng.choice(WORDS), index, attributes, _words(rng, 3)))
+    lines.append('    %%input(type="text", name="f%d", value="#{%s}")' % (
+        index, _variable(rng)))
+  return '\n'.join(lines)
+
+
+def long_chains(rng, scale):
+  """Long -if/-elif/-else chains."""
+
+  lines = []
+  for _ in range(4):
+    lines.append('-if %s == 0' % _variable(rng))
+    lines.append('  %%p %s' % _words(rng, 4))
+    for index in range(1, scale * 5):
+      lines.append('-elif %s == %d' % (_variable(rng), index))
+      lines.append('  %%p %s' % _words(rng, 4))
+    lines.append('-else')
+    lines.append('  %%p %s' % _words(rng, 4))
+  return '\n'.join(lines)
+
+
+def large_scripts(rng, scale):
+  """Big :javascript blocks, which are passed through as text."""
+
+  lines = []
+  for block in range(4):
+    lines.append(':javascript')
+    for index in range(scale * 10):
+      lines.append('  var %s_%d_%d = "%s";' % (
+          rng.choice(WORDS), block, index, _words(rng, 6)))
+    lines.append('%%div#after-script-%d' % block)
+  return '\n'.join(lines)
+
+
+def interpolation(rng, scale):
+  """Text and attributes full of #{} variables."""
+
+  lines = ['-for %s in %ss' % (NAMES[0], NAMES[0])]
+  for _ in range(scale * 10):
+    lines.append('  %%a(href="#{%s}", title="#{%s}") #{%s} %s #{%s}' % (
+        _variable(rng), _variable(rng), _variable(rng), _words(rng, 2),
+        _variable(rng)))
+    lines.append('  #{%s} and #{%s}' % (_variable(rng), _variable(rng)))
+  return '\n'.join(lines)
+
+
+def mixed(rng, scale):
+  """A page-like template combining all of the above."""
+
+  parts = ['%html', '  %body']
+  for generator in (deep_nesting, wide_siblings, heavy_attributes,
+                    long_chains, large_scripts, interpolation):
+    source = generator(rng, max(1, scale // 2))
+    parts.extend('    ' + line for line in source.split('\n'))
+  return '\n'.join(parts)
+
+
+CORPORA = [
+    ('deep_nesting', deep_nesting),
+    ('wide_siblings', wide_siblings),
+    ('heavy_attributes', heavy_attributes),
+    ('long_chains', long_chains),
+    ('large_scripts', large_scripts),
+    ('interpolation', interpolation),
+    ('mixed', mixed),
+    ]
+
+
+def generate(name, seed=0, scale=20):
+  """Return the source of corpus name for the given seed and scale."""
+
+  names = [corpus_name for corpus_name, _ in CORPORA]
+  generator = CORPORA[names.index(name)][1]
+  # Each corpus gets its own stream, so adding one doesn't change the others.
+  return generator(random.Random(seed * 1000 + names.index(name)), scale)
+
+
+def generate_all(seed=0, scale=20):
+  """Return a list of (name, source) pairs for every corpus."""
+
+  return [(name, generate(name, seed=seed, scale=scale))
+          for name, _ in CORPORA]
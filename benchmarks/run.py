@@ -0,0 +1,141 @@
+"""Times each phase of the HAML pipeline on the synthetic corpora.
+
+    $ python -m benchmarks [--seed N] [--scale N] [--repeat N] [--number N]
+                           [--corpus NAME ...] [--phase NAME ...]
+                           [--output FILE]
+
+Results are written as JSON (to stdout by default). For every corpus and
+phase, the best and mean time of a single call are reported, in seconds.
+"""
+
+import argparse
+import json
+import platform
+import sys
+import timeit
+
+from jinja2 import Environment
+
+from benchmarks import corpus
+from pyhaml_jinja.ast_compiler import AstCompiler
+from pyhaml_jinja.compiler import Compiler
+from pyhaml_jinja.haml_extension import HamlExtension
+from pyhaml_jinja.parser import Parser
+from pyhaml_jinja.renderer import Renderer
+
+
+def _get_source_lines(source):
+  return lambda: Parser.get_source_lines(source)
+
+
+def _build_tree(source):
+  return lambda: Parser.build_tree(source)
+
+
+def _render_lines(source):
+  tree = Parser.build_tree(source)
+  return lambda: tree.render_lines(indent_string='  ', indent_level=-1)
+
+
+def _compile_lines(source):
+  return lambda: Compiler.compile_lines(source, '  ')
+
+
+def _preprocess(source):
+  # Disable the cache so every call runs the whole pipeline.
+  environment = Environment(extensions=[HamlExtension])
+  environment.haml_cache_size = 0
+  return lambda: environment.preprocess(source, 'benchmark.haml')
+
+
+def _parse_source(source):
+  # The Jinja AST through the string pipeline, to compare with parse_ast.
+  environment = Environment()
+  return lambda: environment.parse(Renderer(source, '\n', '  ').render())
+
+
+def _parse_ast(source):
+  environment = Environment()
+  return lambda: AstCompiler(source, '\n', '  ').parse(environment)
+
+
+# Each phase takes a source and returns the function to time, so that any
+# setup (like building the tree for render_lines) isn't measured.
+PHASES = [
+    ('get_source_lines', _get_source_lines),
+    ('build_tree', _build_tree),
+    ('render_lines', _render_lines),
+    ('compile_lines', _compile_lines),
+    ('preprocess', _preprocess),
+    ('parse_source', _parse_source),
+    ('parse_ast', _parse_ast),
+    ]
+
+
+def run(seed=0, scale=20, repeat=5, number=10, corpora=None, phases=None):
+  """Run the benchmarks, returning the results as a JSON-compatible dict."""
+
+  results = []
+  for corpus_name, source in corpus.generate_all(seed=seed, scale=scale):
+    if corpora and corpus_name not in corpora:
+      continue
+
+    for phase_name, setup in PHASES:
+      if phases and phase_name not in phases:
+        continue
+
+      timings = timeit.repeat(setup(source), repeat=repeat, number=number)
+      timings = [timing / number for timing in timings]
+      results.append({
+          'corpus': corpus_name,
+          'phase': phase_name,
+          'lines': source.count('\n') + 1,
+          'bytes': len(source),
+          'best': min(timings),
+          'mean': sum(timings) / len(timings),
+          })
+
+  return {
+      'python': platform.python_version(),
+      'implementation': platform.python_implementation(),
+      'seed': seed,
+      'scale': scale,
+      'repeat': repeat,
+      'number': number,
+      'results': results,
+      }
+
+
+def main(argv=None):
+  corpus_names = [name for name, _ in corpus.CORPORA]
+  phase_names = [name for name, _ in PHASES]
+
+  parser = argparse.ArgumentParser(
+      prog='python -m benchmarks',
+      description='Time the phases of the HAML pipeline.')
+  parser.add_argument('--seed', type=int, default=0,
+                      help='seed for the corpus generator (default: 0)')
+  parser.add_argument('--scale', type=int, default=20,
+                      help='size of the generated templates (default: 20)')
+  parser.add_argument('--repeat', type=int, default=5,
+                      help='number of timing runs (default: 5)')
+  parser.add_argument('--number', type=int, default=10,
+                      help='calls per timing run (default: 10)')
+  parser.add_argument('--corpus', action='append', choices=corpus_names,
+                      help='only run this corpus (can be repeated)')
+  parser.add_argument('--phase', action='append', choices=phase_names,
+                      help='only time this phase (can be repeated)')
+  parser.add_argument('--output', default='-',
+                      help='file to write the JSON results to (default: -)')
+  args = parser.parse_args(argv)
+
+  results = run(seed=args.seed, scale=args.scale, repeat=args.repeat,
+                number=args.number, corpora=args.corpus, phases=args.phase)
+  data = json.dumps(results, indent=2, sort_keys=True,
+                    separators=(',', ': '))
+
+  if args.output == '-':
+    sys.stdout.write(data + '\n')
+  else:
+    with open(args.output, 'w') as output:
+      output.write(data + '\n')
@@ -1,6 +1,9 @@
 """Python library for parsing HAML along with Jinja2."""
 
 from pyhaml_jinja.parser import Parser
+from pyhaml_jinja.compiler import Compiler
 from pyhaml_jinja.renderer import Renderer, render
 from pyhaml_jinja.haml_extension import HamlExtension
+from pyhaml_jinja.loader import HamlLoader
+from pyhaml_jinja.stats import TemplateStats
 
@@ -0,0 +1,137 @@
+"""Ahead-of-time compilation of templates to Python modules.
+
+compile_templates() runs every template through HamlExtension and the Jinja
+compiler, and stores the resulting Python modules in a zip file (or a
+directory), along with a manifest of the settings they were compiled with::
+
+    from pyhaml_jinja.aot import HamlModuleLoader, compile_templates
+
+    compile_templates(env, 'templates.zip')  # At build time.
+
+    env = Environment(loader=HamlModuleLoader('templates.zip'),
+                      extensions=[HamlExtension])
+
+HamlModuleLoader then imports the compiled modules directly, so neither HAML
+nor Jinja parse anything at startup. It refuses to load templates compiled
+with settings that don't match the environment's.
+"""
+
+import json
+import os
+import weakref
+import zipfile
+
+import jinja2
+from jinja2.loaders import ModuleLoader
+
+from pyhaml_jinja.haml_extension import get_haml_extension
+
+
+__all__ = ['compile_templates', 'get_settings', 'HamlModuleLoader']
+
+
+MANIFEST_NAME = 'pyhaml_jinja.json'
+
+# Environment attributes that change the code Jinja generates.
+JINJA_SETTINGS = (
+    'block_start_string', 'block_end_string', 'variable_start_string',
+    'variable_end_string', 'comment_start_string', 'comment_end_string',
+    'line_statement_prefix', 'line_comment_prefix', 'trim_blocks',
+    'lstrip_blocks', 'newline_sequence', 'keep_trailing_newline',
+    )
+
+
+def get_settings(environment):
+  """Return the settings of environment that compiled templates depend on."""
+
+  settings = dict((name, getattr(environment, name))
+                  for name in JINJA_SETTINGS)
+  settings.update({
+      'jinja2_version': jinja2.__version__,
+      'extensions': sorted(environment.extensions),
+      'haml_compact': environment.haml_compact,
+      'haml_file_extensions': list(environment.haml_file_extensions),
+      'haml_indent_string': environment.haml_indent_string,
+      'haml_newline_string': environment.haml_newline_string,
+      'haml_raw_blocks': environment.haml_raw_blocks,
+      })
+  return settings
+
+
+def compile_templates(environment, target, extensions=None, filter_func=None,
+                      zip='deflated', log_function=None, ignore_errors=False,
+                      py_compile=False):
+  """Compile the templates of environment's loader into target.
+
+  This takes the same arguments as Environment.compile_templates(), but
+  makes sure the environment uses HamlExtension, stops at the first template
+  that fails to compile unless ignore_errors is set, and writes a manifest
+  of the settings next to the modules. Returns the settings.
+  """
+
+  get_haml_extension(environment)  # Raises ValueError if missing.
+
+  if zip is None and not os.path.isdir(target):
+    os.makedirs(target)
+
+  environment.compile_templates(target, extensions=extensions,
+                                filter_func=filter_func, zip=zip,
+                                log_function=log_function,
+                                ignore_errors=ignore_errors,
+                                py_compile=py_compile)
+
+  settings = get_settings(environment)
+  data = json.dumps(settings, indent=2, sort_keys=True)
+  if zip is None:
+    with open(os.path.join(target, MANIFEST_NAME), 'w') as manifest_file:
+      manifest_file.write(data)
+  else:
+    with zipfile.ZipFile(target, 'a') as zip_file:
+      zip_file.writestr(MANIFEST_NAME, data)
+  return settings
+
+
+def read_settings(path):
+  """Return the manifest stored in a compile_templates() target."""
+
+  if os.path.isdir(path):
+    with open(os.path.join(path, MANIFEST_NAME), 'r') as manifest_file:
+      data = manifest_file.read()
+  else:
+    with zipfile.ZipFile(path, 'r') as zip_file:
+      data = zip_file.read(MANIFEST_NAME)
+  return json.loads(data)
+
+
+class HamlModuleLoader(ModuleLoader):
+  """ModuleLoader checking the templates were compiled for the environment.
+
+  The manifests of all paths are read up front; the first time a template is
+  loaded for an environment they are compared with its settings, and a
+  RuntimeError is raised if they differ.
+  """
+
+  def __init__(self, path):
+    super(HamlModuleLoader, self).__init__(path)
+    paths = [path] if isinstance(path, basestring) else list(path)
+    self.settings = [(p, read_settings(p)) for p in paths]
+    # The environments already checked, without keeping them alive.
+    self._checked = weakref.WeakSet()
+
+  def check_settings(self, environment):
+    """Raise RuntimeError if environment doesn't match the manifests."""
+
+    current = json.loads(json.dumps(get_settings(environment)))
+    for path, settings in self.settings:
+      if settings != current:
+        differences = sorted(name for name in set(settings) | set(current)
+                             if settings.get(name) != current.get(name))
+        raise RuntimeError('Templates in %s were compiled with different '
+                           'settings than this environment (%s).' % (
+                             path, ', '.join(differences)))
+
+  def load(self, environment, name, globals=None):
+    if environment not in self._checked:
+      self.check_settings(environment)
+      self._checked.add(environment)
+    return super(HamlModuleLoader, self).load(environment, name, globals)
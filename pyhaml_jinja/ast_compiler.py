@@ -0,0 +1,330 @@
+"""Compile HAML templates straight into Jinja's AST.
+
+The string pipeline renders a HAML tree into Jinja source, which Jinja then
+lexes and parses again from the start, markup and all. AstCompiler builds
+the jinja2.nodes.Template of a HAML source itself instead: the markup between
+Jinja tags goes into TemplateData nodes as it is, and Jinja's parser only
+sees the tags of JinjaNodes (with markers standing in for their bodies) and
+the pieces of text that have Jinja syntax in them.
+
+The AST is the one Jinja would parse from the rendered source, so templates
+compile to the same code. Whatever the AST can't be built for goes through
+the string pipeline instead (see supports()), as do compact templates, and
+templates with Jinja blocks opened in their text and closed somewhere else
+(where the pieces don't parse on their own).
+
+This is opt-in: HamlExtension always hands Jinja the preprocessed source,
+and only templates compiled with compile_template() (or AstCompiler.parse())
+skip it.
+"""
+
+import re
+
+from jinja2 import TemplateSyntaxError
+from jinja2 import defaults
+from jinja2 import nodes as jinja_nodes
+from jinja2.ext import Extension
+from jinja2.lexer import TokenStream
+from jinja2.parser import Parser as JinjaParser
+
+from pyhaml_jinja import nodes
+from pyhaml_jinja import token_stream
+from pyhaml_jinja.renderer import Renderer
+
+
+__all__ = ['AstCompiler', 'compile_template', 'supports']
+
+
+# Stands in for the tags of the JinjaNodes while the tree is rendered, by
+# their index in the list of tags.
+TAG_MARKER = '\x00%d\x00'
+TAG_MARKER_REGEX = re.compile(u'\x00(\\d+)\x00')
+
+# Stands in for the bodies of a chain of JinjaNodes (-if, -elif, -else) while
+# the chain's tags are parsed, followed by the newlines of the body.
+BODY_MARKER = u'\x00%d\x00'
+BODY_MARKER_REGEX = re.compile(u'^\x00(\\d+)\x00\s*$')
+
+DELIMITERS = (
+    ('block_start_string', defaults.BLOCK_START_STRING),
+    ('block_end_string', defaults.BLOCK_END_STRING),
+    ('variable_start_string', defaults.VARIABLE_START_STRING),
+    ('variable_end_string', defaults.VARIABLE_END_STRING),
+    ('comment_start_string', defaults.COMMENT_START_STRING),
+    ('comment_end_string', defaults.COMMENT_END_STRING),
+    )
+
+
+class _Fallback(Exception):
+  """Raised when a template has to go through the string pipeline."""
+
+
+def supports(environment):
+  """Return whether ASTs can be built for the templates of environment.
+
+  This takes Jinja's default delimiters, no line statements, line comments,
+  trim_blocks or lstrip_blocks, and no extensions (other than HamlExtension)
+  preprocessing sources or filtering token streams, as there is neither a
+  source nor a token stream of the whole template to give them.
+  """
+
+  from pyhaml_jinja.haml_extension import HamlExtension
+
+  if not token_stream.supports(environment) or environment.trim_blocks:
+    return False
+
+  for attribute, default in DELIMITERS:
+    if getattr(environment, attribute) != default:
+      return False
+
+  for extension in environment.iter_extensions():
+    if isinstance(extension, HamlExtension):
+      continue
+    extension_class = type(extension)
+    if (extension_class.preprocess.im_func is not
+        Extension.preprocess.im_func or
+        extension_class.filter_stream.im_func is not
+        Extension.filter_stream.im_func):
+      return False
+
+  return True
+
+
+class AstCompiler(object):
+  """Uses a Renderer's tree to build the Jinja AST of a HAML source."""
+
+  def __init__(self, source, newline_string=None, indent_string=None,
+               compact=False, raw_blocks=False):
+    # The arguments are those of Renderer. Compact templates always go
+    # through the string pipeline, as their Jinja tags strip the whitespace
+    # around them.
+    self.renderer = Renderer(source, newline_string, indent_string,
+                             compact=compact, raw_blocks=raw_blocks)
+    self.compact = compact
+
+  def render(self):
+    """Render the Jinja source the AST stands for (see Renderer.render)."""
+
+    return self.renderer.render()
+
+  def parse(self, environment, name=None, filename=None):
+    """Return the jinja2.nodes.Template for the source."""
+
+    if not self.compact and supports(environment):
+      try:
+        return self._build(environment, name, filename)
+      except (_Fallback, TemplateSyntaxError):
+        pass
+
+    # Parse the rendered source, as Jinja would without HamlExtension.
+    parser = self._get_parser(environment, name, filename)
+    parser.stream = environment.lexer.tokenize(self.render(), name, filename)
+    return parser.parse()
+
+  def _get_parser(self, environment, name, filename):
+    # The parser is made for an empty source and handed token streams later,
+    # one for every piece of the template.
+    parser = JinjaParser(environment, u'')
+    parser.name = name
+    parser.filename = filename
+    return parser
+
+  def _render_with_markers(self):
+    """Render the tree with markers for the tags of its JinjaNodes.
+
+    Returns (text, tags), where tags has a (node, tag) tuple for each marker,
+    tag being the string the marker stands in for.
+    """
+
+    jinja_nodes_found = []
+    stack = [self.renderer.parser.tree]
+    while stack:
+      node = stack.pop()
+      if isinstance(node, nodes.JinjaNode):
+        jinja_nodes_found.append(node)
+      stack.extend(node.get_children())
+
+    # Render the markers in place of the tags of the JinjaNodes.
+    tags = []
+    replacements = {}
+    for node in jinja_nodes_found:
+      if node.tag == 'raw':
+        raise _Fallback('Raw blocks are parsed as a whole.')
+
+      start, end = node.render_start(), node.render_end()
+      for tag in (start, end):
+        if tag is not None and tag.endswith('-%}'):
+          raise _Fallback('Whitespace control in a JinjaNode.')
+
+      start_marker = TAG_MARKER % len(tags)
+      tags.append((node, start))
+      end_marker = None
+      if end is not None:
+        end_marker = TAG_MARKER % len(tags)
+        tags.append((node, end))
+      replacements[node] = (start_marker, end_marker)
+
+    text = unicode(self.renderer.newline_string.join(
+        self.renderer.iter_lines(replacements=replacements)))
+    return text, tags
+
+  def _build(self, environment, name, filename):
+    if '\x00' in self.renderer.parser.source:
+      raise _Fallback('The source has NUL characters.')
+
+    text, tags = self._render_with_markers()
+    text = token_stream.normalize_newlines(
+        text, environment.keep_trailing_newline)
+    parser = self._get_parser(environment, name, filename)
+    newline_sequence = environment.newline_sequence
+
+    bodies = [[]]  # The bodies being built, innermost last.
+    chains = []  # Open chains of (node, tag, lineno) tuples, innermost last.
+    lineno = 1
+
+    for index, piece in enumerate(TAG_MARKER_REGEX.split(text)):
+      if not index % 2:
+        if piece:
+          bodies[-1].extend(
+              self._parse_text(parser, piece, lineno, newline_sequence))
+          lineno += piece.count(u'\n')
+        continue
+
+      node, tag = tags[int(piece)]
+      previous = chains[-1][-1][0] if chains else None
+
+      if isinstance(node, nodes.SelfClosingJinjaNode):
+        bodies[-1].extend(self._parse(parser, tag, lineno))
+      elif node is previous:
+        # The end tag of the chain.
+        chain = chains.pop()
+        chain_bodies = bodies[-len(chain):]
+        del bodies[-len(chain):]
+        bodies[-1].extend(
+            self._parse_chain(parser, chain, chain_bodies, tag, lineno))
+      elif (previous is not None and
+            previous is node.get_previous_sibling() and
+            node.is_extending(previous)):
+        chains[-1].append((node, tag, lineno))
+        bodies.append([])
+      else:
+        chains.append([(node, tag, lineno)])
+        bodies.append([])
+
+    if chains:
+      raise _Fallback('Unclosed JinjaNodes.')
+
+    template = jinja_nodes.Template(bodies[0], lineno=1)
+    template.set_environment(environment)
+    return template
+
+  def _parse(self, parser, source, lineno):
+    """Parse a piece of the template starting on line lineno."""
+
+    parser.stream = TokenStream(
+        token_stream.tokenize(parser.environment, source, parser.name,
+                              parser.filename, lineno, normalized=True),
+        parser.name, parser.filename)
+    return parser.subparse()
+
+  def _parse_text(self, parser, text, lineno, newline_sequence):
+    """Return the nodes for a piece of text between two tags."""
+
+    if u'{' in text and (u'{{' in text or u'{%' in text or u'{#' in text):
+      return self._parse(parser, text, lineno)
+
+    if newline_sequence != u'\n':
+      text = text.replace(u'\n', newline_sequence)
+    return [jinja_nodes.Output(
+        [jinja_nodes.TemplateData(text, lineno=lineno)], lineno=lineno)]
+
+  def _parse_chain(self, parser, chain, chain_bodies, end_tag, end_lineno):
+    """Return the nodes for a chain of JinjaNodes and their bodies."""
+
+    source = []
+    for index, (_, tag, lineno) in enumerate(chain):
+      if index + 1 < len(chain):
+        next_lineno = chain[index + 1][2]
+      else:
+        next_lineno = end_lineno
+      source.extend(
+          (tag, BODY_MARKER % index, u'\n' * (next_lineno - lineno)))
+    source.append(end_tag)
+
+    result = self._parse(parser, u''.join(source), chain[0][2])
+    if _replace_bodies(result, chain_bodies) != len(chain_bodies):
+      raise _Fallback('Bodies missing from %s.' % chain[0][1])
+    return result
+
+
+def _replace_bodies(result, bodies):
+  """Put bodies in place of the Output nodes of their markers in result.
+
+  Returns the number of markers replaced.
+  """
+
+  # Markers are statements, so expressions are never looked into.
+  replaced = 0
+  stack = list(result)
+  while stack:
+    node = stack.pop()
+    for field in node.fields:
+      value = getattr(node, field, None)
+      if isinstance(value, jinja_nodes.Stmt):
+        stack.append(value)
+      elif isinstance(value, list):
+        items = []
+        for item in value:
+          body = _get_body(item, bodies)
+          if body is not None:
+            items.extend(body)
+            replaced += 1
+          else:
+            items.append(item)
+            if isinstance(item, jinja_nodes.Stmt):
+              stack.append(item)
+        value[:] = items
+
+  return replaced
+
+
+def _get_body(node, bodies):
+  """Return the body node is the marker of, or None if it isn't one."""
+
+  if (isinstance(node, jinja_nodes.Output) and len(node.nodes) == 1 and
+      isinstance(node.nodes[0], jinja_nodes.TemplateData)):
+    match = BODY_MARKER_REGEX.match(node.nodes[0].data)
+    if match is not None:
+      return bodies[int(match.group(1))]
+  return None
+
+
+def compile_template(environment, source, name=None, filename=None,
+                     globals=None):
+  """Compile a HAML source into a template of environment through its AST.
+
+  The HAML settings of the environment (as HamlExtension sets them up) are
+  used if it has them.
+  """
+
+  try:
+    compiler = AstCompiler(
+        source,
+        newline_string=getattr(environment, 'haml_newline_string', '\n'),
+        indent_string=getattr(environment, 'haml_indent_string', '  '),
+        compact=getattr(environment, 'haml_compact', False),
+        raw_blocks=getattr(environment, 'haml_raw_blocks', False))
+  except TemplateSyntaxError, e:
+    raise TemplateSyntaxError(e.message, e.lineno, name=name,
+                              filename=filename)
+
+  try:
+    template = compiler.parse(environment, name, filename)
+  except TemplateSyntaxError:
+    # Point the traceback at the rendered source, as environment.compile()
+    # would.
+    environment.handle_exception(source=compiler.render())
+
+  code = environment.compile(template, name, filename)
+  return environment.template_class.from_code(
+      environment, code, environment.make_globals(globals))
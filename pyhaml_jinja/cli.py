@@ -0,0 +1,223 @@
+"""Command line interface, installed as the pyhaml-jinja script.
+
+    $ pyhaml-jinja compile SRC DEST [-j JOBS] [--force]
+
+compile preprocesses every HAML template under SRC into a Jinja template at
+the same relative path under DEST (with an .html extension). A manifest of
+source digests is kept in DEST, so templates that haven't changed since the
+last run are skipped.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+
+from pyhaml_jinja.errors import TemplateSyntaxError
+from pyhaml_jinja.haml_extension import HamlExtension, PreprocessCache
+
+
+MANIFEST_NAME = '.pyhaml-manifest.json'
+OUTPUT_EXTENSION = '.html'
+
+
+def find_templates(source_dir, file_extensions=HamlExtension.FILE_EXTENSIONS):
+  """Return the sorted paths (relative to source_dir) of all HAML files."""
+
+  paths = []
+  for directory, _, filenames in os.walk(source_dir):
+    for filename in filenames:
+      if os.path.splitext(filename)[1] in file_extensions:
+        path = os.path.join(directory, filename)
+        paths.append(os.path.relpath(path, source_dir))
+  return sorted(paths)
+
+
+def get_output_path(path):
+  """Return the output path for a template path."""
+  return os.path.splitext(path)[0] + OUTPUT_EXTENSION
+
+
+def remove_output(output_path):
+  """Remove the output of an older version of a template, if any."""
+
+  if os.path.isfile(output_path):
+    os.remove(output_path)
+
+
+def load_manifest(dest_dir):
+  """Return the manifest in dest_dir as a dict of path -> digest."""
+
+  try:
+    with open(os.path.join(dest_dir, MANIFEST_NAME), 'r') as manifest_file:
+      return json.load(manifest_file)
+  except (IOError, ValueError):
+    return {}
+
+
+def save_manifest(dest_dir, manifest):
+  """Write the manifest to dest_dir."""
+
+  path = os.path.join(dest_dir, MANIFEST_NAME)
+  temp_path = '%s.%d.tmp' % (path, os.getpid())
+  with open(temp_path, 'w') as manifest_file:
+    json.dump(manifest, manifest_file, indent=0, sort_keys=True)
+  os.rename(temp_path, path)
+
+
+def compile_template(job):
+  """Compile a single template.
+
+  job is a (source_path, source, output_path, indent_string,
+  newline_string, compact, raw_blocks) tuple, source being the contents of
+  source_path; returns an error message, or None on success. A template that
+  fails (to compile, to decode or to be written) has its previous output
+  removed. This runs in the worker processes, so everything going in and out
+  has to be picklable.
+  """
+
+  (source_path, source, output_path, indent_string, newline_string, compact,
+   raw_blocks) = job
+
+  try:
+    output = HamlExtension.DEFAULT_RENDERER_CLASS(source.decode('utf-8'),
+        indent_string=indent_string,
+        newline_string=newline_string, compact=compact,
+        raw_blocks=raw_blocks).render()
+  except TemplateSyntaxError, e:
+    remove_output(output_path)
+    return '%s:%s: %s' % (source_path, e.lineno, e.message)
+  except UnicodeDecodeError, e:
+    remove_output(output_path)
+    return '%s:%s: %s' % (source_path, source.count('\n', 0, e.start) + 1, e)
+
+  try:
+    output_dir = os.path.dirname(output_path)
+    if output_dir and not os.path.isdir(output_dir):
+      try:
+        os.makedirs(output_dir)
+      except OSError:
+        if not os.path.isdir(output_dir):  # Unless another worker made it.
+          raise
+
+    with open(output_path, 'wb') as output_file:
+      output_file.write(output.encode('utf-8'))
+  except EnvironmentError, e:
+    remove_output(output_path)
+    return '%s: %s' % (output_path, e.strerror or e)
+  return None
+
+
+def compile_directory(source_dir, dest_dir, jobs=None, force=False,
+                      indent_string=HamlExtension.DEFAULT_INDENT_STRING,
+                      newline_string=HamlExtension.DEFAULT_NEWLINE_STRING,
+                      compact=HamlExtension.DEFAULT_COMPACT,
+                      raw_blocks=HamlExtension.DEFAULT_RAW_BLOCKS):
+  """Compile all templates in source_dir into dest_dir.
+
+  Returns a (compiled, skipped, errors) tuple, with the lists of compiled and
+  skipped template paths and the list of error messages.
+  """
+
+  old_manifest = load_manifest(dest_dir)
+  manifest = {}
+  pending = []
+  skipped = []
+  errors = []
+
+  paths = find_templates(source_dir)
+  for path in paths:
+    output_path = os.path.join(dest_dir, get_output_path(path))
+    try:
+      with open(os.path.join(source_dir, path), 'rb') as source_file:
+        source = source_file.read()
+    except EnvironmentError, e:
+      remove_output(output_path)
+      errors.append('%s: %s' % (os.path.join(source_dir, path),
+                                e.strerror or e))
+      continue
+    digest = PreprocessCache.make_key(source, indent_string, newline_string,
+                                      compact=compact, raw_blocks=raw_blocks)
+
+    if (not force and old_manifest.get(path) == digest and
+        os.path.exists(output_path)):
+      manifest[path] = digest
+      skipped.append(path)
+    else:
+      pending.append((path, source, digest, output_path))
+
+  job_list = [(os.path.join(source_dir, path), source, output_path,
+               indent_string, newline_string, compact, raw_blocks)
+              for path, source, _, output_path in pending]
+  if jobs == 1 or len(job_list) < 2:
+    results = map(compile_template, job_list)
+  else:
+    pool = multiprocessing.Pool(jobs)
+    try:
+      results = pool.map(compile_template, job_list, chunksize=8)
+    finally:
+      pool.close()
+      pool.join()
+
+  compiled = []
+  for (path, _, digest, _), error in zip(pending, results):
+    if error is None:
+      manifest[path] = digest
+      compiled.append(path)
+    else:
+      errors.append(error)
+
+  # Remove the output of templates that have gone away since the last run.
+  for path in set(old_manifest) - set(paths):
+    remove_output(os.path.join(dest_dir, get_output_path(path)))
+
+  if not os.path.isdir(dest_dir):
+    os.makedirs(dest_dir)
+  save_manifest(dest_dir, manifest)
+  return compiled, skipped, errors
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(prog='pyhaml-jinja',
+                                   description='HAML tools for Jinja2.')
+  subparsers = parser.add_subparsers(dest='command')
+
+  compile_parser = subparsers.add_parser(
+      'compile', help='preprocess a directory of HAML templates')
+  compile_parser.add_argument('source', metavar='SRC',
+                              help='directory containing the HAML templates')
+  compile_parser.add_argument('dest', metavar='DEST',
+                              help='directory to write the Jinja templates to')
+  compile_parser.add_argument('-j', '--jobs', type=int, default=None,
+                              help='number of worker processes (default: one '
+                                   'per CPU)')
+  compile_parser.add_argument('-f', '--force', action='store_true',
+                              help='recompile templates even if unchanged')
+  compile_parser.add_argument('--compact', action='store_true',
+                              help='leave out insignificant whitespace')
+  compile_parser.add_argument('--raw-blocks', action='store_const',
+                              const=True, default=False,
+                              help='pass custom block bodies through as they '
+                                   'are')
+  compile_parser.add_argument('--jinja-raw-blocks', action='store_const',
+                              const='jinja', dest='raw_blocks',
+                              help='like --raw-blocks, and wrap them in '
+                                   '{%% raw %%}')
+
+  args = parser.parse_args(argv)
+
+  compiled, skipped, errors = compile_directory(args.source, args.dest,
+                                                jobs=args.jobs,
+                                                force=args.force,
+                                                compact=args.compact,
+                                                raw_blocks=args.raw_blocks)
+  for error in errors:
+    sys.stderr.write(error + '\n')
+  sys.stdout.write('%d compiled, %d unchanged, %d failed.\n' % (
+      len(compiled), len(skipped), len(errors)))
+  return 1 if errors else 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
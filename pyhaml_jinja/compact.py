@@ -0,0 +1,187 @@
+"""Compact output: no indentation, and no whitespace that doesn't matter.
+
+In compact mode the renderers produce pieces of output rather than lines.
+A piece is a (left, text, right) tuple, where left and right say how the
+text joins the pieces next to it:
+
+- SPACE: a single space, like the whitespace between two words.
+- GLUE: nothing at all, as around block-level tags.
+- NEWLINE: a line break, for text whose whitespace matters (preformatted
+  text and the contents of :javascript, :css and :plain blocks).
+- JINJA: marks a Jinja tag, which takes its whitespace from the pieces
+  around it instead.
+
+The stronger of the two sides wins (NEWLINE over GLUE over SPACE). Jinja tags
+output nothing themselves, so they get the whitespace the piece before them
+needs on their left, and the one the piece after them needs on their right
+(just once if both sides need the same). Sides that need nothing are trimmed
+with whitespace control ({%- ... -%}). Whitespace inside text is collapsed to
+single spaces, except within Jinja syntax.
+"""
+
+import re
+
+from pyhaml_jinja import nodes
+
+
+__all__ = ['SPACE', 'GLUE', 'NEWLINE', 'JINJA', 'get_piece',
+           'iter_raw_pieces', 'iter_node_pieces', 'iter_output']
+
+
+SPACE = 0
+GLUE = 1
+NEWLINE = 2
+JINJA = 3
+
+# Tags whose surrounding whitespace doesn't change how a page renders.
+BLOCK_TAGS = frozenset([
+    'address', 'article', 'aside', 'blockquote', 'body', 'br', 'caption',
+    'col', 'colgroup', 'dd', 'details', 'dialog', 'div', 'dl', 'dt',
+    'fieldset', 'figcaption', 'figure', 'footer', 'form', 'h1', 'h2', 'h3',
+    'h4', 'h5', 'h6', 'head', 'header', 'hgroup', 'hr', 'html', 'legend',
+    'li', 'link', 'main', 'meta', 'nav', 'noscript', 'ol', 'optgroup',
+    'option', 'p', 'pre', 'script', 'section', 'select', 'style', 'summary',
+    'table', 'tbody', 'td', 'tfoot', 'th', 'thead', 'title', 'tr', 'ul',
+    ])
+
+JINJA_SYNTAX_REGEX = re.compile(r'(\{\{.*?\}\}|\{%.*?%\}|\{#.*?#\})')
+WHITESPACE_REGEX = re.compile(r'\s+')
+
+
+def collapse_whitespace(text):
+  """Collapse runs of whitespace in text, leaving Jinja syntax alone."""
+
+  parts = JINJA_SYNTAX_REGEX.split(text)
+  parts[0::2] = [WHITESPACE_REGEX.sub(' ', part) for part in parts[0::2]]
+  return ''.join(parts)
+
+
+def trim_jinja_tag(text, left=True, right=True):
+  """Turn '{% tag %}' into '{%- tag -%}' (or trim just one side)."""
+
+  if left:
+    text = '{%-' + text[2:]
+  if right:
+    text = text[:-2] + '-%}'
+  return text
+
+
+def get_piece(node_class, text, end=False, tag=None, raw=False):
+  """Return the compact piece for the start (or end) string of a node.
+
+  tag is the tag name of HTML nodes, and raw says whether the node is inside
+  a custom block. Returns None if there's nothing to output.
+  """
+
+  if not text:
+    return None
+
+  if raw or issubclass(node_class, nodes.PreformattedTextNode):
+    return NEWLINE, text, NEWLINE
+
+  if issubclass(node_class, nodes.HtmlNode):
+    if tag in BLOCK_TAGS:
+      return GLUE, text, GLUE
+    elif issubclass(node_class, nodes.SelfClosingHtmlNode):
+      return SPACE, text, SPACE
+    elif end:
+      return GLUE, text, SPACE
+    return SPACE, text, GLUE
+
+  if issubclass(node_class, nodes.JinjaNode):
+    return JINJA, text, JINJA
+
+  if issubclass(node_class, nodes.CustomBlockNode):
+    return GLUE, text, GLUE
+
+  if (issubclass(node_class, nodes.TextNode) and
+      not issubclass(node_class, nodes.HtmlCommentNode)):
+    text = collapse_whitespace(text)
+
+  return SPACE, text, SPACE
+
+
+def iter_raw_pieces(text):
+  """Yield the pieces of the multiline text of a RawTextNode."""
+
+  for line in text.split('\n'):
+    yield NEWLINE, line, NEWLINE
+
+
+def iter_node_pieces(root):
+  """Yield the compact pieces of a tree of nodes."""
+
+  # Nodes to open as (node, raw, None), or ends to emit as (None, _, piece).
+  stack = [(child, False, None) for child in reversed(root.get_children())]
+
+  while stack:
+    node, raw, end = stack.pop()
+    if node is None:
+      yield end
+      continue
+
+    if node.multiline:
+      for piece in iter_raw_pieces(node.render_start()):
+        yield piece
+      continue
+
+    node_class = type(node)
+    tag = getattr(node, 'tag', None)
+    children = node.get_children()
+
+    start = get_piece(node_class, node.render_start(), tag=tag, raw=raw)
+    if start is not None:
+      # Preformatted text right after an opening tag is part of its start.
+      if (isinstance(node, nodes.HtmlNode) and children and
+          isinstance(children[0], nodes.PreformattedTextNode)):
+        start = start[:2] + (NEWLINE, )
+      yield start
+
+    end = get_piece(node_class, node.render_end(), end=True, tag=tag, raw=raw)
+    if end is not None:
+      stack.append((None, raw, end))
+
+    raw = raw or isinstance(node, nodes.CustomBlockNode)
+    stack.extend((child, raw, None) for child in reversed(children))
+
+
+def iter_output(pieces, newline_string=None):
+  """Join compact pieces, yielding the strings to output in turn."""
+
+  separators = {SPACE: ' ', GLUE: '', NEWLINE: newline_string or '\n'}
+  # The right side of the last piece that isn't a Jinja tag.
+  right = None
+  # The last of a run of Jinja tags, held back until we know what follows,
+  # and the whitespace output before the run (None if its left is trimmed).
+  tag = spaced = None
+
+  for left, text, next_right in pieces:
+    if left == JINJA:
+      if tag is not None:
+        yield tag
+      elif right is None or right == GLUE:
+        text = trim_jinja_tag(text, right=False)
+      else:
+        yield separators[right]
+        spaced = right
+      tag = text
+      continue
+
+    if tag is not None:
+      if left == GLUE:
+        yield trim_jinja_tag(tag, left=False)
+      else:
+        yield tag
+        if spaced is None or left > spaced:
+          yield separators[left]
+      tag = spaced = None
+    elif right is not None:
+      separator = separators[max(left, right)]
+      if separator:
+        yield separator
+
+    yield text
+    right = next_right
+
+  if tag is not None:
+    yield trim_jinja_tag(tag, left=False)
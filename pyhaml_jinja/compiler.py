@@ -0,0 +1,416 @@
+"""Single-pass HAML compiler that never builds a Node tree."""
+
+from pyhaml_jinja import compact as compact_output
+from pyhaml_jinja.errors import TemplateSyntaxError
+from pyhaml_jinja.parser import Parser
+from pyhaml_jinja import nodes
+from pyhaml_jinja.nodes.node import _Condenser, _condense
+from pyhaml_jinja.static import is_static_string
+
+
+class _Frame(object):
+  """An open node on the compiler's stack.
+
+  Frames hold just enough about a node to emit its closing line: they are
+  created while the node's line is scanned and dropped once it is closed.
+  """
+
+  __slots__ = ('node_class', 'depth', 'out_index', 'end', 'condensed',
+               'is_html', 'jinja_tag', 'chain_tag', 'in_custom_block',
+               'children_allowed', 'has_children', 'static', 'node_count',
+               'static_node_count', 'static_size', 'size_mark')
+
+  def __init__(self, node_class, depth, in_custom_block):
+    self.node_class = node_class
+    self.depth = depth
+    self.out_index = 0
+    self.end = None
+    self.condensed = False
+    self.is_html = False
+    self.jinja_tag = None  # Only set for Jinja tags that need closing.
+    self.chain_tag = None
+    self.in_custom_block = in_custom_block
+    self.children_allowed = not issubclass(node_class, nodes.ChildlessNode)
+    self.has_children = False
+    # Whether the subtree is static (see pyhaml_jinja.static), the number of
+    # nodes in it, and the node count and size of its static subtrees.
+    self.static = True
+    self.node_count = 1
+    self.static_node_count = 0
+    self.static_size = 0
+    self.size_mark = 0  # _Output.get_size() when the frame was opened.
+
+
+class _Output(object):
+  """The output lines of Compiler, condensed as they come in.
+
+  Lines go through a _Condenser for every condensed frame that is open,
+  innermost first, as in Node.render_lines(). With newline_length given,
+  sizes[level] adds up the size of the lines that came out of the condenser
+  at level (or went into the innermost one), newline included, so a subtree
+  knows the size of its own lines however its ancestors condense them.
+
+  append(line) adds the next line of output. It is the append method of
+  lines itself for as long as there is nothing else to do.
+  """
+
+  __slots__ = ('lines', 'condensers', 'sizes', 'newline_length', 'append')
+
+  def __init__(self, newline_length=None):
+    self.lines = []
+    self.condensers = []
+    self.newline_length = newline_length
+    self.sizes = None if newline_length is None else [0]
+    self._set_append()
+
+  def _set_append(self):
+    if self.condensers or self.sizes is not None:
+      self.append = self._append
+    else:
+      self.append = self.lines.append
+
+  def _append(self, line):
+    condensers, sizes = self.condensers, self.sizes
+    if sizes is not None:
+      level = len(condensers)
+      sizes[level] += len(line) + self.newline_length
+      while level:
+        level -= 1
+        line = condensers[level].feed(line)
+        if line is None:
+          return
+        sizes[level] += len(line) + self.newline_length
+    elif condensers:
+      line = _condense(condensers, line)
+      if line is None:
+        return
+    self.lines.append(line)
+
+  def extend(self, lines):
+    for line in lines:
+      self.append(line)
+
+  def append_to_last(self, text):
+    """Add text to the end of the last line, wherever it is held back.
+
+    The sizes aren't updated, as this is only done for preformatted text,
+    whose ancestors are never static.
+    """
+
+    for condenser in reversed(self.condensers):
+      if condenser.last is not None:
+        condenser.last += text
+        return
+      if condenser.held is not None:
+        condenser.held += text
+        return
+    self.lines[-1] += text
+
+  def open_condensed(self):
+    """Condense the lines from now on until close_condensed() is called."""
+
+    self.condensers.append(_Condenser())
+    if self.sizes is not None and len(self.sizes) == len(self.condensers):
+      self.sizes.append(0)
+    self._set_append()
+
+  def close_condensed(self):
+    line = self.condensers.pop().finish()
+    self._set_append()
+    if line is not None:
+      self.append(line)
+
+  def get_size(self):
+    """Return the size of the lines that came out at the current level."""
+
+    return self.sizes[len(self.condensers)]
+
+
+class Compiler(object):
+  """Turns HAML source into Jinja source in a single pass.
+
+  This produces exactly the same output as Renderer, but rather than building
+  a tree of nodes and then walking it, lines are emitted while the source is
+  scanned; only a stack of the currently open tags is kept around.
+  """
+
+  def __init__(self, source, newline_string=None, indent_string=None,
+               stats=None, compact=False, raw_blocks=False):
+    self.source = source
+    self.newline_string = newline_string or ''
+    self.indent_string = indent_string or ''
+    # stats is an optional pyhaml_jinja.stats.TemplateStats. There is no
+    # tree to build, so only the 'lines' and 'render' phases are timed; the
+    # static subtrees are measured while rendering (except in compact mode).
+    self.stats = stats
+    # With compact=True, lines holds compact pieces (see Renderer).
+    self.compact = compact
+
+    if stats is None:
+      self.lines = self.compile_lines(source, self.indent_string,
+                                      compact=compact, raw_blocks=raw_blocks)
+    else:
+      with stats.phase(stats.LINES):
+        source_lines = Parser.index_source_lines(source,
+                                                  raw_blocks=raw_blocks)
+      with stats.phase(stats.RENDER):
+        self.lines = self.compile_lines(source, self.indent_string,
+                                        source_lines=source_lines,
+                                        stats=stats, compact=compact,
+                                        newline_string=self.newline_string)
+
+  def render(self):
+    """Returns the compiled source as a string."""
+
+    if self.stats is None:
+      return self._render()
+
+    with self.stats.phase(self.stats.RENDER):
+      output = self._render()
+    self.stats.output_size = len(output)
+    return output
+
+  def _render(self):
+    if self.compact:
+      return ''.join(compact_output.iter_output(self.lines,
+                                                self.newline_string))
+    return self.newline_string.join(self.lines)
+
+  @classmethod
+  def compile_lines(cls, source_text, indent_string=None, source_lines=None,
+                    stats=None, compact=False, raw_blocks=False,
+                    newline_string=None):
+    """Given HAML source text, return the list of output lines.
+
+    source_lines can be passed in if Parser.index_source_lines() was already
+    called (raw_blocks is passed on to it otherwise). If stats is given, its
+    node_count is set, and so are its static_node_count and static_size
+    (measured with newline_string after every line) unless compact is set.
+    With compact=True the list holds compact pieces instead (see
+    pyhaml_jinja.compact).
+    """
+
+    indent_string = indent_string or ''
+    if source_lines is None:
+      source_lines = Parser.index_source_lines(source_text,
+                                               raw_blocks=raw_blocks)
+    node_count = 0
+
+    # Static subtrees are measured as their frames are closed, with a
+    # newline after every line (see static.measure_static_subtrees).
+    measure_static = stats is not None and not compact
+    if compact:
+      out = []
+    else:
+      out = _Output(len(newline_string or '') if measure_static else None)
+    root = _Frame(nodes.Node, -1, False)
+    # One entry per source line that is still open, holding the frames of
+    # the line's nested nodes from outermost to innermost.
+    stack = [[root]]
+
+    for line_number, line, level in Parser.iter_line_levels(source_lines):
+
+      # Close lines until our previous sibling (if any) is on top.
+      while len(stack) > level + 2:
+        frames = stack.pop()
+        cls._close_frames(frames, stack[-1][-1], None, out, indent_string,
+                          compact, measure_static)
+
+      previous_sibling = None
+      if len(stack) == level + 2:
+        previous_sibling = stack.pop()
+
+      parent = stack[-1][-1]
+
+      try:
+        description = Parser.describe_source_line(line,
+                                                  parent.in_custom_block)
+      except Exception, exception:
+        raise TemplateSyntaxError(exception.message, line_number)
+
+      # If children aren't allowed and we're indenting, throw an error.
+      if not parent.children_allowed:
+        raise TemplateSyntaxError(
+            'Node of type %s cannot have children.' % parent.node_class,
+            line_number)
+
+      # Now that we know who comes next, close the previous sibling.
+      if previous_sibling is not None:
+        cls._close_frames(previous_sibling, parent, description[0], out,
+                          indent_string, compact, measure_static)
+
+      frames = []
+      for element in description:
+        try:
+          frame = cls._open_frame(element, parent, previous_sibling, out,
+                                  indent_string, compact, measure_static)
+        except KeyError, exception:
+          raise TemplateSyntaxError(exception.message, line_number)
+        frames.append(frame)
+        parent, previous_sibling = frame, None
+      stack.append(frames)
+      node_count += len(frames)
+
+    while len(stack) > 1:
+      frames = stack.pop()
+      cls._close_frames(frames, stack[-1][-1], None, out, indent_string,
+                        compact, measure_static)
+
+    if stats is not None:
+      stats.node_count = node_count
+      if measure_static:
+        stats.static_node_count = root.static_node_count
+        stats.static_size = root.static_size
+    return out if compact else out.lines
+
+  @classmethod
+  def _open_frame(cls, element, parent, previous_sibling, out, indent_string,
+                  compact=False, measure_static=False):
+    """Emit the opening line for element and return its frame.
+
+    out is a list of compact pieces with compact set, and an _Output
+    otherwise. With measure_static, the frame finds out whether its node is
+    static.
+    """
+
+    node_class, args, attribute_pairs = element
+    frame = _Frame(node_class, parent.depth + 1,
+                   parent.in_custom_block or
+                   issubclass(node_class, nodes.CustomBlockNode))
+    first_child = not parent.has_children
+    parent.has_children = True
+    start = tag = None
+    if measure_static:
+      frame.size_mark = out.get_size()
+
+    if issubclass(node_class, nodes.HtmlNode):
+      tag, _, frame.condensed = args
+      attributes = {}
+      for key, value in attribute_pairs:
+        node_class.merge_attribute(attributes, key, value, tag)
+      start = ' '.join([tag, node_class._render_attributes(attributes)])
+      if issubclass(node_class, nodes.SelfClosingHtmlNode):
+        start = '<%s />' % start.strip()
+      else:
+        start = '<%s>' % start.strip()
+        frame.end = '</%s>' % tag
+        frame.is_html = True
+
+    elif issubclass(node_class, nodes.JinjaNode):
+      tag, data = args
+      start = '{%% %s %%}' % ' '.join([tag, data or '']).strip()
+      if not issubclass(node_class, nodes.SelfClosingJinjaNode):
+        frame.jinja_tag = frame.chain_tag = tag
+
+        # If we are extending our previous sibling (-else after -if), we
+        # close with the tag that started the chain.
+        previous = previous_sibling and previous_sibling[0]
+        if (previous is not None and previous.jinja_tag and
+            tag in node_class.EXTENDING_TAGS.get(previous.jinja_tag, [])):
+          frame.chain_tag = previous.chain_tag
+
+    elif issubclass(node_class, nodes.CustomBlockNode):
+      start, frame.end = node_class.BLOCK_TYPES[args[0]]
+
+    elif issubclass(node_class, nodes.HtmlCommentNode):
+      start = '<!-- %s -->' % args[0].strip()
+
+    elif issubclass(node_class, nodes.PreformattedTextNode):
+      frame.static = False
+      # Special case if we are the first child of an HtmlNode: the text goes
+      # right after the opening tag.
+      if parent.is_html and first_child:
+        if compact:
+          left, text, _ = out[parent.out_index]
+          out[parent.out_index] = (left, text + args[0], compact_output.NEWLINE)
+        else:
+          out.append_to_last(args[0])
+      elif compact:
+        # Empty lines have no piece (see compact.iter_node_pieces).
+        piece = compact_output.get_piece(node_class, args[0])
+        if piece is not None:
+          out.append(piece)
+      else:
+        out.append(args[0])
+      return frame
+
+    elif issubclass(node_class, nodes.RawTextNode):
+      if measure_static:
+        frame.static = is_static_string(args[0])
+      if compact:
+        out.extend(compact_output.iter_raw_pieces(args[0]))
+      else:
+        indent = frame.depth * indent_string
+        out.extend(indent + part if part else part
+                   for part in args[0].split('\n'))
+      return frame
+
+    elif issubclass(node_class, nodes.TextNode):
+      start = args[0]
+
+    if measure_static:
+      frame.static = (is_static_string(start) and
+                      is_static_string(frame.end))
+    if compact:
+      frame.out_index = len(out)
+      start = compact_output.get_piece(node_class, start, tag=tag,
+                                       raw=parent.in_custom_block)
+      frame.end = compact_output.get_piece(node_class, frame.end, end=True,
+                                           tag=tag)
+      if start is not None:
+        out.append(start)
+    else:
+      if frame.condensed:
+        out.open_condensed()
+      if start is not None:
+        out.append(frame.depth * indent_string + start)
+    return frame
+
+  @classmethod
+  def _close_frames(cls, frames, parent, next_sibling, out, indent_string,
+                    compact=False, measure_static=False):
+    """Emit the closing lines for the nodes opened by a single line.
+
+    parent is the frame enclosing the outermost frame, and next_sibling the
+    description element of the node following it, if there is one. Static
+    subtrees are measured if measure_static is set.
+    """
+
+    for position in xrange(len(frames) - 1, -1, -1):
+      frame = frames[position]
+      end = frame.end
+      if frame.jinja_tag:
+        end = '{%% end%s %%}' % frame.chain_tag
+
+        # If our next sibling is extending us, don't add an end tag.
+        if next_sibling is not None and frame is frames[0]:
+          node_class, args, _ = next_sibling
+          if (issubclass(node_class, nodes.JinjaNode) and
+              not issubclass(node_class, nodes.SelfClosingJinjaNode) and
+              args[0] in node_class.EXTENDING_TAGS.get(frame.jinja_tag, [])):
+            end = None
+
+        if compact:
+          end = compact_output.get_piece(frame.node_class, end, end=True)
+
+      if compact:
+        # Compact output has no whitespace left for tags to condense.
+        if end is not None:
+          out.append(end)
+        continue
+
+      if end is not None:
+        out.append(frame.depth * indent_string + end)
+
+      if frame.condensed:
+        out.close_condensed()
+
+      if measure_static:
+        if frame.static:
+          frame.static_node_count = frame.node_count
+          frame.static_size = out.get_size() - frame.size_mark
+        owner = frames[position - 1] if position else parent
+        owner.node_count += frame.node_count
+        owner.static = owner.static and frame.static
+        owner.static_node_count += frame.static_node_count
+        owner.static_size += frame.static_size
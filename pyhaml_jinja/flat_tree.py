@@ -0,0 +1,364 @@
+"""Array-backed representation of a parsed template."""
+
+import array
+import json
+import struct
+
+from pyhaml_jinja import compact, nodes
+from pyhaml_jinja.nodes.node import _Condenser, _condense
+
+
+__all__ = ['FlatTree']
+
+
+class FlatTree(object):
+  """A parsed template stored as parallel arrays rather than Node objects.
+
+  Every node is an index into the arrays below; index 0 is the root. Links
+  between nodes are indices as well (-1 meaning "none"), and all text lives
+  in a de-duplicated string table which nodes refer to by offset:
+
+  - kinds: one of the kind constants below.
+  - parents, first_children, next_siblings: the tree structure.
+  - chains: for Jinja tags, the node starting their -if/-elif/-else chain.
+  - condensed: 1 for condensed HTML tags.
+  - texts: tag name, text, or custom block type.
+  - extras: the attribute string of HTML tags, or the data of Jinja tags.
+
+  This keeps per-node overhead to a few bytes, traversal doesn't need any
+  recursion, and the whole thing serializes trivially (see to_bytes()).
+  """
+
+  # Node kinds, ordered so that subclasses come before their parents.
+  ROOT = 0
+  EMPTY = 1
+  SELF_CLOSING_HTML = 2
+  HTML = 3
+  SELF_CLOSING_JINJA = 4
+  JINJA = 5
+  CUSTOM_BLOCK = 6
+  COMMENT = 7
+  PREFORMATTED = 8
+  RAW_TEXT = 9
+  TEXT = 10
+
+  KIND_CLASSES = (
+      nodes.Node,
+      nodes.EmptyNode,
+      nodes.SelfClosingHtmlNode,
+      nodes.HtmlNode,
+      nodes.SelfClosingJinjaNode,
+      nodes.JinjaNode,
+      nodes.CustomBlockNode,
+      nodes.HtmlCommentNode,
+      nodes.PreformattedTextNode,
+      nodes.RawTextNode,
+      nodes.TextNode,
+      )
+
+  CHILDLESS_KINDS = frozenset([SELF_CLOSING_HTML, COMMENT, RAW_TEXT])
+
+  _ARRAYS = ('kinds', 'parents', 'first_children', 'next_siblings', 'chains',
+             'condensed', 'texts', 'extras')
+  _HEADER = struct.Struct('<II')  # Node count, string table length.
+
+  def __init__(self):
+    self.kinds = array.array('b', [self.ROOT])
+    self.parents = array.array('i', [-1])
+    self.first_children = array.array('i', [-1])
+    self.next_siblings = array.array('i', [-1])
+    self.chains = array.array('i', [-1])
+    self.condensed = array.array('b', [0])
+    self.texts = array.array('i', [-1])
+    self.extras = array.array('i', [-1])
+    self.strings = []
+
+    self._string_offsets = {}
+    self._last_children = {}  # Only needed while the tree is being built.
+
+  def __len__(self):
+    return len(self.kinds)
+
+  @classmethod
+  def kind_of(cls, node_class):
+    """Return the kind constant for a node class."""
+    for kind, kind_class in enumerate(cls.KIND_CLASSES):
+      if issubclass(node_class, kind_class) and kind != cls.ROOT:
+        return kind
+    return cls.EMPTY
+
+  def add_string(self, value):
+    """Add value to the string table, returning its offset."""
+    offset = self._string_offsets.get(value)
+    if offset is None:
+      offset = self._string_offsets[value] = len(self.strings)
+      self.strings.append(value)
+    return offset
+
+  def add_node(self, parent, kind, text=None, extra=None, condensed=False):
+    """Append a node as the last child of parent, returning its index."""
+
+    index = len(self.kinds)
+    self.kinds.append(kind)
+    self.parents.append(parent)
+    self.first_children.append(-1)
+    self.next_siblings.append(-1)
+    self.chains.append(index)
+    self.condensed.append(1 if condensed else 0)
+    self.texts.append(-1 if text is None else self.add_string(text))
+    self.extras.append(-1 if extra is None else self.add_string(extra))
+
+    previous = self._last_children.get(parent)
+    if previous is None:
+      self.first_children[parent] = index
+    else:
+      self.next_siblings[previous] = index
+
+      # Jinja tags extending their previous sibling (-else after -if) share
+      # the chain of that sibling.
+      if (kind == self.JINJA and self.kinds[previous] == self.JINJA and
+          self.strings[self.texts[index]] in nodes.JinjaNode.EXTENDING_TAGS.get(
+              self.strings[self.texts[previous]], [])):
+        self.chains[index] = self.chains[previous]
+    self._last_children[parent] = index
+
+    return index
+
+  def add_description(self, parent, description):
+    """Add the nodes of a Parser.describe_line() description under parent.
+
+    Returns the index of the innermost node.
+    """
+
+    for node_class, args, attribute_pairs in description:
+      kind = self.kind_of(node_class)
+      if kind in (self.HTML, self.SELF_CLOSING_HTML):
+        tag, _, condensed = args
+        attributes = {}
+        for key, value in attribute_pairs:
+          node_class.merge_attribute(attributes, key, value, tag)
+        parent = self.add_node(parent, kind, tag,
+                               node_class._render_attributes(attributes),
+                               condensed)
+      elif kind in (self.JINJA, self.SELF_CLOSING_JINJA):
+        parent = self.add_node(parent, kind, args[0], args[1] or '')
+      elif kind == self.EMPTY:
+        parent = self.add_node(parent, kind)
+      else:
+        parent = self.add_node(parent, kind, args[0])
+    return parent
+
+  def iter_children(self, index):
+    """Yield the indices of the children of a node."""
+    child = self.first_children[index]
+    while child != -1:
+      yield child
+      child = self.next_siblings[child]
+
+  def render_start(self, index):
+    """Render the opening string of a node, as Node.render_start does."""
+
+    kind = self.kinds[index]
+    text = self.strings[self.texts[index]] if self.texts[index] != -1 else None
+
+    if kind == self.HTML or kind == self.SELF_CLOSING_HTML:
+      start = ' '.join([text, self.strings[self.extras[index]]]).strip()
+      if kind == self.SELF_CLOSING_HTML:
+        return '<%s />' % start
+
+      start = '<%s>' % start
+
+      # Special case for our first child being preformatted text.
+      first_child = self.first_children[index]
+      if first_child != -1 and self.kinds[first_child] == self.PREFORMATTED:
+        start += self.strings[self.texts[first_child]]
+      return start
+
+    elif kind == self.JINJA or kind == self.SELF_CLOSING_JINJA:
+      return '{%% %s %%}' % ' '.join(
+          [text, self.strings[self.extras[index]]]).strip()
+
+    elif kind == self.CUSTOM_BLOCK:
+      return nodes.CustomBlockNode.BLOCK_TYPES[text][0]
+
+    elif kind == self.COMMENT:
+      return '<!-- %s -->' % text.strip()
+
+    elif kind == self.PREFORMATTED:
+      # The parent has already taken care of rendering us.
+      parent = self.parents[index]
+      if (self.kinds[parent] == self.HTML and
+          self.first_children[parent] == index):
+        return None
+      return text
+
+    elif kind == self.TEXT or kind == self.RAW_TEXT:
+      return text
+
+    return None
+
+  def render_end(self, index):
+    """Render the closing string of a node, as Node.render_end does."""
+
+    kind = self.kinds[index]
+
+    if kind == self.HTML:
+      return '</%s>' % self.strings[self.texts[index]]
+
+    elif kind == self.JINJA:
+      # If our next sibling is extending us, don't return an end tag.
+      next_sibling = self.next_siblings[index]
+      if next_sibling != -1 and self.chains[next_sibling] == self.chains[index]:
+        return None
+      return '{%% end%s %%}' % self.strings[self.texts[self.chains[index]]]
+
+    elif kind == self.CUSTOM_BLOCK:
+      return nodes.CustomBlockNode.BLOCK_TYPES[
+          self.strings[self.texts[index]]][1]
+
+    return None
+
+  def render_lines(self, indent_string=None, indent_level=-1):
+    """Render the tree, returning a list of lines."""
+
+    indent_string = indent_string or ''
+    kinds, condensed = self.kinds, self.condensed
+    first_children, next_siblings = self.first_children, self.next_siblings
+    lines = []
+
+    # Open nodes, as (index, depth).
+    stack = []
+    # A _Condenser for every condensed node that is open (see Node).
+    condensers = []
+    index, depth = 0, indent_level
+
+    while True:
+      # Open the current node.
+      start = self.render_start(index)
+      stack.append((index, depth))
+      if condensed[index]:
+        condensers.append(_Condenser())
+      if start is not None:
+        if kinds[index] == self.PREFORMATTED:
+          new_lines = (start, )
+        elif kinds[index] == self.RAW_TEXT:
+          indent = depth * indent_string
+          new_lines = [indent + part if part else part
+                       for part in start.split('\n')]
+        else:
+          new_lines = (depth * indent_string + start, )
+        if condensers:
+          for line in new_lines:
+            line = _condense(condensers, line)
+            if line is not None:
+              lines.append(line)
+        else:
+          lines.extend(new_lines)
+
+      # Go down to the first child if there is one.
+      if first_children[index] != -1:
+        index, depth = first_children[index], depth + 1
+        continue
+
+      # Otherwise close nodes until one of them has a next sibling.
+      while stack:
+        index, depth = stack.pop()
+        line = self.render_end(index)
+        if line is not None:
+          line = depth * indent_string + line
+          if condensers:
+            line = _condense(condensers, line)
+          if line is not None:
+            lines.append(line)
+
+        if condensed[index]:
+          line = condensers.pop().finish()
+          if line is not None and condensers:
+            line = _condense(condensers, line)
+          if line is not None:
+            lines.append(line)
+
+        if next_siblings[index] != -1 and stack:
+          index = next_siblings[index]
+          break
+      else:
+        return lines
+
+  def iter_compact_pieces(self):
+    """Render the tree into compact pieces (see pyhaml_jinja.compact)."""
+
+    kinds, first_children = self.kinds, self.first_children
+
+    # Nodes to open as (index, raw, None), or ends to emit as (-1, _, piece).
+    stack = [(child, False, None)
+             for child in reversed(list(self.iter_children(0)))]
+
+    while stack:
+      index, raw, end = stack.pop()
+      if index == -1:
+        yield end
+        continue
+
+      kind = kinds[index]
+      node_class = self.KIND_CLASSES[kind]
+      tag = None
+      if kind == self.HTML or kind == self.SELF_CLOSING_HTML:
+        tag = self.strings[self.texts[index]]
+
+      if kind == self.RAW_TEXT:
+        for piece in compact.iter_raw_pieces(self.render_start(index)):
+          yield piece
+        continue
+
+      start = compact.get_piece(node_class, self.render_start(index), tag=tag,
+                                raw=raw)
+      if start is not None:
+        # Preformatted text right after an opening tag is part of its start.
+        first_child = first_children[index]
+        if (kind == self.HTML and first_child != -1 and
+            kinds[first_child] == self.PREFORMATTED):
+          start = start[:2] + (compact.NEWLINE, )
+        yield start
+
+      end = compact.get_piece(node_class, self.render_end(index), end=True,
+                              tag=tag, raw=raw)
+      if end is not None:
+        stack.append((-1, raw, end))
+
+      raw = raw or kind == self.CUSTOM_BLOCK
+      stack.extend((child, raw, None)
+                   for child in reversed(list(self.iter_children(index))))
+
+  def iter_lines(self, indent_string=None, indent_level=-1):
+    """Render the tree one line at a time (see Renderer.iter_lines)."""
+    return iter(self.render_lines(indent_string=indent_string,
+                                  indent_level=indent_level))
+
+  def to_bytes(self):
+    """Serialize the tree into a byte string."""
+
+    strings = json.dumps(self.strings)
+    parts = [self._HEADER.pack(len(self.kinds), len(strings)), strings]
+    parts.extend(getattr(self, name).tostring() for name in self._ARRAYS)
+    return ''.join(parts)
+
+  @classmethod
+  def from_bytes(cls, data):
+    """Load a tree serialized with to_bytes()."""
+
+    tree = cls()
+    count, strings_length = cls._HEADER.unpack_from(data)
+    offset = cls._HEADER.size
+    tree.strings = json.loads(data[offset:offset + strings_length])
+    offset += strings_length
+
+    for name in cls._ARRAYS:
+      values = array.array(getattr(tree, name).typecode)
+      size = values.itemsize * count
+      values.fromstring(data[offset:offset + size])
+      setattr(tree, name, values)
+      offset += size
+
+    tree._string_offsets = dict(
+        (value, offset) for offset, value in enumerate(tree.strings))
+    return tree
@@ -1,11 +1,135 @@
 """Extension for use with Jinja2."""
 
+import collections
+import fnmatch
+import gc
+import hashlib
+import inspect
+import logging
+import multiprocessing
+import multiprocessing.pool
 import os.path
+import sys
+import threading
+import weakref
 
-from jinja2 import TemplateSyntaxError
+from jinja2 import Environment, TemplateNotFound, TemplateSyntaxError
 from jinja2.ext import Extension
+from jinja2.lexer import TokenStream
+from jinja2.loaders import BaseLoader, ChoiceLoader, PrefixLoader
 
-from pyhaml_jinja.renderer import Renderer
+from pyhaml_jinja.compiler import Compiler
+from pyhaml_jinja.stats import TemplateStats
+from pyhaml_jinja import token_stream
+
+
+logger = logging.getLogger(__name__)
+
+# Jinja has no hook for replacing its lexer, so the token stream mode shadows
+# the private Environment._tokenize() (see HamlExtension._tokenize), on the
+# versions where it takes the same arguments.
+try:
+  TOKENIZE_HOOK_SUPPORTED = (inspect.getargspec(Environment._tokenize).args ==
+                             ['self', 'source', 'name', 'filename', 'state'])
+except (AttributeError, TypeError):
+  TOKENIZE_HOOK_SUPPORTED = False
+
+
+class PreprocessCache(object):
+  """Bounded LRU cache of preprocessed template sources.
+
+  Entries are keyed by a digest of the HAML source and the rendering settings,
+  so a template that is reloaded with identical contents skips the whole HAML
+  pipeline. The cache is bounded both by number of entries and by the total
+  size (in bytes) of the stored output; least recently used entries are
+  evicted first.
+  """
+
+  def __init__(self, max_entries=None, max_bytes=None):
+    self.max_entries = max_entries
+    self.max_bytes = max_bytes
+    self.total_bytes = 0
+    self._entries = collections.OrderedDict()
+    self._names = {}  # Template name -> key of its latest output.
+    self._lock = threading.Lock()
+
+  def __len__(self):
+    return len(self._entries)
+
+  def __contains__(self, key):
+    return key in self._entries
+
+  @classmethod
+  def make_key(cls, source, indent_string, newline_string, compact=False,
+               raw_blocks=False):
+    """Return the cache key for a source rendered with the given settings."""
+
+    digest = hashlib.sha1()
+    for part in (source, indent_string, newline_string):
+      if isinstance(part, unicode):
+        part = part.encode('utf-8')
+      digest.update(part or '')
+      digest.update('\0')
+    if compact:
+      digest.update('compact\0')
+    if raw_blocks:
+      digest.update('raw_blocks=%s\0' % raw_blocks)
+    return digest.hexdigest()
+
+  def get(self, key):
+    """Return the cached output for key (or None), marking it as recent."""
+
+    with self._lock:
+      value = self._entries.pop(key, None)
+      if value is not None:
+        self._entries[key] = value
+      return value
+
+  def set(self, key, value, name=None):
+    """Store value under key, evicting old entries to respect the budget.
+
+    name is the template the value was rendered for (see invalidate()).
+    """
+
+    size = sys.getsizeof(value)
+    if self.max_entries == 0 or (self.max_bytes is not None and
+                                 size > self.max_bytes):
+      return
+
+    with self._lock:
+      if name is not None:
+        self._names[name] = key
+
+      previous = self._entries.pop(key, None)
+      if previous is not None:
+        self.total_bytes -= sys.getsizeof(previous)
+
+      self._entries[key] = value
+      self.total_bytes += size
+
+      while ((self.max_entries is not None and
+              len(self._entries) > self.max_entries) or
+             (self.max_bytes is not None and
+              self.total_bytes > self.max_bytes)):
+        _, evicted = self._entries.popitem(last=False)
+        self.total_bytes -= sys.getsizeof(evicted)
+
+  def invalidate(self, name):
+    """Remove the latest entry stored for the template name, if any."""
+
+    with self._lock:
+      key = self._names.pop(name, None)
+      value = self._entries.pop(key, None)
+      if value is not None:
+        self.total_bytes -= sys.getsizeof(value)
+
+  def clear(self):
+    """Remove all entries from the cache."""
+
+    with self._lock:
+      self._entries.clear()
+      self._names.clear()
+      self.total_bytes = 0
 
 
 class HamlExtension(Extension):
@@ -14,29 +138,311 @@ class HamlExtension(Extension):
   FILE_EXTENSIONS = ('.haml', )
   DEFAULT_INDENT_STRING = '  '
   DEFAULT_NEWLINE_STRING = '\n'
+  DEFAULT_RENDERER_CLASS = Compiler  # Or pyhaml_jinja.renderer.Renderer.
+  DEFAULT_COMPACT = False  # Drop insignificant whitespace (see compact.py).
+  DEFAULT_RAW_BLOCKS = False  # Or True, or 'jinja' (see Parser).
+  DEFAULT_TOKEN_STREAM = False  # Skip Jinja's lexer (see token_stream.py).
+  DEFAULT_CACHE_SIZE = 512  # Number of preprocessed templates to keep.
+  DEFAULT_CACHE_MAX_BYTES = 32 * 1024 * 1024  # Memory budget for the cache.
+  DEFAULT_STATS_CALLBACK = None  # Called with a TemplateStats per template.
+  DEFAULT_SLOW_TEMPLATE_THRESHOLD = None  # Seconds, to log slow templates.
 
   def __init__(self, environment):
     """Configures the extension and environment."""
 
     super(HamlExtension, self).__init__(environment)
 
+    self.cache = PreprocessCache()
+
     environment.extend(haml_file_extensions=self.FILE_EXTENSIONS,
         haml_indent_string=self.DEFAULT_INDENT_STRING,
-        haml_newline_string=self.DEFAULT_NEWLINE_STRING)
+        haml_newline_string=self.DEFAULT_NEWLINE_STRING,
+        haml_renderer_class=self.DEFAULT_RENDERER_CLASS,
+        haml_compact=self.DEFAULT_COMPACT,
+        haml_raw_blocks=self.DEFAULT_RAW_BLOCKS,
+        haml_token_stream=self.DEFAULT_TOKEN_STREAM,
+        haml_cache_size=self.DEFAULT_CACHE_SIZE,
+        haml_cache_max_bytes=self.DEFAULT_CACHE_MAX_BYTES,
+        haml_cache_clear=self.cache.clear,
+        haml_cache_invalidate=self.cache.invalidate,
+        haml_warm=self.warm,
+        haml_stats_callback=self.DEFAULT_STATS_CALLBACK,
+        haml_slow_template_threshold=self.DEFAULT_SLOW_TEMPLATE_THRESHOLD)
+
+  def bind(self, environment):
+    rv = super(HamlExtension, self).bind(environment)
+    # Overlays copy the hook of the environment they were made from.
+    if '_tokenize' in environment.__dict__:
+      environment._tokenize = rv._tokenize
+    return rv
 
   def preprocess(self, source, name, filename=None):
     """Preprocesses the template from HAML to Jinja-style HTML."""
 
-    if (not name or os.path.splitext(name)[1] not in
-        self.environment.haml_file_extensions):
+    environment = self.environment
+    if (environment.haml_token_stream and TOKENIZE_HOOK_SUPPORTED and
+        '_tokenize' not in environment.__dict__):
+      # The hook takes over from the next template on; this one goes through
+      # Jinja's lexer, which gives the same tokens.
+      environment._tokenize = self._tokenize
+    return self.get_preprocessed_source(source, name, filename)
+
+  def _tokenize(self, source, name, filename=None, state=None):
+    """Replaces Environment._tokenize(), which Jinja's parser calls.
+
+    This does the same (preprocess the source, tokenize it and have every
+    extension filter the tokens), except that with haml_token_stream set the
+    preprocessed HAML templates are tokenized by token_stream.tokenize()
+    rather than by Jinja's lexer.
+    """
+
+    environment = self.environment
+    source = environment.preprocess(source, name, filename)
+    if (state is None and environment.haml_token_stream and
+        self._is_haml(name) and token_stream.supports(environment)):
+      stream = TokenStream(
+          token_stream.tokenize(environment, source, name, filename),
+          name, filename)
+    else:
+      stream = environment.lexer.tokenize(source, name, filename, state)
+
+    for extension in environment.iter_extensions():
+      stream = extension.filter_stream(stream)
+      if not isinstance(stream, TokenStream):
+        stream = TokenStream(stream, name, filename)
+    return stream
+
+  def get_preprocessed_source(self, source, name, filename=None):
+    """Return the Jinja source for the template name (as preprocess())."""
+
+    if not self._is_haml(name):
       return source
 
+    indent_string = self.environment.haml_indent_string
+    newline_string = self.environment.haml_newline_string
+    options = self._get_render_options()
+    key = self.cache.make_key(source, indent_string, newline_string,
+                              **options)
+
+    # Loaders serving already-preprocessed sources (such as
+    # pyhaml_jinja.pack.PackLoader) let us skip the HAML pipeline entirely,
+    # even when wrapped in other loaders.
+    for loader, local_name in iter_loaders(self.environment.loader, name):
+      get_preprocessed = getattr(loader, 'get_preprocessed', None)
+      if get_preprocessed is not None:
+        output = get_preprocessed(local_name, source, key)
+        if output is not None:
+          return output
+
+    self._configure_cache()
+
+    output = self.cache.get(key)
+    if output is not None:
+      return output
+
+    # Only collect statistics if someone is going to look at them.
+    callback = self.environment.haml_stats_callback
+    threshold = self.environment.haml_slow_template_threshold
+    if callback is not None or threshold is not None:
+      options['stats'] = TemplateStats(name)
+
     try:
-      renderer = Renderer(source,
-          indent_string=self.environment.haml_indent_string,
-          newline_string=self.environment.haml_newline_string)
+      renderer = self.environment.haml_renderer_class(source,
+          indent_string=indent_string,
+          newline_string=newline_string, **options)
     except TemplateSyntaxError, e:
       raise TemplateSyntaxError(e.message, e.lineno, name=name, filename=filename)
 
-    return renderer.render()
+    output = renderer.render()
+    self.cache.set(key, output, name=name)
+
+    if 'stats' in options:
+      stats = options['stats']
+      if threshold is not None and stats.wall_time > threshold:
+        logger.warning('Preprocessing %s took %.3fs (%s).', name,
+                       stats.wall_time, ', '.join(
+                         '%s: %.3fs' % item
+                         for item in sorted(stats.wall_times.items())))
+      if callback is not None:
+        callback(stats)
+
+    return output
+
+  def _is_haml(self, name):
+    return bool(name) and (os.path.splitext(name)[1] in
+                           self.environment.haml_file_extensions)
+
+  def _get_render_options(self):
+    """Return the renderer arguments for the optional settings in use."""
+
+    options = {}
+    if self.environment.haml_compact:
+      options['compact'] = True
+    if self.environment.haml_raw_blocks:
+      options['raw_blocks'] = self.environment.haml_raw_blocks
+    return options
+
+  def _configure_cache(self):
+    # The limits live on the environment so they can be changed at any time.
+    self.cache.max_entries = self.environment.haml_cache_size
+    self.cache.max_bytes = self.environment.haml_cache_max_bytes
+
+  def warm(self, patterns=None, workers=None, processes=False, freeze=False):
+    """Preprocess and compile templates before they are first requested.
+
+    The HAML templates listed by the environment's loader whose names match
+    one of the fnmatch patterns (all of them if patterns is None) are loaded
+    as get_template() would, so they end up in the environment's template
+    cache; make sure env.cache is big enough to hold them.
+
+    workers is the size of the thread pool compiling the templates (one per
+    CPU by default). With processes=True, the HAML preprocessing is spread
+    over a process pool instead, and its output is put in the preprocess
+    cache; compiled Jinja templates can't be passed between processes, so
+    they are still compiled in this one, from the sources already read.
+
+    Servers that fork workers after warming up should pass freeze=True: a
+    full garbage collection is run, and on interpreters that have
+    gc.freeze() every object created so far is left out of later
+    collections, so the pages holding the templates stay shared between the
+    forked workers. Returns the list of warmed template names.
+    """
+
+    environment = self.environment
+    names = [name for name in environment.loader.list_templates()
+             if os.path.splitext(name)[1] in environment.haml_file_extensions
+             and (patterns is None or
+                  any(fnmatch.fnmatch(name, pattern) for pattern in patterns))]
+
+    if processes:
+      loaded = [(name, ) + environment.loader.get_source(environment, name)
+                for name in names]
+      self._warm_cache(loaded, workers)
+      load = lambda item: self._load_template(*item)
+      items = loaded
+    else:
+      load = environment.get_template
+      items = names
+
+    if workers == 1 or len(items) < 2:
+      map(load, items)
+    else:
+      pool = multiprocessing.pool.ThreadPool(workers)
+      try:
+        pool.map(load, items)
+      finally:
+        pool.close()
+        pool.join()
+
+    if freeze:
+      gc.collect()
+      if hasattr(gc, 'freeze'):
+        gc.freeze()
+
+    return names
+
+  def _warm_cache(self, loaded, workers):
+    """Preprocess loaded sources in a process pool, filling the cache.
+
+    loaded is a list of (name, source, filename, uptodate) tuples.
+    """
+
+    environment = self.environment
+    indent_string = environment.haml_indent_string
+    newline_string = environment.haml_newline_string
+    options = self._get_render_options()
+    self._configure_cache()
+
+    sources = []
+    for name, source, _, _ in loaded:
+      if self.cache.make_key(source, indent_string, newline_string,
+                             **options) not in self.cache:
+        sources.append((name, source))
+    if not sources:
+      return
+
+    jobs = [(source, environment.haml_renderer_class, indent_string,
+             newline_string, options) for _, source in sources]
+    pool = multiprocessing.Pool(workers)
+    try:
+      outputs = pool.map(_preprocess_job, jobs, chunksize=8)
+    finally:
+      pool.close()
+      pool.join()
+
+    for (name, source), output in zip(sources, outputs):
+      # Templates that failed are left for the compiler to report.
+      if output is not None:
+        key = self.cache.make_key(source, indent_string, newline_string,
+                                  **options)
+        self.cache.set(key, output, name=name)
+
+  def _load_template(self, name, source, filename, uptodate):
+    """Compile an already read template into the template cache.
+
+    This does what get_template() and BaseLoader.load() do, minus reading
+    the source again.
+    """
+
+    environment = self.environment
+    code = bucket = None
+    bytecode_cache = environment.bytecode_cache
+    if bytecode_cache is not None:
+      bucket = bytecode_cache.get_bucket(environment, name, filename, source)
+      code = bucket.code
+    if code is None:
+      code = environment.compile(source, name, filename)
+      if bucket is not None:
+        bucket.code = code
+        bytecode_cache.set_bucket(bucket)
+
+    template = environment.template_class.from_code(
+        environment, code, environment.make_globals(None), uptodate)
+    if environment.cache is not None:
+      environment.cache[(weakref.ref(environment.loader), name)] = template
+    return template
+
+
+def _preprocess_job(job):
+  """Preprocess a single source in a worker process of HamlExtension.warm."""
+
+  source, renderer_class, indent_string, newline_string, options = job
+  try:
+    return renderer_class(source, indent_string=indent_string,
+                          newline_string=newline_string, **options).render()
+  except TemplateSyntaxError:
+    return None
+
+
+def iter_loaders(loader, name):
+  """Yield (loader, name) for loader and the loaders it wraps.
+
+  name is translated to the name the wrapped loaders know the template by.
+  ChoiceLoader and PrefixLoader are looked into, and so are loaders keeping
+  the loader they wrap in their loader attribute (like HamlLoader).
+  """
+
+  yield loader, name
+  if isinstance(loader, ChoiceLoader):
+    for choice in loader.loaders:
+      for item in iter_loaders(choice, name):
+        yield item
+  elif isinstance(loader, PrefixLoader):
+    try:
+      prefixed, local_name = loader.get_loader(name)
+    except TemplateNotFound:
+      return
+    for item in iter_loaders(prefixed, local_name):
+      yield item
+  elif isinstance(getattr(loader, 'loader', None), BaseLoader):
+    for item in iter_loaders(loader.loader, name):
+      yield item
+
+
+def get_haml_extension(environment):
+  """Return the HamlExtension of environment, raising ValueError if none."""
 
+  for extension in environment.iter_extensions():
+    if isinstance(extension, HamlExtension):
+      return extension
+  raise ValueError('The environment does not use HamlExtension.')
@@ -0,0 +1,279 @@
+"""Incremental re-parsing and re-rendering of edited templates."""
+
+from pyhaml_jinja import nodes
+from pyhaml_jinja.parser import Parser
+from pyhaml_jinja.renderer import Renderer
+
+
+__all__ = ['IncrementalRenderer']
+
+
+class IncrementalRenderer(Renderer):
+  """A Renderer that can apply edits to its source without starting over.
+
+  The tree and the rendered lines are kept around, and edit() only re-parses
+  the lines nested under the closest unchanged line that encloses the edit,
+  and only re-renders the node owning them::
+
+    renderer = IncrementalRenderer(source, '\\n', '  ')
+    renderer.render()
+    renderer.edit(10, 11, '    %p changed line 10\\n')
+    renderer.render()  # Same as Renderer(new_source, '\\n', '  ').render().
+
+  This is meant for editor previews and development servers, and keeps more
+  state around than Renderer: a node per source line, and the number of
+  output lines of every node it has had to measure.
+  """
+
+  def __init__(self, source, newline_string=None, indent_string=None):
+    # Edits are applied to a Node tree and its indented lines, so the flat,
+    # compact, raw_blocks and stats options of Renderer aren't supported.
+    super(IncrementalRenderer, self).__init__(source, newline_string,
+                                              indent_string)
+
+  def build_tree(self, source, flat=False, raw_blocks=False):
+    self.parse(source)
+    return self.tree
+
+  @property
+  def source(self):
+    return '\n'.join(self.source_lines)
+
+  def parse(self, source):
+    """Parse and render source from scratch."""
+
+    source_lines = source.split('\n')
+    parsed_lines = self._get_parsed_lines(source_lines)
+    line_nodes = [None] * len(source_lines)
+
+    tree = nodes.Node()
+    Parser.build_subtree(tree, parsed_lines, line_nodes=line_nodes)
+
+    self.tree = tree
+    self.source_lines = source_lines  # As given.
+    self.parsed_lines = parsed_lines  # As returned by get_source_lines().
+    self.line_nodes = line_nodes  # (outermost, innermost) node or None.
+    self.lines = tree.render_lines(indent_string=self.indent_string,
+                                   indent_level=-1)
+    self._line_counts = {}
+
+  def iter_lines(self, replacements=None):
+    if replacements is None:
+      return iter(self.lines)
+    return super(IncrementalRenderer, self).iter_lines(replacements)
+
+  def edit(self, start_line, end_line, text):
+    """Replace source lines start_line up to (not including) end_line.
+
+    Lines are numbered from 1, so edit(3, 3, text) inserts text before line
+    3, and edit(3, 5, '') deletes lines 3 and 4. A trailing newline on text is
+    ignored. Returns (index, count, lines): lines replaced the count rendered
+    lines starting at index in the output. If the new source is invalid, a
+    TemplateSyntaxError is raised and nothing changes.
+    """
+
+    if not 1 <= start_line <= end_line <= len(self.source_lines) + 1:
+      raise IndexError('Invalid line range: %d-%d.' % (start_line, end_line))
+
+    new_lines = text.split('\n')
+    if not new_lines[-1]:
+      new_lines.pop()
+
+    start, end = start_line - 1, end_line - 1
+    source_lines = (self.source_lines[:start] + new_lines +
+                    self.source_lines[end:])
+
+    # Line continuations crossing the edges of the edit change the lines
+    # around it, so start over.
+    if any(self._is_continued(lines, index) for lines, index in (
+        (self.source_lines, start - 1), (self.source_lines, end - 1),
+        (new_lines, len(new_lines) - 1))):
+      return self._reparse(source_lines)
+
+    parsed_lines = (self.parsed_lines[:start] +
+                    self._get_parsed_lines(new_lines) +
+                    self.parsed_lines[end:])
+
+    # Find the closest line before the edit that is less indented than all of
+    # the removed and added lines: everything that changes is nested under
+    # it, and lines outside of it keep their nodes.
+    indents = [Parser.get_indent_level(line) for line in
+               self.parsed_lines[start:end] + parsed_lines[start:start +
+                                                           len(new_lines)]
+               if line.strip()]
+    if not indents:
+      # Only blank lines or comments changed, so the output is the same.
+      self.source_lines, self.parsed_lines = source_lines, parsed_lines
+      self.line_nodes[start:end] = [None] * len(new_lines)
+      return 0, 0, []
+
+    anchor = start - 1
+    while anchor >= 0 and (
+        not parsed_lines[anchor].strip() or
+        Parser.get_indent_level(parsed_lines[anchor]) >= min(indents)):
+      anchor -= 1
+    if anchor < 0:
+      return self._reparse(source_lines)
+
+    anchor_indent = Parser.get_indent_level(parsed_lines[anchor])
+    body_end = start + len(new_lines)
+    while body_end < len(parsed_lines) and (
+        not parsed_lines[body_end].strip() or
+        Parser.get_indent_level(parsed_lines[body_end]) > anchor_indent):
+      body_end += 1
+
+    return self._replace_body(anchor, body_end, end - start - len(new_lines),
+                              source_lines, parsed_lines)
+
+  def _replace_body(self, anchor, body_end, removed, source_lines,
+                    parsed_lines):
+    """Re-parse the lines nested under the anchor line and render them.
+
+    body_end is the index of the first line after the body in the new lines,
+    and removed the number of lines the edit removed (or added if negative).
+    """
+
+    parent = self.line_nodes[anchor][1]
+
+    # Condensed tags merge their first and last lines with their children's,
+    # so the node we re-render must not be inside one.
+    rendered, node = parent, parent
+    while node is not None:
+      if getattr(node, 'condensed', False):
+        rendered = node
+      node = node.parent
+
+    index = self._get_line_index(rendered)
+    count = self._count_lines(rendered)
+
+    old_children = parent.children
+    parent.children = ()
+    line_nodes = [None] * (body_end - anchor - 1)
+    try:
+      Parser.build_subtree(parent, parsed_lines[anchor + 1:body_end],
+                           first_line_number=anchor + 2,
+                           line_nodes=line_nodes)
+    except Exception:
+      parent.children = old_children
+      raise
+    finally:
+      # The start of an HtmlNode depends on its first child.
+      parent.clear_rendered()
+
+    # Forget the counts of the old nodes and of the ones being re-rendered.
+    node_stack = list(old_children)
+    while node_stack:
+      node = node_stack.pop()
+      self._line_counts.pop(node, None)
+      node_stack.extend(node.get_children())
+
+    node = parent
+    while node is not rendered:
+      self._line_counts.pop(node, None)
+      node = node.parent
+
+    lines = rendered.render_lines(indent_string=self.indent_string,
+                                  indent_level=self._get_depth(rendered))
+    self.lines[index:index + count] = lines
+    self._line_counts[rendered] = len(lines)
+
+    node = rendered.parent
+    while node is not None:
+      if node in self._line_counts:
+        self._line_counts[node] += len(lines) - count
+      node = node.parent
+
+    self.source_lines, self.parsed_lines = source_lines, parsed_lines
+    self.line_nodes[anchor + 1:body_end + removed] = line_nodes
+    return index, count, lines
+
+  def _reparse(self, source_lines):
+    """Start over with the new source, returning the edit() result."""
+
+    count = len(self.lines)
+    self.parse('\n'.join(source_lines))
+    return 0, count, list(self.lines)
+
+  def _count_lines(self, node):
+    """Return the number of lines node renders to."""
+
+    line_counts = self._line_counts
+    count = line_counts.get(node)
+    if count is not None:
+      return count
+
+    # Find the nodes that haven't been counted yet, parents before children,
+    # and count them the other way around (so deep trees don't recurse).
+    uncounted, node_stack = [], [node]
+    while node_stack:
+      child = node_stack.pop()
+      if child not in line_counts:
+        uncounted.append(child)
+        node_stack.extend(child.get_children())
+
+    for child in reversed(uncounted):
+      count = ((child.render_start() is not None) +
+               sum(line_counts[grandchild]
+                   for grandchild in child.get_children()) +
+               (child.render_end() is not None))
+
+      # Condensing joins the first two and then the last two lines.
+      if getattr(child, 'condensed', False) and count >= 2:
+        count = max(1, count - 2)
+
+      line_counts[child] = count
+    return line_counts[node]
+
+  def _get_line_index(self, node):
+    """Return the index in self.lines of the first line of node.
+
+    None of node's ancestors may be condensed.
+    """
+
+    index = 0
+    while node.parent is not None:
+      sibling = node.get_previous_sibling()
+      while sibling is not None:
+        index += self._count_lines(sibling)
+        sibling = sibling.get_previous_sibling()
+
+      node = node.parent
+      if node.render_start() is not None:
+        index += 1
+    return index
+
+  @classmethod
+  def _get_depth(cls, node):
+    """Return the indent level node is rendered at (the root being -1)."""
+
+    depth = -1
+    while node.parent is not None:
+      depth += 1
+      node = node.parent
+    return depth
+
+  @classmethod
+  def _get_parsed_lines(cls, source_lines):
+    """Run get_source_lines() on source_lines, keeping one line per line."""
+
+    if not source_lines:
+      return []
+
+    parsed_lines = Parser.get_source_lines('\n'.join(source_lines))
+    return parsed_lines + [''] * (len(source_lines) - len(parsed_lines))
+
+  @classmethod
+  def _is_continued(cls, source_lines, index):
+    """Return whether a line continuation is open after source_lines[index].
+
+    Comment lines don't end continuations, and trailing blank lines are
+    dropped at the end of the source, so both are skipped.
+    """
+
+    while (0 <= index < len(source_lines) and (
+        not source_lines[index].strip() or
+        source_lines[index].strip().startswith(Parser.LINE_COMMENT))):
+      index -= 1
+
+    return (0 <= index < len(source_lines) and
+            source_lines[index].rstrip().endswith(Parser.LINE_CONTINUATION))
@@ -0,0 +1,112 @@
+"""Offset-based index of the lines of a HAML source."""
+
+import array
+import itertools
+
+
+__all__ = ['LineIndex']
+
+
+class LineIndex(object):
+  """The lines of a source (as Parser.get_source_lines returns them) by offset.
+
+  Rather than a copy of every line, the index keeps the source and a few
+  arrays, with one entry per source line:
+
+  - kinds: one of the kind constants below.
+  - starts, ends: the offsets of the line in the source, without trailing
+    whitespace.
+  - indents: the indentation of the line, or -1 if it has to be worked out
+    with Parser.get_indent_level (when it mixes different whitespace).
+
+  Lines are only turned into strings when they are asked for, and blank lines
+  never are. The few lines that aren't a piece of the source (continued
+  lines and raw custom blocks) are kept as strings.
+  """
+
+  # Line kinds.
+  BLANK = 0  # Blank lines, comments and the lines merged into another line.
+  SOURCE = 1  # A piece of the source.
+  INTERPOLATED = 2  # A piece of the source with #{...} to replace.
+  STRING = 3  # A line kept in strings.
+
+  def __init__(self, source, interpolate):
+    # interpolate is a function replacing #{...} in a line.
+    self.source = source
+    self.interpolate = interpolate
+    self.kinds = array.array('b')
+    self.starts = array.array('i')
+    self.ends = array.array('i')
+    self.indents = array.array('i')
+    self.strings = {}  # Line number (from 0) -> line, for STRING lines.
+
+  def __len__(self):
+    return len(self.kinds)
+
+  def __iter__(self):
+    for index in xrange(len(self.kinds)):
+      yield self[index]
+
+  def __getitem__(self, index):
+    if isinstance(index, slice):
+      return [self[i] for i in xrange(*index.indices(len(self.kinds)))]
+
+    kind = self.kinds[index]
+    if kind == self.BLANK:
+      return ''
+    elif kind == self.STRING:
+      return self.strings[index % len(self.kinds)]
+
+    line = self.source[self.starts[index]:self.ends[index]]
+    if kind == self.INTERPOLATED:
+      line = self.interpolate(line)
+    return line
+
+  def add_line(self, kind, start=0, end=0, indent=-1):
+    """Append a line, returning its index."""
+
+    self.kinds.append(kind)
+    self.starts.append(start)
+    self.ends.append(end)
+    self.indents.append(indent)
+    return len(self.kinds) - 1
+
+  def add_blank_lines(self, count=1):
+    for _ in xrange(count):
+      self.add_line(self.BLANK)
+
+  def add_string(self, line):
+    """Append a line that isn't a piece of the source."""
+    self.strings[self.add_line(self.STRING)] = line
+
+  def set_string(self, index, line):
+    """Replace an existing line by a string."""
+    self.kinds[index] = self.STRING
+    self.indents[index] = -1
+    self.strings[index] = line
+
+  def iter_indented_lines(self, first_line_number=1):
+    """Yield (line_number, line, indent) for every non-blank line.
+
+    indent is None when it has to be worked out from the line (see indents).
+    """
+
+    source, strings = self.source, self.strings
+    SOURCE, STRING, BLANK = self.SOURCE, self.STRING, self.BLANK
+
+    lines = itertools.izip(self.kinds, self.starts, self.ends, self.indents)
+    for line_number, (kind, start, end, indent) in enumerate(
+        lines, start=first_line_number):
+      if kind == BLANK:
+        continue
+
+      if kind == SOURCE:
+        line = source[start:end]
+      elif kind == STRING:
+        line = strings[line_number - first_line_number]
+        if not line.strip():
+          continue
+      else:
+        line = self.interpolate(source[start:end])
+
+      yield line_number, line, None if indent == -1 else indent
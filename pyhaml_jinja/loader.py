@@ -0,0 +1,67 @@
+"""Loader wrapper keeping template freshness checks cheap."""
+
+import os
+import time
+
+from jinja2.loaders import BaseLoader
+
+
+__all__ = ['HamlLoader']
+
+
+class HamlLoader(BaseLoader):
+  """Wraps a Jinja loader, caching stat() results.
+
+  Every uptodate check of a template loaded through this loader shares one
+  stat() of its file per stat_ttl seconds, however many times per second it
+  runs::
+
+    env = Environment(loader=HamlLoader(FileSystemLoader('templates')),
+                      extensions=[HamlExtension])
+
+  Templates without a filename are passed through untouched. Reloading an
+  unchanged template is already cheap, as HamlExtension keeps preprocessed
+  sources in its own bounded cache.
+  """
+
+  DEFAULT_STAT_TTL = 1.0  # Seconds a stat() result is trusted for.
+
+  def __init__(self, loader, stat_ttl=None):
+    self.loader = loader
+    self.stat_ttl = self.DEFAULT_STAT_TTL if stat_ttl is None else stat_ttl
+    # Filename -> (time of the stat() call, mtime), for the files of the
+    # templates loaded so far.
+    self._stats = {}
+
+  def get_mtime(self, filename):
+    """Return the modification time of filename, or None if it is missing.
+
+    The result of stat() is reused for stat_ttl seconds.
+    """
+
+    now = time.time()
+    entry = self._stats.get(filename)
+    if entry is not None and now - entry[0] < self.stat_ttl:
+      return entry[1]
+
+    try:
+      mtime = os.stat(filename).st_mtime
+    except OSError:
+      mtime = None
+    self._stats[filename] = (now, mtime)
+    return mtime
+
+  def get_source(self, environment, template):
+    source, filename, uptodate = self.loader.get_source(environment, template)
+    if filename is None:
+      return source, filename, uptodate
+
+    mtime = self.get_mtime(filename)
+    return source, filename, lambda: self.get_mtime(filename) == mtime
+
+  def clear(self):
+    """Forget all cached stat() results."""
+    self._stats.clear()
+
+  def list_templates(self):
+    return self.loader.list_templates()
@@ -1,13 +1,14 @@
 """Convenience imports of all node types"""
 
 # Base node
-from pyhaml_jinja.nodes.node import Node
+from pyhaml_jinja.nodes.node import Node, intern_name, share_string
 
 # Simple nodes
 from pyhaml_jinja.nodes.childless_node import ChildlessNode
 from pyhaml_jinja.nodes.custom_block_node import CustomBlockNode
 from pyhaml_jinja.nodes.empty_node import EmptyNode
-from pyhaml_jinja.nodes.text_node import TextNode, PreformattedTextNode
+from pyhaml_jinja.nodes.text_node import (
+    TextNode, PreformattedTextNode, RawTextNode)
 
 # Complex nodes
 from pyhaml_jinja.nodes.html_node import (
@@ -9,6 +9,8 @@ __all__ = ['ChildlessNode']
 class ChildlessNode(Node):
   """Parent class for nodes that cannot have children."""
 
+  __slots__ = ()
+
   def children_allowed(self):
     return False
 
@@ -8,6 +8,8 @@ __all__ = ['CustomBlockNode']
 
 class CustomBlockNode(Node):
 
+  __slots__ = ('block_type', 'start', 'end')
+
   BLOCK_TYPES = {
       'javascript': ('<script type="text/javascript">', '</script>'),
       'plain': ('', ''),
@@ -9,5 +9,5 @@ __all__ = ['EmptyNode']
 class EmptyNode(Node):
   """Represents an empty line (mostly for debugging)."""
 
-  pass
+  __slots__ = ()
 
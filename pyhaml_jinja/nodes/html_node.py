@@ -1,8 +1,10 @@
 """Nodes that render into HTML tags."""
 
 import re
+import string
 
-from pyhaml_jinja.nodes.node import Node
+from pyhaml_jinja.nodes.node import (
+    NOT_RENDERED, Node, intern_name, share_string)
 from pyhaml_jinja.nodes.childless_node import ChildlessNode
 from pyhaml_jinja.nodes.text_node import TextNode, PreformattedTextNode
 
@@ -27,107 +29,296 @@ class HtmlNode(Node):
 
   SELF_CLOSING_TAGS = ['br', 'hr', 'img', 'input', 'link', 'meta']
 
+  SHORTCUT_KEYS = {'.': 'class', '#': 'id'}
+
+  # What \w and \s match in TAG_REGEX, for match_haml.
+  TAG_CHARACTERS = frozenset(string.ascii_letters + string.digits + '_')
+  WHITESPACE = frozenset(' \t\n\r\x0b\x0c')
+  # Where the part of a line after the shortcut attributes can start.
+  TAIL_STARTS = WHITESPACE | frozenset('(:')
+  SHORTCUT_SPLIT_REGEX = re.compile(r'([\.#])')
+
+  __slots__ = ('_tag', '_attributes', 'condensed', '_start', '_end')
+
   def __init__(self, tag, attributes=None, condensed=False):
+    self._attributes = attributes or None  # Only allocated when needed.
     self.tag = tag
-    self.attributes = attributes or {}
     self.condensed = condensed
     super(HtmlNode, self).__init__()
 
+  @property
+  def tag(self):
+    return self._tag
+
+  @tag.setter
+  def tag(self, tag):
+    self._tag = intern_name(tag)
+    self.clear_rendered()
+
+  @property
+  def attributes(self):
+    """The dictionary of attributes on this node.
+
+    The start string is memoized, so changes made to the dictionary itself
+    only show once clear_rendered() is called. Use add_attribute() or assign
+    a new dictionary instead.
+    """
+    if self._attributes is None:
+      self._attributes = {}
+    return self._attributes
+
+  @attributes.setter
+  def attributes(self, attributes):
+    self._attributes = attributes or None
+    self.clear_rendered()
+
+  def clear_rendered(self):
+    self._start = self._end = NOT_RENDERED
+
   def add_attribute(self, key, value):
     """Safely add an attribute to this node.
 
     Raises an exception if you try to clobber a variable (not class).
     If you add an extra class, appends it correctly to the existing class.
     """
+    self.merge_attribute(self.attributes, key, value, self)
+    self.clear_rendered()
+
+  @classmethod
+  def merge_attribute(cls, attributes, key, value, owner):
+    """Add an attribute to a dictionary following add_attribute's rules.
+
+    owner is only used to describe where the attribute was defined in error
+    messages.
+    """
     if key == 'class':
       # Class is a special one, which can be defined multiple times (and
       # should be appended with spaces in-between).
-      value = self.attributes.get('class', '') + ' ' + value
+      value = attributes.get('class', '') + ' ' + value
 
-    elif key in self.attributes:
+    elif key in attributes:
       raise KeyError(
-          'Attribute %s already defined on node %s!' % (key, self))
+          'Attribute %s already defined on node %s!' % (key, owner))
 
-    self.attributes[key] = value.strip()
+    attributes[intern_name(key)] = value.strip()
 
   @classmethod
-  def from_haml(cls, haml):
-    """Given a line of HAML markup, return the correct HtmlNode."""
+  def parse_haml(cls, haml):
+    """Split a line of HAML markup into its parts without building any nodes.
+
+    Returns a tuple of (node_class, tag, condensed, attribute_pairs, nested,
+    content), where attribute_pairs lists (key, value) pairs in the order they
+    should be passed to add_attribute(), and content is the stripped in-line
+    content (which is more HAML when nested is True).
+    """
 
     # You can omit the % if and only if the line starts with a '.' or '#'.
     if haml and not haml.startswith('%') and haml[0] in ('.', '#'):
       haml = '%div' + haml
 
-    match = cls.TAG_REGEX.match(haml)
-    if not match:
+    parts = cls.match_haml(haml)
+    if parts is None:
       raise ValueError('Text did not match %s' % cls.TAG_REGEX.pattern)
 
-    # Create the node with the proper tag.
-    tag = match.group('tag')
+    tag, condensed, attribute_pairs, attrs_span, nested, content = parts
 
+    # Pick the proper node type for the tag.
     if tag in cls.SELF_CLOSING_TAGS:
-      node = SelfClosingHtmlNode(tag=tag)
+      node_class = SelfClosingHtmlNode
     else:
-      node = cls(tag=tag)
-
-    # Update the condensed property on the node.
-    node.condensed = (match.group('condensed') == '-')
-
-    # Handle shortcut attributes ('.cls#id')
-    shortcut_attrs = match.group('shortcut_attrs')
-    if shortcut_attrs:
-      # Splits into ['.', 'cls', '#', 'id']
-      parts = re.split(r'([\.#])', shortcut_attrs)[1:]
-      # Zips together into [('.', 'cls'), ('#', 'id')]
-      parts = zip(parts[0::2], parts[1::2])
-
-      for prefix, value in parts:
-        if prefix == '.':
-          node.add_attribute('class', value)
-        elif prefix == '#':
-          node.add_attribute('id', value)
+      node_class = cls
 
     # Handle regular attributes ('(a="1", b="2")')
-    attrs = match.group('attrs')
-    if attrs:
-      # Splits apart by commas, but not commas within quotes.
-      attr_pairs = re.compile(r'(?:[^,"]|"[^"]*")+').findall(attrs[1:-1])
-      if any(_.count('"') != 2 for _ in attr_pairs):
-        raise ValueError('Mismatched quotes (or missing comma) in attributes!')
-
-      # Breaks pair strings into [(key, value), ...] but only split apart by
-      # the first equal sign.
-      attr_pairs = [pair.strip().split('=', 1) for pair in attr_pairs]
-      for (key, value) in attr_pairs:
-        if not value.startswith('"') or not value.endswith('"'):
-          raise ValueError(
-              'Invalid attribute provided: "%s" for key "%s"' % (value, key))
-        node.add_attribute(key, value[1:-1])
+    if attrs_span is not None:
+      attribute_pairs.extend(cls.scan_attributes(haml, *attrs_span))
 
     # Handle in-line content.
-    nested = (match.group('nested') or False)
-    content = (match.group('content') or '').strip()
+    content = (content or '').strip()
 
     # If we have nested tags, there should definitely be content.
     if nested and not content:
       raise ValueError('Illegal nesting of tags.')
 
-    # If we are nesting tags, parse the content as a separate HAML line and
-    # append the parsed child to the current node.
+    return node_class, tag, condensed, attribute_pairs, nested, content
+
+  @classmethod
+  def match_haml(cls, haml):
+    """Match a line against TAG_REGEX.
+
+    Returns None if the line doesn't match, or a tuple of (tag, condensed,
+    shortcut_pairs, attrs_span, nested, content), where shortcut_pairs are
+    the (key, value) pairs of the '.cls#id' shortcut attributes, attrs_span
+    is the (start, end) of the text inside the attribute list's parentheses
+    (or None) and content is the raw in-line content (or None).
+
+    The line is scanned once from left to right, giving the parts the
+    regular expression would.
+    """
+
+    if '\n' in haml:
+      # Lines from the parser never have line breaks, which TAG_REGEX treats
+      # in ways of its own ('.' doesn't match them).
+      return cls._match_haml_regex(haml)
+    if not haml.startswith('%'):
+      return None
+
+    length = len(haml)
+    condensed = haml.startswith('-', 1)
+    tag_start = position = 2 if condensed else 1
+    while position < length and haml[position] in cls.TAG_CHARACTERS:
+      position += 1
+    if position == tag_start:
+      return None
+    tag = haml[tag_start:position]
+
+    shortcut_pairs = []
+    if haml.startswith(('.', '#'), position):
+      # The shortcut attributes take at least one character, and end as soon
+      # as the rest of the line matches.
+      prefix = position
+      position += 1
+      tail = None
+      while tail is None:
+        if position == length or haml[position] in '()':
+          return None
+        if haml[position] in '.#':
+          shortcut_pairs.append(
+              (cls.SHORTCUT_KEYS[haml[prefix]], haml[prefix + 1:position]))
+          prefix = position
+        position += 1
+        if position == length or haml[position] in cls.TAIL_STARTS:
+          tail = cls._match_tail(haml, position)
+      shortcut_pairs.append(
+          (cls.SHORTCUT_KEYS[haml[prefix]], haml[prefix + 1:position]))
+    else:
+      tail = cls._match_tail(haml, position)
+      if tail is None:
+        return None
+
+    attrs_span, nested, content_start = tail
+    content = None if content_start is None else haml[content_start:]
+    return tag, condensed, shortcut_pairs, attrs_span, nested, content
+
+  @classmethod
+  def _match_tail(cls, haml, position):
+    """Match the attribute list, ':' and content of a line from position.
+
+    Returns None if they don't match, or (attrs_span, nested, content_start).
+    """
+
+    if not haml.startswith('(', position):
+      rest = cls._match_rest(haml, position)
+      return rest and (None, ) + rest
+
+    # The attribute list ends at the last ')' the rest of the line matches
+    # after.
+    tail = None
+    close = haml.find(')', position + 2)
+    while close != -1:
+      rest = cls._match_rest(haml, close + 1)
+      if rest is not None:
+        tail = ((position + 1, close), ) + rest
+      close = haml.find(')', close + 1)
+    return tail
+
+  @classmethod
+  def _match_rest(cls, haml, position):
+    """Match the ':' and content of a line from position.
+
+    Returns None if they don't match, or (nested, content_start).
+    """
+
+    nested = haml.startswith(':', position)
     if nested:
-      from pyhaml_jinja.parser import Parser
-      child = Parser.parse_line(content.strip())
-      node.add_child(child)
+      position += 1
+    if position == len(haml):
+      return nested, None
+    if position < len(haml) - 1 and haml[position] in cls.WHITESPACE:
+      return nested, position
+    return None
+
+  @classmethod
+  def _match_haml_regex(cls, haml):
+    """Do what match_haml() does with TAG_REGEX itself."""
+
+    match = cls.TAG_REGEX.match(haml)
+    if not match:
+      return None
+
+    # Splits '.cls#id' into ['.', 'cls', '#', 'id'] and pairs them up.
+    shortcut_pairs = []
+    parts = cls.SHORTCUT_SPLIT_REGEX.split(
+        match.group('shortcut_attrs') or '')[1:]
+    for prefix, value in zip(parts[0::2], parts[1::2]):
+      shortcut_pairs.append((cls.SHORTCUT_KEYS[prefix], value))
+
+    attrs_span = None
+    if match.group('attrs'):
+      attrs_span = (match.start('attrs') + 1, match.end('attrs') - 1)
+
+    return (match.group('tag'), match.group('condensed') == '-',
+            shortcut_pairs, attrs_span, match.group('nested') == ':',
+            match.group('content'))
+
+  @classmethod
+  def scan_attributes(cls, haml, start, end):
+    """Parse the 'a="1", b="2"' text of haml between start and end.
 
-    # If we aren't nesting and just have content, append it to the node if
-    # possible.
-    elif content:
-      if not node.children_allowed():
-        raise ValueError('Inline content ("%s") not permitted on node %s' % (
-          content, node))
-      node.add_child(TextNode(content))
+    Returns a list of (key, value) pairs. Pairs are separated by commas that
+    aren't within quotes.
+    """
 
-    return node
+    # Find the (start, end) of every pair the way re.findall() would with
+    # (?:[^,"]|"[^"]*")+, checking each has exactly one quoted string.
+    pairs = []
+    quotes_match = True
+    position = start
+    comma = haml.find(',', start, end)
+    while position < end:
+      pair_start = position
+      quotes = 0
+      while True:
+        if comma != -1 and comma < position:
+          comma = haml.find(',', position, end)
+        quote = haml.find('"', position, end)
+        if quote == -1 or comma != -1 and comma < quote:
+          position = end if comma == -1 else comma
+          break
+        close = haml.find('"', quote + 1, end)
+        if close == -1:
+          position = quote
+          break
+        quotes += 2
+        position = close + 1
+
+      if position == pair_start:
+        # A comma, or a quote that is never closed, which is skipped.
+        position += 1
+        continue
+
+      pairs.append((pair_start, position))
+      quotes_match = quotes_match and quotes == 2
+
+    if not quotes_match:
+      raise ValueError('Mismatched quotes (or missing comma) in attributes!')
+
+    # Breaks pairs into (key, value) but only split apart by the first equal
+    # sign.
+    attribute_pairs = []
+    for pair_start, pair_end in pairs:
+      key, value = haml[pair_start:pair_end].strip().split('=', 1)
+      if not value.startswith('"') or not value.endswith('"'):
+        raise ValueError(
+            'Invalid attribute provided: "%s" for key "%s"' % (value, key))
+      attribute_pairs.append((key, value[1:-1]))
+    return attribute_pairs
+
+  @classmethod
+  def from_haml(cls, haml):
+    """Given a line of HAML markup, return the correct HtmlNode."""
+
+    from pyhaml_jinja.parser import Parser
+    return Parser.build_nodes(Parser.describe_html(haml, html_class=cls))
 
   @classmethod
   def _render_attributes(cls, attributes):
@@ -137,9 +328,19 @@ class HtmlNode(Node):
 
   def render_attributes(self):
     """Convenience instance-method for rendering the node's attributes."""
-    return self._render_attributes(self.attributes)
+    return self._render_attributes(self._attributes)
 
   def render_start(self):
+    if self._start is NOT_RENDERED:
+      self._start = share_string(self._render_start())
+    return self._start
+
+  def render_end(self):
+    if self._end is NOT_RENDERED:
+      self._end = share_string(self._render_end())
+    return self._end
+
+  def _render_start(self):
     tag = self.tag
     attributes = self.render_attributes()
     start = '<%s>' % ' '.join([tag, attributes]).strip()
@@ -152,41 +353,29 @@ class HtmlNode(Node):
 
     return start
 
-  def render_end(self):
+  def _render_end(self):
     return '</{tag}>'.format(tag=self.tag)
 
-  def render_lines(self, *args, **kwargs):
-    lines = super(HtmlNode, self).render_lines(*args, **kwargs)
-    if self.condensed:
-      # Check if we have at least two items and condense the first two.
-      if len(lines) >= 2:
-        first, second = lines[:2]
-        del lines[0]
-        lines[0] = first.rstrip() + second.lstrip()
-
-      # Check if we still have at least two items and condense the last two.
-      if len(lines) >= 2:
-        first, second = lines[-2:]
-        del lines[-1]
-        lines[-1] = first.rstrip() + second.lstrip()
-    return lines
-
 
 class SelfClosingHtmlNode(HtmlNode, ChildlessNode):
   """An HtmlNode that closes itself (<hr />)."""
 
-  def render_start(self):
+  __slots__ = ()
+
+  def _render_start(self):
     tag = self.tag
     attributes = self.render_attributes()
     return '<%s />' % ' '.join([tag, attributes]).strip()
 
-  def render_end(self):
+  def _render_end(self):
     return None
 
 
 class HtmlCommentNode(TextNode, ChildlessNode):
   """An Html Comment node."""
 
+  __slots__ = ()
+
   def render_start(self):
     start = super(HtmlCommentNode, self).render_start()
     return '<!-- %s -->' % start.strip()
@@ -2,7 +2,8 @@
 
 import re
 
-from pyhaml_jinja.nodes.node import Node
+from pyhaml_jinja.nodes.node import (
+    NOT_RENDERED, Node, intern_name, share_string)
 
 
 __all__ = ['JinjaNode', 'SelfClosingJinjaNode']
@@ -29,10 +30,33 @@ class JinjaNode(Node):
       'trans': ['pluralize'],
       }
 
+  __slots__ = ('_tag', '_data', '_start', '_end')
+
   def __init__(self, tag, data=None):
     super(JinjaNode, self).__init__()
-    self.tag = tag
-    self.data = data or ''
+    self._tag = intern_name(tag)
+    self.data = data
+
+  @property
+  def tag(self):
+    return self._tag
+
+  @tag.setter
+  def tag(self, tag):
+    self._tag = intern_name(tag)
+    # Tags decide which siblings extend each other, and so their end tags.
+    siblings = self.parent.get_children() if self.parent else (self, )
+    for sibling in siblings:
+      sibling.clear_rendered()
+
+  @property
+  def data(self):
+    return self._data
+
+  @data.setter
+  def data(self, data):
+    self._data = data or ''
+    self.clear_rendered()
 
   def __repr__(self):
     return '<{node_type}: {tag} {data} {children} children>'.format(
@@ -41,21 +65,26 @@ class JinjaNode(Node):
         children=len(self.get_children()))
 
   @classmethod
-  def from_haml(cls, haml):
-    """Given a line of HAML markup parse it into a Jinja node."""
+  def parse_haml(cls, haml):
+    """Split a line of HAML markup into its parts without building any nodes.
+
+    Returns a tuple of (node_class, tag, data, nested), where nested is the
+    HAML following a nesting colon, or None if the tag isn't nested.
+    """
 
     match = cls.TAG_REGEX.match(haml)
     if not match:
       raise ValueError('Text did not match %s' % cls.TAG_REGEX.pattern)
 
-    # Create the node with the proper tag.
+    # Pick the proper node type for the tag.
     tag = match.group('tag')
     if tag in cls.SELF_CLOSING_TAGS:
-      node = SelfClosingJinjaNode(tag=tag)
+      node_class = SelfClosingJinjaNode
     else:
-      node = cls(tag=tag)
+      node_class = cls
 
     data = (match.group('data') or '').strip()
+    nested = None
 
     # To handle nested expressions, we need to be sure that colons are only
     # split apart when they aren't inside brackets, braces, or quotes (both
@@ -73,12 +102,10 @@ class JinjaNode(Node):
 
     for index, char in enumerate(data):
       # If we found a colon and the stack is empty, treat it as the splitter
-      # for a nested tag. Split, re-parse the rest, attach as a child, and
+      # for a nested tag. Split off the rest (to be parsed as a child), and
       # update data to what it should be. Then break out of the loop.
       if not stack and char == ':':
-        from pyhaml_jinja.parser import Parser
-        child = Parser.parse_line(data[index+1:].strip())
-        node.add_child(child)
+        nested = data[index+1:].strip()
         data = data[:index]
         break
 
@@ -100,8 +127,14 @@ class JinjaNode(Node):
 
       # TODO: Figure out what we do with backslash escaping characters.
 
-    node.data = data
-    return node
+    return node_class, tag, data, nested
+
+  @classmethod
+  def from_haml(cls, haml):
+    """Given a line of HAML markup parse it into a Jinja node."""
+
+    from pyhaml_jinja.parser import Parser
+    return Parser.build_nodes(Parser.describe_jinja(haml, jinja_class=cls))
 
   def is_extending(self, node):
     """Determine if the current node is extending a previous node."""
@@ -110,10 +143,23 @@ class JinjaNode(Node):
 
     return self.tag in self.EXTENDING_TAGS.get(node.tag, [])
 
+  def clear_rendered(self):
+    self._start = self._end = NOT_RENDERED
+
   def render_start(self):
-    return '{%% %s %%}' % ' '.join([self.tag, self.data or '']).strip()
+    if self._start is NOT_RENDERED:
+      self._start = share_string(self._render_start())
+    return self._start
 
   def render_end(self):
+    if self._end is NOT_RENDERED:
+      self._end = share_string(self._render_end())
+    return self._end
+
+  def _render_start(self):
+    return '{%% %s %%}' % ' '.join([self.tag, self.data or '']).strip()
+
+  def _render_end(self):
     # Look at our next sibling. If they are extending us, don't return an end
     # tag.
     next_sibling = self.get_next_sibling()
@@ -121,20 +167,22 @@ class JinjaNode(Node):
         next_sibling.is_extending(self)):
       return None
 
-    # If we *are* going to close this tag, get to the root of the sibling that
-    # we are extending.
-    tag = self.tag
+    # If we *are* going to close this tag, get to the root of the chain of
+    # siblings that we are extending (-if, -elif, ..., -else) in one walk.
+    node = self
     previous_sibling = self.get_previous_sibling()
-    while self.is_extending(previous_sibling):
-      tag = previous_sibling.tag
-      previous_sibling = previous_sibling.get_previous_sibling()
+    while node.is_extending(previous_sibling):
+      node = previous_sibling
+      previous_sibling = node.get_previous_sibling()
 
-    return '{%% end%s %%}' % tag
+    return '{%% end%s %%}' % node.tag
 
 
 class SelfClosingJinjaNode(JinjaNode):
   """A Jinja tag that closes itself (-extends "base.haml")."""
 
-  def render_end(self):
+  __slots__ = ()
+
+  def _render_end(self):
     return None
 
@@ -1,9 +1,10 @@
 """Represents a line of text."""
 
 from pyhaml_jinja.nodes.node import Node
+from pyhaml_jinja.nodes.childless_node import ChildlessNode
 
 
-__all__ = ['TextNode', 'PreformattedTextNode']
+__all__ = ['TextNode', 'PreformattedTextNode', 'RawTextNode']
 
 
 class TextNode(Node):
@@ -21,10 +22,23 @@ class TextNode(Node):
   TextNode.
   """
 
+  __slots__ = ('_data', )
+
   def __init__(self, data):
-    self.data = data
+    self._data = data
     super(TextNode, self).__init__()
 
+  @property
+  def data(self):
+    return self._data
+
+  @data.setter
+  def data(self, data):
+    self._data = data
+    # An HtmlNode renders a preformatted first child in its start string.
+    if self.parent is not None:
+      self.parent.clear_rendered()
+
   def render_start(self):
     return self.data
 
@@ -32,6 +46,8 @@ class TextNode(Node):
 class PreformattedTextNode(TextNode):
   """Represents a text node with pre-formatted text."""
 
+  __slots__ = ()
+
   def get_indent(self, *args, **kwargs):
     """No matter what, ignore the indent level render_lines() wants."""
 
@@ -48,3 +64,14 @@ class PreformattedTextNode(TextNode):
     else:
       return super(PreformattedTextNode, self).render_start()
 
+
+class RawTextNode(TextNode, ChildlessNode):
+  """The whole body of a custom block, captured as a single piece of text.
+
+  The data holds one line per source line, separated by '\n' and indented
+  relative to the body; the lines are re-indented as they are rendered.
+  """
+
+  __slots__ = ()
+
+  multiline = True
@@ -0,0 +1,205 @@
+"""Precompiled template packs for read-only deployments.
+
+A pack is a single file holding the preprocessed output of a set of templates
+along with an index. Packs are built once (usually at deploy time)::
+
+    from pyhaml_jinja.pack import build_pack
+    build_pack(environment, 'templates.hamlpack')
+
+and then served through a :class:`PackLoader`, which memory-maps the file so
+that every forked worker shares the same page-cache pages::
+
+    env = Environment(loader=PackLoader('templates.hamlpack'),
+                      extensions=[HamlExtension])
+
+Templates served from a pack are never run through the HAML parser again.
+"""
+
+import json
+import mmap
+import os
+import struct
+
+from jinja2 import TemplateNotFound
+from jinja2.loaders import BaseLoader
+
+
+__all__ = ['build_pack', 'write_pack', 'TemplatePack', 'PackLoader']
+
+
+MAGIC = 'PHJPACK2'
+HEADER = struct.Struct('<8sQQ')  # Magic, index offset, index length.
+
+
+def write_pack(path, templates, indent_string, newline_string,
+               compact=False, raw_blocks=False):
+  """Write a pack file.
+
+  templates is an iterable of (name, source, filename, preprocessed) tuples,
+  where preprocessed says whether source is the output of HamlExtension.
+  Preprocessed sources are stored along with their PreprocessCache key, so
+  PackLoader recognizes them without comparing the sources themselves.
+  The file is written to a temporary path and renamed into place, so readers
+  never see a partial pack.
+  """
+
+  from pyhaml_jinja.haml_extension import PreprocessCache
+
+  index = {}
+  temp_path = '%s.%d.tmp' % (path, os.getpid())
+
+  try:
+    with open(temp_path, 'wb') as pack_file:
+      pack_file.write(HEADER.pack(MAGIC, 0, 0))
+      offset = HEADER.size
+
+      for name, source, filename, preprocessed in templates:
+        data = source.encode('utf-8')
+        pack_file.write(data)
+        key = None
+        if preprocessed:
+          key = PreprocessCache.make_key(source, indent_string,
+                                         newline_string, compact, raw_blocks)
+        index[name] = [offset, len(data), filename, bool(preprocessed), key]
+        offset += len(data)
+
+      index_data = json.dumps({
+          'indent_string': indent_string,
+          'newline_string': newline_string,
+          'compact': compact,
+          'raw_blocks': raw_blocks,
+          'templates': index,
+          })
+      pack_file.write(index_data)
+      pack_file.seek(0)
+      pack_file.write(HEADER.pack(MAGIC, offset, len(index_data)))
+  except Exception:
+    os.remove(temp_path)
+    raise
+
+  os.rename(temp_path, path)
+
+
+def build_pack(environment, path, names=None):
+  """Preprocess templates from environment's loader and write them to path.
+
+  By default every template with one of the HAML file extensions is packed;
+  pass names to choose the templates explicitly. Returns the packed names.
+  """
+
+  from pyhaml_jinja.haml_extension import get_haml_extension
+
+  extension = get_haml_extension(environment)
+
+  if names is None:
+    file_extensions = [ext.lstrip('.')
+                       for ext in environment.haml_file_extensions]
+    names = environment.list_templates(extensions=file_extensions)
+
+  def iter_templates():
+    for name in names:
+      source, filename, _ = environment.loader.get_source(environment, name)
+      is_haml = (os.path.splitext(name)[1] in
+                 environment.haml_file_extensions)
+      if is_haml:
+        source = extension.get_preprocessed_source(source, name, filename)
+      yield name, source, filename, is_haml
+
+  write_pack(path, iter_templates(), environment.haml_indent_string,
+             environment.haml_newline_string, environment.haml_compact,
+             environment.haml_raw_blocks)
+  return list(names)
+
+
+class TemplatePack(object):
+  """Read-only, memory-mapped view of a pack file."""
+
+  def __init__(self, path):
+    self.path = path
+
+    with open(path, 'rb') as pack_file:
+      self._map = mmap.mmap(pack_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, index_offset, index_length = HEADER.unpack(
+        self._map[:HEADER.size])
+    if magic != MAGIC:
+      raise ValueError('%s is not a template pack.' % path)
+
+    index = json.loads(self._map[index_offset:index_offset + index_length])
+    self.indent_string = index['indent_string']
+    self.newline_string = index['newline_string']
+    self.compact = index.get('compact', False)
+    self.raw_blocks = index.get('raw_blocks', False)
+    self._index = index['templates']
+
+  def __contains__(self, name):
+    return name in self._index
+
+  def __len__(self):
+    return len(self._index)
+
+  def names(self):
+    """Return the sorted list of template names in the pack."""
+    return sorted(self._index)
+
+  def get(self, name):
+    """Return (source, filename, preprocessed) for name.
+
+    Raises KeyError if the template isn't in the pack.
+    """
+    offset, length, filename, preprocessed, _ = self._index[name]
+    source = self._map[offset:offset + length].decode('utf-8')
+    return source, filename, preprocessed
+
+  def get_key(self, name):
+    """Return the PreprocessCache key of name's preprocessed source.
+
+    Returns None if the template isn't in the pack or wasn't preprocessed.
+    """
+    entry = self._index.get(name)
+    return entry and entry[4]
+
+  def close(self):
+    self._map.close()
+
+
+class PackLoader(BaseLoader):
+  """Jinja loader serving templates straight out of a TemplatePack."""
+
+  def __init__(self, pack):
+    if not isinstance(pack, TemplatePack):
+      pack = TemplatePack(pack)
+    self.pack = pack
+
+  def get_source(self, environment, template):
+    try:
+      source, filename, preprocessed = self.pack.get(template)
+    except KeyError:
+      raise TemplateNotFound(template)
+
+    if preprocessed and (
+        getattr(environment, 'haml_indent_string', None) !=
+        self.pack.indent_string or
+        getattr(environment, 'haml_newline_string', None) !=
+        self.pack.newline_string or
+        getattr(environment, 'haml_compact', False) != self.pack.compact or
+        getattr(environment, 'haml_raw_blocks', False) !=
+        self.pack.raw_blocks):
+      raise RuntimeError('Template pack %s was built with different HAML '
+                         'settings than this environment.' % self.pack.path)
+
+    return source, filename, lambda: True
+
+  def get_preprocessed(self, name, source, key):
+    """Return source if it is the preprocessed output packed for name.
+
+    key is the digest of source and the HAML settings in use (see
+    PreprocessCache.make_key), which the pack stores for every preprocessed
+    template. HamlExtension calls this before running the HAML pipeline.
+    """
+    if key is not None and self.pack.get_key(name) == key:
+      return source
+    return None
+
+  def list_templates(self):
+    return self.pack.names()
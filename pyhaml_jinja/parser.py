@@ -3,6 +3,7 @@
 import re
 
 from pyhaml_jinja.errors import TemplateIndentationError, TemplateSyntaxError
+from pyhaml_jinja.line_index import LineIndex
 from pyhaml_jinja import nodes
 
 
@@ -18,42 +19,83 @@ class Parser(object):
   ESCAPE_PREFIX = '\\'  # Backslash to use a special prefix character.
   CUSTOM_BLOCK_PREFIX = ':'  # Use colon to start custom block nodes.
 
-  def __init__(self, source):
+  # Number of distinct lines whose descriptions are memoized (0 disables it).
+  DESCRIPTION_CACHE_SIZE = 2048
+
+  # Value of raw_blocks wrapping raw custom block bodies in {% raw %}.
+  RAW_BLOCKS_JINJA = 'jinja'
+
+  INTERPOLATION_REGEX = re.compile(r'#{(.+?)}')
+  # A line and its newline, with the text between its leading and trailing
+  # whitespace (as str.strip() and unicode.strip() see it) in group 1.
+  LINE_REGEX = re.compile(r'[^\S\n]*((?:[^\n]*\S)?)[^\S\n]*\n?')
+  UNICODE_LINE_REGEX = re.compile(r'[^\S\n]*((?:[^\n]*\S)?)[^\S\n]*\n?',
+                                  re.UNICODE)
+
+  def __init__(self, source, flat=False, stats=None, raw_blocks=False):
+    # See get_source_lines() for raw_blocks.
     self.source = source
-    self.tree = self.build_tree(source)
+    build = self.build_flat_tree if flat else self.build_tree
+
+    if stats is None:
+      self.tree = build(source, source_lines=self.index_source_lines(
+          source, raw_blocks=raw_blocks))
+    else:
+      with stats.phase(stats.LINES):
+        source_lines = self.index_source_lines(source,
+                                               raw_blocks=raw_blocks)
+      with stats.phase(stats.TREE):
+        self.tree = build(source, source_lines=source_lines)
+      stats.node_count = self.count_nodes()
+
+  def count_nodes(self):
+    """Return the number of nodes in the tree, not counting the root."""
+
+    if not isinstance(self.tree, nodes.Node):
+      return len(self.tree) - 1  # A FlatTree.
+
+    count = 0
+    node_stack = list(self.tree.get_children())
+    while node_stack:
+      node = node_stack.pop()
+      count += 1
+      node_stack.extend(node.get_children())
+    return count
 
   @classmethod
-  def build_tree(cls, source_text):
-    """Given HAML source text, parse it into a tree of Nodes."""
+  def iter_line_levels(cls, source_lines, first_line_number=1):
+    """Yield (line_number, line, level) for every non-blank source line.
 
-    source_lines = cls.get_source_lines(source_text)
+    source_lines is a list of lines or a LineIndex. level is the number of
+    lines the line is nested under, so top-level lines have a level of 0.
+    Raises TemplateIndentationError for lines that don't line up with any of
+    their parents.
+    """
 
-    root = nodes.Node()
-    indent_stack = [-1]
-    node_stack = [root]
+    if isinstance(source_lines, LineIndex):
+      # The index knows which lines are blank, and most of the indentation.
+      lines = source_lines.iter_indented_lines(first_line_number)
+    else:
+      lines = ((line_number, line, None) for line_number, line in enumerate(
+          source_lines, start=first_line_number) if line.strip())
 
-    for line_number, line in enumerate(source_lines, start=1):
+    indent_stack = [-1]
 
-      # Ignore all the blank (or whitespace only) lines.
-      if not line.strip():
-        continue
+    for line_number, line, indent in lines:
 
       # Figure out how far indented the current line is.
-      try:
-        indent = cls.get_indent_level(line)
-      except Exception, exception:
-        raise TemplateIndentationError(exception.message, line_number)
+      if indent is None:
+        try:
+          indent = cls.get_indent_level(line)
+        except Exception, exception:
+          raise TemplateIndentationError(exception.message, line_number)
 
-      # Either increase the indentation level, or pop nodes off to
-      # de-dent.
+      # Either increase the indentation level, or pop levels off to de-dent.
       if indent > indent_stack[-1]:
         indent_stack.append(indent)
       else:
         while indent < indent_stack[-1]:
           indent_stack.pop()
-          node_stack.pop()
-
-        node_stack.pop()
 
       # If the top of the indent stack isn't the same as this line, then
       # something went wrong.
@@ -62,29 +104,68 @@ class Parser(object):
             'Unindent does not match any outer indentation level!',
             line_number)
 
+      yield line_number, line, len(indent_stack) - 2
+
+  @classmethod
+  def build_tree(cls, source_text, source_lines=None):
+    """Given HAML source text, parse it into a tree of Nodes.
+
+    source_lines can be passed in if index_source_lines() was already
+    called.
+    """
+
+    if source_lines is None:
+      source_lines = cls.index_source_lines(source_text)
+
+    root = nodes.Node()
+    cls.build_subtree(root, source_lines)
+    return root
+
+  @classmethod
+  def build_subtree(cls, parent, source_lines, first_line_number=1,
+                    line_nodes=None):
+    """Parse source lines into children of parent.
+
+    first_line_number is the line number of source_lines[0], for errors. If
+    line_nodes is given, it should be a list as long as source_lines, and its
+    items are set to the (outermost, innermost) nodes built for every line.
+    """
+
+    node_stack = [parent]
+    # Whether the nodes on the stack are (or are inside) custom blocks.
+    in_custom_block_stack = [
+        isinstance(parent, nodes.CustomBlockNode) or
+        parent.has_ancestor_of_type(nodes.CustomBlockNode)]
+
+    for line_number, line, level in cls.iter_line_levels(
+        source_lines, first_line_number=first_line_number):
+
+      # Pop nodes off until our parent is on top of the stack.
+      del node_stack[level + 1:]
+      del in_custom_block_stack[level + 1:]
+
       # The top of the node stack is what we'll consider the 'parent'.
       parent_node = node_stack[-1]
+      in_custom_block = in_custom_block_stack[-1]
 
-      # If we are part of a custom block, don't try to parse anything but
-      # instead treat it all as text.
-      if (isinstance(parent_node, nodes.CustomBlockNode) or
-          parent_node.has_ancestor_of_type(nodes.CustomBlockNode)):
-        node = nodes.TextNode(line.strip())
-
-      # Otherwise, turn this line into a proper Node.
-      else:
-        try:
-          node = cls.parse_line(line.strip())
-        except Exception, exception:
-          raise TemplateSyntaxError(exception.message, line_number)
+      # Turn this line into a proper Node (or chain of nodes).
+      try:
+        node = cls.build_nodes(
+            cls.describe_source_line(line, in_custom_block))
+      except Exception, exception:
+        raise TemplateSyntaxError(exception.message, line_number)
 
       # If this was a nested line, we should have a chain of single children
       # for as many levels as nested tags.
       # 'child' should be the node we put on the top of the node stack, and
       # 'node' should be appended to the current node stack.
       child = node
+      in_custom_block = (in_custom_block or
+                         isinstance(child, nodes.CustomBlockNode))
       while child.has_children():
         child = child.get_children()[0]
+        in_custom_block = (in_custom_block or
+                           isinstance(child, nodes.CustomBlockNode))
 
       # If children aren't allowed and we're indenting, throw an error.
       if not parent_node.children_allowed():
@@ -95,8 +176,82 @@ class Parser(object):
       # Insert the child as always and move down the tree.
       parent_node.add_child(node)
       node_stack.append(child)
+      in_custom_block_stack.append(in_custom_block)
 
-    return root
+      if line_nodes is not None:
+        line_nodes[line_number - first_line_number] = (node, child)
+
+  @classmethod
+  def build_flat_tree(cls, source_text, source_lines=None):
+    """Given HAML source text, parse it into a FlatTree.
+
+    This accepts (and rejects) exactly the same templates as build_tree(),
+    but never creates Node objects.
+    """
+
+    from pyhaml_jinja.flat_tree import FlatTree
+
+    if source_lines is None:
+      source_lines = cls.index_source_lines(source_text)
+
+    tree = FlatTree()
+    # Pairs of (node index, inside a custom block) for the open lines.
+    index_stack = [(0, False)]
+
+    for line_number, line, level in cls.iter_line_levels(source_lines):
+
+      # Pop nodes off until our parent is on top of the stack.
+      del index_stack[level + 1:]
+      parent_index, in_custom_block = index_stack[-1]
+
+      try:
+        description = cls.describe_source_line(line, in_custom_block)
+      except Exception, exception:
+        raise TemplateSyntaxError(exception.message, line_number)
+
+      # If children aren't allowed and we're indenting, throw an error.
+      parent_kind = tree.kinds[parent_index]
+      if parent_kind in FlatTree.CHILDLESS_KINDS:
+        raise TemplateSyntaxError(
+            'Node of type %s cannot have children.' % (
+              FlatTree.KIND_CLASSES[parent_kind]),
+            line_number)
+
+      try:
+        child_index = tree.add_description(parent_index, description)
+      except KeyError, exception:
+        raise TemplateSyntaxError(exception.message, line_number)
+
+      in_custom_block = in_custom_block or any(
+          issubclass(node_class, nodes.CustomBlockNode)
+          for node_class, _, _ in description)
+      index_stack.append((child_index, in_custom_block))
+
+    return tree
+
+  @classmethod
+  def describe_source_line(cls, line, in_custom_block=False):
+    """Describe a line as returned by get_source_lines() (with indentation).
+
+    If we are part of a custom block, don't try to parse anything but instead
+    treat it all as text. Lines carrying a raw custom block body (see
+    get_source_lines()) get a RawTextNode with the body as their innermost
+    node.
+    """
+
+    body = None
+    if '\n' in line:
+      line, _, body = line.partition('\n')
+
+    line = line.strip()
+    if in_custom_block:
+      description = ((nodes.TextNode, (line, ), ()), )
+    else:
+      description = cls.describe_line(line)
+
+    if body is not None:
+      description += ((nodes.RawTextNode, (body, ), ()), )
+    return description
 
   @classmethod
   def parse_line(cls, line):
@@ -105,24 +260,141 @@ class Parser(object):
     This method doesn't care about indentation, so line should be stripped
     of whitespace beforehand.
     """
+    return cls.build_nodes(cls.describe_line(line))
+
+  @classmethod
+  def describe_line(cls, line):
+    """Parse a given line into a description of its nodes.
+
+    A description is a tuple with one (node_class, args, attribute_pairs)
+    entry per node on the line, outermost first. Each node is the only child
+    of the node before it (as in '%div: %p text'). build_nodes() turns a
+    description into real nodes, while the Compiler renders straight from it.
+
+    This method doesn't care about indentation, so line should be stripped
+    of whitespace beforehand.
+
+    Descriptions are immutable, and templates repeat lines like '%li' or
+    '-else' all the time, so the descriptions of up to DESCRIPTION_CACHE_SIZE
+    tag lines are memoized (the cache starts over when it fills up).
+    """
+
+    # Other lines are cheap to describe, and mostly unique.
+    if not line or line[0] not in (cls.HTML_TAG_PREFIX, '.', '#',
+                                   cls.JINJA_TAG_PREFIX):
+      return cls._describe_line(line)
+
+    # Byte and unicode strings are kept apart, so a description never holds
+    # strings of the other type.
+    caches = cls.__dict__.get('_descriptions')
+    if caches is None:
+      caches = cls._descriptions = {str: {}, unicode: {}}
+    descriptions = caches.get(type(line))
+    if descriptions is None:
+      return cls._describe_line(line)
+
+    description = descriptions.get(line)
+    if description is None:
+      description = cls._describe_line(line)
+      if cls.DESCRIPTION_CACHE_SIZE > 0:
+        if len(descriptions) >= cls.DESCRIPTION_CACHE_SIZE:
+          descriptions.clear()
+        descriptions[line] = description
+    return description
+
+  @classmethod
+  def clear_description_cache(cls):
+    """Forget the memoized descriptions of lines (see describe_line)."""
+
+    for descriptions in cls.__dict__.get('_descriptions', {}).itervalues():
+      descriptions.clear()
+
+  @classmethod
+  def _describe_line(cls, line):
+    """Describe a line, without going through the cache."""
+
     if not line:
-      node = nodes.EmptyNode()
+      description = ((nodes.EmptyNode, (), ()), )
     elif line[0] in (cls.HTML_TAG_PREFIX, '.', '#'):
-      node = nodes.HtmlNode.from_haml(line)
+      description = cls.describe_html(line)
     elif line[0] in (cls.HTML_COMMENT_PREFIX, ):
-      node = nodes.HtmlCommentNode(line[1:])
+      description = ((nodes.HtmlCommentNode, (line[1:], ), ()), )
     elif line[0] in (cls.JINJA_TAG_PREFIX, ):
-      node = nodes.JinjaNode.from_haml(line)
+      description = cls.describe_jinja(line)
     elif line[0] in (cls.CUSTOM_BLOCK_PREFIX, ):
-      node = nodes.CustomBlockNode(line[1:])
+      if line[1:] not in nodes.CustomBlockNode.BLOCK_TYPES:
+        raise ValueError('Unknown custom block type: "%s".' % line[1:])
+      description = ((nodes.CustomBlockNode, (line[1:], ), ()), )
     elif line[0] in (cls.PREFORMATTED_PREFIX, ):
-      node = nodes.PreformattedTextNode(line[1:])
+      description = ((nodes.PreformattedTextNode, (line[1:], ), ()), )
     elif line[0] in (cls.ESCAPE_PREFIX, ):
-      node = nodes.TextNode(line[1:])
+      description = ((nodes.TextNode, (line[1:], ), ()), )
     else:
-      node = nodes.TextNode(line)
+      description = ((nodes.TextNode, (line, ), ()), )
 
-    return node
+    return description
+
+  @classmethod
+  def describe_html(cls, line, html_class=nodes.HtmlNode):
+    """Describe a line starting with an HTML tag (see describe_line)."""
+
+    node_class, tag, condensed, attribute_pairs, nested, content = (
+        html_class.parse_haml(line))
+    head = ((node_class, (tag, None, condensed), tuple(attribute_pairs)), )
+
+    # Duplicate attributes are reported before anything else on the line.
+    # Building the node raises the error, describing the node as it was when
+    # the attribute was added again.
+    keys = [key for key, _ in attribute_pairs if key != 'class']
+    if len(set(keys)) != len(keys):
+      cls.build_nodes(head)
+
+    # If we are nesting tags, parse the content as a separate HAML line and
+    # append the parsed child to the current node.
+    if nested:
+      description = cls.describe_line(content)
+      if issubclass(node_class, nodes.ChildlessNode):
+        # Raises the error for adding a child to a childless node.
+        cls.build_nodes(head).add_child(cls.build_nodes(description))
+      return head + description
+
+    # If we aren't nesting and just have content, append it to the node if
+    # possible.
+    elif content:
+      if issubclass(node_class, nodes.ChildlessNode):
+        raise ValueError('Inline content ("%s") not permitted on node %s' % (
+          content, cls.build_nodes(head)))
+      return head + ((nodes.TextNode, (content, ), ()), )
+
+    return head
+
+  @classmethod
+  def describe_jinja(cls, line, jinja_class=nodes.JinjaNode):
+    """Describe a line starting with a Jinja tag (see describe_line)."""
+
+    node_class, tag, data, nested = jinja_class.parse_haml(line)
+    head = ((node_class, (tag, data), ()), )
+    if nested is not None:
+      return head + cls.describe_line(nested)
+    return head
+
+  @classmethod
+  def build_nodes(cls, description):
+    """Build the chain of nodes in a description, returning the outermost."""
+
+    top = parent = None
+    for node_class, args, attribute_pairs in description:
+      node = node_class(*args)
+      for key, value in attribute_pairs:
+        node.add_attribute(key, value)
+
+      if parent is None:
+        top = node
+      else:
+        parent.add_child(node)
+      parent = node
+
+    return top
 
   @classmethod
   def get_indent_level(cls, line):
@@ -138,56 +410,182 @@ class Parser(object):
     return indent
 
   @classmethod
-  def get_source_lines(cls, source_text):
+  def get_source_lines(cls, source_text, raw_blocks=False):
     """Takes a chunk of text and parses it into a list of lines.
 
     This method is also responsible for merging continued-lines into a single
     line, stripping comments, and all sorts of other pre-processing.
+
+    With raw_blocks, the body of a custom block on a line of its own (such as
+    ':javascript') is passed through as it is: the lines nested under the
+    block are appended to its line in one piece, joined by '\n' and with
+    their common indentation removed, and replaced by blank lines. The body
+    isn't parsed at all, so #{...}, comments and continuations in it are left
+    alone. With raw_blocks=RAW_BLOCKS_JINJA, the body is also wrapped in
+    {% raw %} ... {% endraw %}, so Jinja doesn't look inside it either.
     """
 
-    source_lines = (source_text or '').rstrip().split('\n')
-    lines = []
-    line_builder = []
+    return list(cls.index_source_lines(source_text, raw_blocks=raw_blocks))
 
-    for line in source_lines:
-      line = line.rstrip()  # Remove trailing whitespace.
+  @classmethod
+  def index_source_lines(cls, source_text, raw_blocks=False):
+    """Like get_source_lines(), but return a LineIndex of the lines.
+
+    The source is walked by offsets, and only the lines that are changed
+    (continued lines and raw custom blocks) are copied; every stage reading
+    lines out of the index gets them one at a time.
+    """
 
-      # Handle Jinja variables.
-      line = re.sub(r'#{(.+?)}', r'{{ \1 }}', line)
+    source_text = source_text or ''
+    index = LineIndex(source_text, cls.interpolate)
+    line_builder = []
+
+    block_lines = None
+    if raw_blocks:
+      block_lines = frozenset(
+          cls.CUSTOM_BLOCK_PREFIX + block_type
+          for block_type in nodes.CustomBlockNode.BLOCK_TYPES)
+
+    line_regex = cls.LINE_REGEX
+    if isinstance(source_text, unicode):
+      line_regex = cls.UNICODE_LINE_REGEX
+
+    # The index is appended to directly, as this runs for every line.
+    add_kind, add_start = index.kinds.append, index.starts.append
+    add_end, add_indent = index.ends.append, index.indents.append
+    BLANK, SOURCE = LineIndex.BLANK, LineIndex.SOURCE
+    INTERPOLATED = LineIndex.INTERPOLATED
+    find, count = source_text.find, source_text.count
+    LINE_COMMENT, LINE_CONTINUATION = cls.LINE_COMMENT, cls.LINE_CONTINUATION
+
+    # Trailing whitespace is left out, as source_text.rstrip() would.
+    text_end = len(source_text)
+    while text_end and source_text[text_end - 1].isspace():
+      text_end -= 1
+
+    line_count = 0
+    body_end = 0  # The offset of the line after the current raw block body.
+    for match in line_regex.finditer(source_text, 0, text_end):
+      start, line_end = match.span()
+      # The line without its leading and trailing whitespace.
+      text_start, end = match.span(1)
+      line_count += 1
+
+      # The lines of a raw custom block body are blank.
+      if start < body_end:
+        index.add_blank_lines()
 
       # Handle comment lines (Jinja comments should be done as usual).
-      if line.strip().startswith(cls.LINE_COMMENT):
-        lines.append('')
+      elif text_start < end and source_text[text_start] == LINE_COMMENT:
+        index.add_blank_lines()
 
       # Make sure to handle line-continuations.
       # If the current line ends in a continuation, strip and append to the
       # builder.
-      elif line.endswith(cls.LINE_CONTINUATION):
+      elif text_start < end and source_text[end - 1] == LINE_CONTINUATION:
+        line = cls.interpolate(source_text[start:end])
         line_builder.append(line[:-1].rstrip())
 
       # If the line *doesn't* end in a continuation, but we have data in the
       # builder, wrap things up.
       elif line_builder:
         # Append the current line to the builder.
-        line_builder.append(line.strip())
-
-        # Append the 'built' line.
-        lines.append(' '.join(line_builder))
+        line_builder.append(cls.interpolate(source_text[text_start:end]))
 
-        # Append blank lines for debugging.
-        lines.extend([''] * (len(line_builder) - 1))
+        # Append the 'built' line, and blank lines for debugging.
+        index.add_string(' '.join(line_builder))
+        index.add_blank_lines(len(line_builder) - 1)
 
         # Reset the builder.
         line_builder = []
 
+      elif text_start == end:
+        index.add_blank_lines()
+
       else:
-        lines.append(line)
+        # Handle Jinja variables (when the line is read out of the index).
+        add_kind(INTERPOLATED if find('#{', start, end) != -1 else SOURCE)
+        add_start(start)
+        add_end(end)
+
+        # Indentation is counted as Parser.get_indent_level() does, which
+        # is left for later if it mixes tabs and spaces (or other whitespace).
+        indent = text_start - start
+        if indent:
+          character = source_text[start]
+          if (character not in ' \t' or
+              count(character, start, text_start) != indent):
+            indent = -1
+        add_indent(indent)
+
+        if (block_lines is not None and
+            source_text[text_start] == cls.CUSTOM_BLOCK_PREFIX and
+            source_text[text_start:end] in block_lines):
+          body, body_end = cls._capture_block_body(
+              source_text, line_end, text_end, text_start - start,
+              raw_blocks, line_regex.match)
+          if body is not None:
+            index.set_string(len(index) - 1,
+                             '%s\n%s' % (source_text[start:end], body))
+
+      # The last line is followed by an empty match.
+      if line_end == text_end:
+        break
 
     # The line_builder should be empty. If it isn't it means that we started
     # a line-continuation on the last line.
     if line_builder:
       raise TemplateSyntaxError('Unfinished line continuation found!',
-                                len(source_lines))
+                                line_count)
 
-    return lines
+    return index
+
+  @classmethod
+  def interpolate(cls, line):
+    """Handle Jinja variables, replacing #{...} with {{ ... }}."""
+
+    if '#{' in line:
+      line = cls.INTERPOLATION_REGEX.sub(r'{{ \1 }}', line)
+    return line
+
+  @classmethod
+  def _capture_block_body(cls, source_text, position, text_end, block_indent,
+                          raw_blocks, match_line):
+    """Return the body of a custom block, in one piece.
+
+    position is the offset of the line after the block, text_end that of the
+    end of the source (without trailing whitespace) and block_indent the
+    indentation of the block; match_line is LINE_REGEX.match (or its unicode
+    version). Returns a (body, end) tuple, with the offset of the first line
+    after the body; body is None if the block has no body.
+    """
 
+    # The body goes on until the first line that isn't indented any further
+    # than the block, leaving out blank lines at either end.
+    lines = []  # (start, end) of the lines from the first non-blank one on.
+    line_count = 0  # The number of them up to the last non-blank one.
+    body_end = position
+    indent = None
+    while position < text_end:
+      match = match_line(source_text, position, text_end)
+      text_start, end = match.span(1)
+
+      if text_start < end:
+        line_indent = text_start - position
+        if line_indent <= block_indent:
+          break
+        indent = line_indent if indent is None else min(indent, line_indent)
+        line_count = len(lines) + 1
+        body_end = match.end()
+      if indent is not None:
+        lines.append((position, end if text_start < end else position))
+      position = match.end()
+
+    if indent is None:
+      return None, body_end
+
+    body = '\n'.join(source_text[start + indent:end]
+                     for start, end in lines[:line_count])
+    if raw_blocks == cls.RAW_BLOCKS_JINJA:
+      body = '{%% raw %%}\n%s\n{%% endraw %%}' % body
+    return body, body_end
@@ -1,24 +1,132 @@
 """Given a tree of nodes, render into a string."""
 
+from pyhaml_jinja import compact as compact_output
+from pyhaml_jinja import nodes
+from pyhaml_jinja import static
 from pyhaml_jinja.parser import Parser
 
 
 class Renderer(object):
   """Uses a Parser to build a tree, and then properly renders it."""
 
-  def __init__(self, source, newline_string=None, indent_string=None):
-    self.parser = Parser(source)
+  def __init__(self, source, newline_string=None, indent_string=None,
+               flat=False, stats=None, compact=False, raw_blocks=False):
+    # With flat=True the source is parsed into a pyhaml_jinja.flat_tree
+    # FlatTree instead of Node objects; the output is the same.
+    # stats is an optional pyhaml_jinja.stats.TemplateStats, which gets the
+    # timings of every phase along with the node count and output size.
+    # With compact=True the output has no indentation and no insignificant
+    # whitespace (see pyhaml_jinja.compact); newline_string is only used
+    # where line breaks matter, and defaults to '\n'.
+    # With raw_blocks, custom block bodies are passed through unparsed (see
+    # Parser.get_source_lines).
+    # stats also get the node count and output size of the static subtrees
+    # (see pyhaml_jinja.static), except for flat trees and compact output.
     self.newline_string = newline_string or ''
     self.indent_string = indent_string or ''
+    self.stats = stats
+    self.compact = compact
+    self.parser = None
+    self.tree = self.build_tree(source, flat=flat, raw_blocks=raw_blocks)
 
-  def render(self):
-    """Renders the current source tree into an HTML string."""
+    if stats is not None and not flat and not compact:
+      with stats.phase(stats.STATIC):
+        stats.static_node_count, stats.static_size = (
+            static.measure_static_subtrees(self.tree, self.indent_string,
+                                           self.newline_string))
+
+  def build_tree(self, source, flat=False, raw_blocks=False):
+    """Parses source, returning the tree to render.
+
+    The Parser is kept in self.parser. Subclasses can override this to build
+    the tree some other way.
+    """
+
+    self.parser = Parser(source, flat=flat, stats=self.stats,
+                         raw_blocks=raw_blocks)
+    return self.parser.tree
+
+  def iter_lines(self, replacements=None):
+    """Renders the current source tree, yielding one line at a time.
+
+    replacements is passed on to Node.iter_lines().
+    """
 
     # Since the root node has no indentation, kick off the indentation level
     # at -1.
-    lines = self.parser.tree.render_lines(indent_string=self.indent_string,
-                                          indent_level=-1)
-    return self.newline_string.join(lines)
+    if replacements is None:
+      return self.tree.iter_lines(indent_string=self.indent_string,
+                                  indent_level=-1)
+    return self.tree.iter_lines(indent_string=self.indent_string,
+                                indent_level=-1, replacements=replacements)
+
+  def iter_compact_pieces(self):
+    """Renders the current source tree into compact pieces."""
+
+    tree = self.tree
+    if isinstance(tree, nodes.Node):
+      return compact_output.iter_node_pieces(tree)
+    return tree.iter_compact_pieces()
+
+  def render(self):
+    """Renders the current source tree into an HTML string."""
+
+    if self.stats is None:
+      return self._render()
+
+    with self.stats.phase(self.stats.RENDER):
+      output = self._render()
+    self.stats.output_size = len(output)
+    return output
+
+  def _render(self):
+    if self.compact:
+      return ''.join(compact_output.iter_output(self.iter_compact_pieces(),
+                                                self.newline_string))
+    return self.newline_string.join(self.iter_lines())
+
+  def render_to(self, write):
+    """Renders the current source tree, streaming it to write.
+
+    write can be a callable taking a string, or any object with a write()
+    method (a file, io.StringIO, ...). Nothing is buffered, so the output
+    never has to be held in memory as a whole.
+    """
+
+    write = getattr(write, 'write', write)
+    newline_string = self.newline_string
+
+    if self.stats is not None:
+      with self.stats.phase(self.stats.RENDER):
+        self.stats.output_size = self._render_to(write, newline_string)
+    else:
+      self._render_to(write, newline_string)
+
+  def _render_to(self, write, newline_string):
+    """Write the lines and separators out, returning the output size."""
+
+    size = 0
+
+    if self.compact:
+      for string in compact_output.iter_output(self.iter_compact_pieces(),
+                                               newline_string):
+        write(string)
+        size += len(string)
+      return size
+
+    lines = self.iter_lines()
+    for line in lines:
+      write(line)
+      size += len(line)
+      break
+
+    for line in lines:
+      if newline_string:
+        write(newline_string)
+      write(line)
+      size += len(newline_string) + len(line)
+
+    return size
 
 
 def render(source, newline_string='\n', indent_string='  '):
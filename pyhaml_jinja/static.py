@@ -0,0 +1,103 @@
+"""Detection of static subtrees.
+
+A subtree is static when it renders to the same text on every request: it
+has no JinjaNode, and none of its nodes renders Jinja syntax ({{, {% or {#)
+of its own. Jinja keeps all of the text between two of its tags as a single
+piece of template data, so static subtrees cost nothing per request once a
+template is compiled; measure_static_subtrees() tells how much of a template
+they make up.
+"""
+
+from pyhaml_jinja import nodes
+
+
+__all__ = ['is_static_string', 'iter_static_subtrees',
+           'measure_static_subtrees']
+
+
+JINJA_SYNTAX = ('{{', '{%', '{#')
+
+
+def is_static_string(string):
+  """Return whether a start or end string can be part of a static subtree."""
+
+  if string is None:
+    return True
+  # An empty line wouldn't come out the same once re-indented.
+  if not string:
+    return False
+  return not ('{' in string and
+              any(syntax in string for syntax in JINJA_SYNTAX))
+
+
+def _is_static_node(node):
+  """Return whether node renders static text that can be re-indented."""
+
+  # Static subtrees are measured by rendering them at level 0 (see
+  # measure_static_subtrees), which preformatted text doesn't allow: it
+  # ignores the indentation it is rendered at.
+  if isinstance(node, (nodes.JinjaNode, nodes.PreformattedTextNode)):
+    return False
+  return (is_static_string(node.render_start()) and
+          is_static_string(node.render_end()))
+
+
+def iter_static_subtrees(tree):
+  """Yield (node, level, node_count) for the static subtrees of tree.
+
+  Only the outermost static subtrees are yielded, in the order they render,
+  level being the indent level they render at (the children of tree are at
+  level 0) and node_count the number of nodes in them.
+  """
+
+  # Every node comes before its children in order, so going through it
+  # backwards counts the nodes of every static subtree (None for the others)
+  # children first.
+  order = []
+  stack = [tree]
+  while stack:
+    node = stack.pop()
+    order.append(node)
+    stack.extend(node.children)
+
+  counts = {id(tree): None}
+  for node in reversed(order[1:]):
+    count = None
+    if _is_static_node(node):
+      count = 1
+      for child in node.children:
+        child_count = counts[id(child)]
+        if child_count is None:
+          count = None
+          break
+        count += child_count
+    counts[id(node)] = count
+
+  stack = [(child, 0) for child in reversed(tree.get_children())]
+  while stack:
+    node, level = stack.pop()
+    count = counts[id(node)]
+    if count is not None:
+      yield node, level, count
+    else:
+      stack.extend((child, level + 1)
+                   for child in reversed(node.get_children()))
+
+
+def measure_static_subtrees(tree, indent_string=None, newline_string=None):
+  """Return (node_count, size) for the static subtrees of tree.
+
+  node_count is the number of nodes in static subtrees, and size the size of
+  their part of the output (with a newline_string after every line).
+  """
+
+  indent_string = indent_string or ''
+  newline_length = len(newline_string or '')
+  node_count = size = 0
+  for node, level, count in iter_static_subtrees(tree):
+    node_count += count
+    indent = level * len(indent_string)
+    for line in node.render_lines(indent_string=indent_string,
+                                  indent_level=0):
+      size += len(line) + newline_length + (indent if line else 0)
+  return node_count, size
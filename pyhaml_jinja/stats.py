@@ -0,0 +1,73 @@
+"""Timing and size statistics for preprocessed templates."""
+
+import contextlib
+import time
+
+
+__all__ = ['TemplateStats']
+
+
+# Python 2 has neither time.perf_counter nor time.process_time; time.clock is
+# the process CPU time on Unix.
+_wall_clock = getattr(time, 'perf_counter', time.time)
+_cpu_clock = getattr(time, 'process_time', None) or time.clock
+
+
+class TemplateStats(object):
+  """Collects per-phase timings, node count and output size for a template.
+
+  Pass an instance as the stats argument of Renderer or Compiler (or set
+  haml_stats_callback on a HamlExtension environment to get one per template).
+  Timings are in seconds and keyed by phase:
+
+  - 'lines': reading the source into lines (Parser.index_source_lines).
+  - 'tree': building the node tree (Renderer only).
+  - 'static': measuring the static subtrees (Renderer only).
+  - 'render': producing the output lines.
+
+  Both also set static_node_count and static_size, the number of nodes in
+  static subtrees and the size of their part of the output (see
+  pyhaml_jinja.static), unless the tree is flat or the output compact.
+  Compiler measures them while rendering, so it has no 'static' timing.
+  """
+
+  LINES = 'lines'
+  TREE = 'tree'
+  STATIC = 'static'
+  RENDER = 'render'
+
+  def __init__(self, name=None):
+    self.name = name
+    self.wall_times = {}
+    self.cpu_times = {}
+    self.node_count = None
+    self.output_size = None
+    self.static_node_count = None
+    self.static_size = None
+
+  def __repr__(self):
+    return '<TemplateStats %s: %.6fs, %s nodes, %s bytes>' % (
+        self.name, self.wall_time, self.node_count, self.output_size)
+
+  @property
+  def wall_time(self):
+    """Total wall time spent in all phases."""
+    return sum(self.wall_times.values())
+
+  @property
+  def cpu_time(self):
+    """Total CPU time spent in all phases."""
+    return sum(self.cpu_times.values())
+
+  @contextlib.contextmanager
+  def phase(self, name):
+    """Time the body of a with-statement, adding it to the given phase."""
+
+    wall_start, cpu_start = _wall_clock(), _cpu_clock()
+    try:
+      yield self
+    finally:
+      self.wall_times[name] = (self.wall_times.get(name, 0) +
+                               _wall_clock() - wall_start)
+      self.cpu_times[name] = (self.cpu_times.get(name, 0) +
+                              _cpu_clock() - cpu_start)
@@ -0,0 +1,204 @@
+"""Jinja tokens for preprocessed templates, without lexing the markup.
+
+Jinja's lexer finds its tags with a regular expression tried at every
+position of a template, so most of its time goes into the markup between the
+tags, which is all of the HTML produced from a HAML template. tokenize() finds
+the tags with a plain search instead and only hands the tags themselves to
+the lexer; the text in between becomes data tokens directly. Whitespace
+control (trim_blocks and '-' in tags) is applied as the lexer does, so the
+tokens are the same as those of environment.lexer.tokenize().
+
+Line statements, line comments and lstrip_blocks depend on where lines start
+rather than on tags, so environments using them aren't supported (see
+supports()).
+"""
+
+import re
+
+from jinja2 import TemplateSyntaxError
+
+
+__all__ = ['normalize_newlines', 'supports', 'tokenize']
+
+
+# Jinja's lexer compiles its patterns without re.UNICODE.
+WHITESPACE_REGEX = re.compile(r'\s*')
+
+# Tokens that only come out of the lexer outside of tags: it stops quietly
+# inside a tag left open at the end of its input, after a token of the tag.
+CLOSED_TOKENS = frozenset(
+    ['data', 'block_end', 'variable_end', 'raw_end', 'comment_end'])
+
+# Tokens after which trim_blocks removes a newline.
+TRIMMED_TOKENS = frozenset(['block_end', 'comment_end', 'raw_end'])
+
+# Tags with at most this much text between them are lexed together.
+TAG_GAP = 64
+
+
+def supports(environment):
+  """Return whether tokenize() can be used for templates of environment."""
+
+  return not (environment.line_statement_prefix or
+              environment.line_comment_prefix or environment.lstrip_blocks)
+
+
+def tokenize(environment, source, name=None, filename=None, lineno=1,
+             normalized=False):
+  """Yield the Jinja tokens of source, like environment.lexer.tokenize().
+
+  For sources that are a part of a larger template, lineno is the line number
+  of their first line, and normalized tells that the newlines of the template
+  have been normalized already (see normalize_newlines()), so source is used
+  as it is.
+  """
+
+  lexer = environment.lexer
+  return lexer.wrap(_iter_raw_tokens(environment, source, name, filename,
+                                     lineno, normalized), name, filename)
+
+
+def normalize_newlines(source, keep_trailing_newline):
+  """Normalize the newlines of source, as Lexer.tokeniter() does."""
+
+  lines = source.splitlines()
+  if keep_trailing_newline and source:
+    for newline in (u'\r\n', u'\r', u'\n'):
+      if source.endswith(newline):
+        lines.append(u'')
+        break
+  return u'\n'.join(lines)
+
+
+def _iter_raw_tokens(environment, source, name, filename, lineno,
+                     normalized):
+  """Yield (lineno, token, value) tuples like Lexer.tokeniter()."""
+
+  lexer = environment.lexer
+  keep_trailing_newline = environment.keep_trailing_newline
+  if normalized:
+    text = unicode(source)
+  else:
+    text = normalize_newlines(unicode(source), keep_trailing_newline)
+
+  # The string closing each kind of tag, by start string and by end token.
+  closes = {
+      environment.block_start_string: environment.block_end_string,
+      environment.variable_start_string: environment.variable_end_string,
+      environment.comment_start_string: environment.comment_end_string,
+      }
+  token_closes = {
+      'block_end': environment.block_end_string,
+      'raw_end': environment.block_end_string,
+      'variable_end': environment.variable_end_string,
+      'comment_end': environment.comment_end_string,
+      }
+  start_regex = re.compile('|'.join(
+      re.escape(start) for start in sorted(closes, key=len, reverse=True)))
+
+  pending = []  # (lineno, text) pieces of the data token being built.
+  position = 0
+
+  while True:
+    match = start_regex.search(text, position)
+    start = len(text) if match is None else match.start()
+    if start > position:
+      pending.append((lineno, text[position:start]))
+      lineno += text.count('\n', position, start)
+    if match is None:
+      break
+
+    # A '-' after the start of the tag strips the whitespace before it.
+    if text.startswith('-', match.end()) and pending:
+      data = ''.join(value for _, value in pending).rstrip()
+      pending = [(pending[0][0], data)] if data else []
+
+    if pending:
+      yield pending[0][0], 'data', ''.join(value for _, value in pending)
+      pending = []
+
+    end, tokens = _lex_tags(lexer, text, match, start_regex, closes,
+                            keep_trailing_newline, name, filename, source)
+
+    # Add up the whitespace the last token takes from the text after it.
+    line, token, value = tokens[-1]
+    close = token_closes.get(token)
+    if close is not None:
+      if value.rstrip().endswith('-' + close):
+        taken = WHITESPACE_REGEX.match(text, end).group()
+      elif (environment.trim_blocks and token in TRIMMED_TOKENS and
+            text.startswith('\n', end)):
+        taken = '\n'
+      else:
+        taken = ''
+      tokens[-1] = line, token, value + taken
+      end += len(taken)
+
+    # Data at the end goes on in the text after the tag.
+    offset = lineno - 1
+    if token == 'data':
+      pending.append((line + offset, tokens.pop()[2]))
+
+    for line, token, value in tokens:
+      yield line + offset, token, value
+
+    lineno += text.count('\n', start, end)
+    position = end
+
+  if pending:
+    yield pending[0][0], 'data', ''.join(value for _, value in pending)
+
+
+def _lex_tags(lexer, text, match, start_regex, closes, keep_trailing_newline,
+              name, filename, source):
+  """Lex the tag found by match (and any tags close after it).
+
+  Returns (end, raw tokens), with the offset of the text after the tags.
+  Each tag is assumed to end at the first close string after its start, and
+  the text is lexed again up to a further one for as long as the lexer
+  doesn't agree (as when the close string is in a string literal, or the tag
+  starts a raw block).
+  """
+
+  start = match.start()
+  end = _find_close(text, match, closes)
+  while True:
+    # Tags close to each other are lexed together, as every call to the
+    # lexer has a cost of its own.
+    while end < len(text):
+      match = start_regex.search(text, end, end + TAG_GAP)
+      if match is None:
+        break
+      end = _find_close(text, match, closes)
+
+    segment = text[start:end]
+    # tokeniter() drops a trailing newline, unless it's told to keep it.
+    if not keep_trailing_newline:
+      segment += u'\n'
+
+    try:
+      tokens = list(lexer.tokeniter(segment, name, filename))
+    except TemplateSyntaxError:
+      if end < len(text):
+        tokens = None
+      else:
+        # Lex the whole template to raise the error as Jinja would.
+        for _ in lexer.tokeniter(source, name, filename):
+          pass
+        raise
+
+    if tokens is not None and (tokens[-1][1] in CLOSED_TOKENS or
+                               end == len(text)):
+      return end, tokens
+
+    # Try again with twice as much of the text.
+    match = start_regex.search(text, start + 2 * (end - start))
+    end = len(text) if match is None else _find_close(text, match, closes)
+
+
+def _find_close(text, match, closes):
+  """Return the offset after the first close string of the tag at match."""
+
+  close = closes[match.group()]
+  end = text.find(close, match.end())
+  return len(text) if end == -1 else end + len(close)
@@ -0,0 +1,293 @@
+"""File watching loader which recompiles changed templates in the background.
+
+With auto_reload on, Jinja checks whether a template is still up to date on
+every get_template() call, which for file system loaders means a stat() call,
+and recompiles changed templates on the requesting thread. WatchedLoader
+instead learns about changes from inotify (so Linux only), recompiles changed
+templates on a background thread, and keeps serving the last good version of
+a template until its replacement is ready::
+
+    loader = WatchedLoader(FileSystemLoader('templates'))
+    env = Environment(loader=loader, extensions=[HamlExtension])
+    loader.start()
+
+Templates that fail to compile are logged, and the previous version is kept.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import threading
+
+from jinja2 import TemplateNotFound
+from jinja2.loaders import BaseLoader
+
+
+__all__ = ['Inotify', 'WatchedLoader']
+
+
+logger = logging.getLogger(__name__)
+
+
+class Inotify(object):
+  """Minimal ctypes wrapper around the Linux inotify API."""
+
+  IN_MODIFY = 0x00000002
+  IN_CLOSE_WRITE = 0x00000008
+  IN_MOVED_FROM = 0x00000040
+  IN_MOVED_TO = 0x00000080
+  IN_CREATE = 0x00000100
+  IN_DELETE = 0x00000200
+  IN_DELETE_SELF = 0x00000400
+  IN_Q_OVERFLOW = 0x00004000
+  IN_IGNORED = 0x00008000
+  IN_ISDIR = 0x40000000
+  IN_CLOEXEC = 0o2000000
+  IN_NONBLOCK = 0o4000
+
+  EVENT = struct.Struct('iIII')  # wd, mask, cookie, len.
+
+  _libc = None
+
+  def __init__(self):
+    libc = self._get_libc()
+    self.fd = libc.inotify_init1(self.IN_CLOEXEC | self.IN_NONBLOCK)
+    if self.fd < 0:
+      self._raise_errno()
+
+  @classmethod
+  def _get_libc(cls):
+    if cls._libc is None:
+      libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+      if not hasattr(libc, 'inotify_init1'):
+        raise OSError(errno.ENOSYS, 'inotify is not available.')
+      cls._libc = libc
+    return cls._libc
+
+  @classmethod
+  def _raise_errno(cls, path=None):
+    code = ctypes.get_errno()
+    raise OSError(code, os.strerror(code), path)
+
+  @classmethod
+  def is_available(cls):
+    """Return whether inotify can be used on this system."""
+    try:
+      cls._get_libc()
+    except (OSError, AttributeError):
+      return False
+    return True
+
+  def fileno(self):
+    return self.fd
+
+  def add_watch(self, path, mask):
+    """Watch path for the events in mask, returning the watch descriptor."""
+
+    if isinstance(path, unicode):
+      path = path.encode('utf-8')
+    wd = self._get_libc().inotify_add_watch(self.fd, path, mask)
+    if wd < 0:
+      self._raise_errno(path)
+    return wd
+
+  def read_events(self):
+    """Return the pending events as a list of (wd, mask, name) tuples."""
+
+    try:
+      data = os.read(self.fd, 64 * 1024)
+    except OSError, e:
+      if e.errno == errno.EAGAIN:
+        return []
+      raise
+
+    events = []
+    offset = 0
+    while offset < len(data):
+      wd, mask, _, length = self.EVENT.unpack_from(data, offset)
+      offset += self.EVENT.size
+      name = data[offset:offset + length].rstrip('\0')
+      offset += length
+      events.append((wd, mask, name))
+    return events
+
+  def close(self):
+    os.close(self.fd)
+
+
+class WatchedLoader(BaseLoader):
+  """Wraps a loader so templates are invalidated by inotify, not by stat().
+
+  paths are the directories to watch (recursively); by default the
+  searchpath of the wrapped loader, as for a FileSystemLoader. A changed
+  file is mapped back to its template name relative to these directories.
+
+  This loader has to be the environment's loader: its load() method hands
+  out the templates compiled in the background, so it shouldn't be wrapped
+  in another loader (such as a ChoiceLoader).
+  """
+
+  WATCH_MASK = (Inotify.IN_CLOSE_WRITE | Inotify.IN_MOVED_FROM |
+                Inotify.IN_MOVED_TO | Inotify.IN_CREATE | Inotify.IN_DELETE |
+                Inotify.IN_DELETE_SELF)
+
+  def __init__(self, loader, paths=None):
+    self.loader = loader
+    if paths is None:
+      paths = getattr(loader, 'searchpath', None)
+      if paths is None:
+        raise ValueError('No paths to watch for %r.' % loader)
+    if isinstance(paths, basestring):
+      paths = [paths]
+    self.paths = [os.path.abspath(path) for path in paths]
+
+    self._lock = threading.Lock()
+    self._tokens = {}  # Name -> token the current template was loaded with.
+    self._globals = {}  # Name -> globals of loaded templates.
+    self._ready = {}  # Name -> template compiled in the background.
+    self._environment = None
+
+    self._inotify = None
+    self._directories = {}  # Watch descriptor -> directory.
+    self._thread = None
+    self._wake_read, self._wake_write = None, None
+
+  def get_source(self, environment, template):
+    source, filename, _ = self.loader.get_source(environment, template)
+    with self._lock:
+      token = self._tokens.setdefault(template, object())
+    return source, filename, self._make_uptodate(template, token)
+
+  def _make_uptodate(self, name, token):
+    return lambda: self._tokens.get(name) is token
+
+  def list_templates(self):
+    return self.loader.list_templates()
+
+  def load(self, environment, name, globals=None):
+    with self._lock:
+      self._environment = environment
+      self._globals[name] = globals
+      template = self._ready.pop(name, None)
+
+    if template is None:
+      template = super(WatchedLoader, self).load(environment, name, globals)
+    return template
+
+  def start(self):
+    """Start watching the paths and recompiling changed templates."""
+
+    if self._thread is not None:
+      return
+
+    self._inotify = Inotify()
+    for path in self.paths:
+      self._watch_tree(path)
+
+    self._wake_read, self._wake_write = os.pipe()
+    self._thread = threading.Thread(target=self._run,
+                                    name='pyhaml-jinja-watcher')
+    self._thread.daemon = True
+    self._thread.start()
+
+  def stop(self):
+    """Stop the background thread."""
+
+    if self._thread is None:
+      return
+
+    os.write(self._wake_write, 'x')
+    self._thread.join()
+    self._thread = None
+    for fd in (self._wake_read, self._wake_write):
+      os.close(fd)
+    self._inotify.close()
+    self._directories = {}
+
+  def _watch_tree(self, path):
+    for directory, _, _ in os.walk(path):
+      try:
+        wd = self._inotify.add_watch(directory, self.WATCH_MASK)
+      except OSError:
+        logger.warning('Could not watch %s.', directory, exc_info=True)
+        continue
+      self._directories[wd] = directory
+
+  def _run(self):
+    while True:
+      readable, _, _ = select.select([self._inotify, self._wake_read], [], [])
+      if self._wake_read in readable:
+        return
+
+      names = set()
+      for wd, mask, filename in self._inotify.read_events():
+        if mask & Inotify.IN_Q_OVERFLOW:
+          # We lost events, so everything could have changed.
+          with self._lock:
+            names.update(self._globals)
+          continue
+
+        directory = self._directories.get(wd)
+        if directory is None:
+          continue
+        if mask & Inotify.IN_IGNORED:
+          del self._directories[wd]
+          continue
+
+        path = os.path.join(directory, filename)
+        if mask & Inotify.IN_ISDIR:
+          if mask & (Inotify.IN_CREATE | Inotify.IN_MOVED_TO):
+            self._watch_tree(path)
+          continue
+
+        name = self._get_name(path)
+        if name is not None:
+          names.add(name)
+
+      for name in sorted(names):
+        self._recompile(name)
+
+  def _get_name(self, path):
+    """Return the template name for a file path, or None."""
+
+    for root in self.paths:
+      if path.startswith(root + os.sep):
+        return os.path.relpath(path, root).replace(os.sep, '/')
+    return None
+
+  def _recompile(self, name):
+    """Compile the new version of name and make it replace the old one."""
+
+    with self._lock:
+      if name not in self._globals:
+        return  # Never loaded, so nothing to replace.
+      environment, globals = self._environment, self._globals[name]
+
+    invalidate = getattr(environment, 'haml_cache_invalidate', None)
+    if invalidate is not None:
+      invalidate(name)
+
+    try:
+      source, filename, _ = self.loader.get_source(environment, name)
+      code = environment.compile(source, name, filename)
+    except TemplateNotFound:
+      # The template is gone: make the next get_template() find out.
+      with self._lock:
+        self._tokens.pop(name, None)
+        self._ready.pop(name, None)
+      return
+    except Exception:
+      logger.exception('Could not recompile %s, keeping the old version.',
+                       name)
+      return
+
+    token = object()
+    template = environment.template_class.from_code(
+        environment, code, globals, self._make_uptodate(name, token))
+    with self._lock:
+      self._ready[name] = template
+      self._tokens[name] = token
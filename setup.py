@@ -30,10 +30,13 @@ setup(
   author='JJ Geewax',
   author_email='jj@geewax.org',
   url='http://github.com/jgeewax/pyhaml-jinja',
-  packages=find_packages(),
-  install_requires=['Jinja2'],
+  packages=find_packages(exclude=['benchmarks']),
+  install_requires=['Jinja2>=2.11,<3'],
   tests_require=['unittest2'],
   zip_safe=True,
+  entry_points={
+      'console_scripts': ['pyhaml-jinja = pyhaml_jinja.cli:main'],
+  },
   keywords="jinja2 templates haml html",
   platforms='any',
   classifiers=[
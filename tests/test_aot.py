@@ -0,0 +1,94 @@
+import os
+import shutil
+import tempfile
+
+import unittest2
+
+from jinja2 import DictLoader, Environment, TemplateNotFound
+
+from pyhaml_jinja.aot import HamlModuleLoader, compile_templates, read_settings
+from pyhaml_jinja.haml_extension import HamlExtension
+
+
+TEMPLATES = {
+    'base.haml': (
+        '%html\n'
+        '  %body\n'
+        '    -block content\n'
+        ),
+    'page.haml': (
+        '-extends "base.haml"\n'
+        '-block content\n'
+        '  %p(class="greeting") Hello #{name}\n'
+        ),
+    'plain.html': '<b>{{ name }}</b>',
+    }
+
+
+class TestCompileTemplates(unittest2.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.directory)
+    self.source_environment = Environment(loader=DictLoader(TEMPLATES),
+                                          extensions=[HamlExtension])
+
+  def compiled_environment(self, path, **options):
+    return Environment(loader=HamlModuleLoader(path),
+                       extensions=[HamlExtension], **options)
+
+  def assertSameOutput(self, environment):
+    for name in TEMPLATES:
+      self.assertEqual(
+          self.source_environment.get_template(name).render(name='you'),
+          environment.get_template(name).render(name='you'))
+
+  def test_zip(self):
+    path = os.path.join(self.directory, 'templates.zip')
+    settings = compile_templates(self.source_environment, path)
+    self.assertEqual(settings, read_settings(path))
+    self.assertEqual('  ', settings['haml_indent_string'])
+    self.assertSameOutput(self.compiled_environment(path))
+
+  def test_directory(self):
+    path = os.path.join(self.directory, 'templates')
+    compile_templates(self.source_environment, path, zip=None)
+    self.assertSameOutput(self.compiled_environment(path))
+
+  def test_missing_template(self):
+    path = os.path.join(self.directory, 'templates.zip')
+    compile_templates(self.source_environment, path)
+    with self.assertRaises(TemplateNotFound):
+      self.compiled_environment(path).get_template('missing.haml')
+
+  def test_settings_mismatch(self):
+    path = os.path.join(self.directory, 'templates.zip')
+    compile_templates(self.source_environment, path)
+
+    environment = self.compiled_environment(path)
+    environment.haml_indent_string = '\t'
+    with self.assertRaises(RuntimeError):
+      environment.get_template('page.haml')
+
+    environment = self.compiled_environment(path, trim_blocks=True)
+    with self.assertRaises(RuntimeError):
+      environment.get_template('page.haml')
+
+  def test_shared_loader(self):
+    path = os.path.join(self.directory, 'templates.zip')
+    compile_templates(self.source_environment, path)
+    loader = HamlModuleLoader(path)
+
+    environment = Environment(loader=loader, extensions=[HamlExtension])
+    environment.get_template('page.haml')
+
+    # Every environment sharing the loader gets its settings checked.
+    environment = Environment(loader=loader, extensions=[HamlExtension])
+    environment.haml_indent_string = '\t'
+    with self.assertRaises(RuntimeError):
+      environment.get_template('page.haml')
+
+  def test_requires_haml_extension(self):
+    with self.assertRaises(ValueError):
+      compile_templates(Environment(loader=DictLoader(TEMPLATES)),
+                        os.path.join(self.directory, 'templates.zip'))
@@ -0,0 +1,94 @@
+import unittest2
+
+from jinja2 import DictLoader, Environment, TemplateSyntaxError
+from jinja2 import nodes as jinja_nodes
+
+from pyhaml_jinja import HamlExtension
+from pyhaml_jinja.ast_compiler import AstCompiler, compile_template, supports
+
+
+EXTENSIONS = ['jinja2.ext.do', 'jinja2.ext.i18n', 'jinja2.ext.loopcontrols']
+
+SOURCES = [
+    '',
+    '%p text',
+    '%ul\n  -for item in items\n    %li(class="#{item}") #{item}\n'
+    '  -else\n    %li none',
+    '-if a\n  %p a\n-elif b\n  b\n-else\n  -if c: c\n%p after',
+    '-macro m(x)\n  %b #{x}\n-call m(1)\n  body\n#{m(2)}\n-set y = 3',
+    '-for i in items\n  -if i\n    -continue\n  -do items.append(i)\n  #{i}',
+    '%div\n  {% if a %}\n%p {{ b }}{# note #}\n  {% endif %}',
+    '-trans count=n\n  one\n-pluralize\n  many',
+    '-raw\n  {{ a }}\n%p',
+    ':javascript\n  var a = "#{a}";\n%p\n  -with b = 1\n    #{b}',
+    ]
+
+
+class TestAstCompiler(unittest2.TestCase):
+
+  def assertSameCode(self, environment, source):
+    compiler = AstCompiler(source, '\n', '  ')
+    expected = environment.compile(compiler.render(), 'n', 'f', raw=True)
+    template = compiler.parse(environment, 'n', 'f')
+    self.assertIsInstance(template, jinja_nodes.Template)
+    self.assertEqual(expected,
+                     environment.compile(template, 'n', 'f', raw=True))
+
+  def test_same_code(self):
+    for options in ({}, {'keep_trailing_newline': True},
+                    {'newline_sequence': '\r\n'}):
+      environment = Environment(extensions=EXTENSIONS, **options)
+      for source in SOURCES:
+        self.assertSameCode(environment, source)
+
+  def test_unsupported_environments(self):
+    for options in ({'trim_blocks': True}, {'lstrip_blocks': True},
+                    {'line_statement_prefix': '#'},
+                    {'block_start_string': '<%', 'block_end_string': '%>'}):
+      environment = Environment(extensions=EXTENSIONS, **options)
+      self.assertFalse(supports(environment))
+      for source in SOURCES[:6]:
+        self.assertSameCode(environment, source)
+
+    self.assertTrue(supports(Environment(extensions=[HamlExtension])))
+
+  def test_markup_is_not_parsed(self):
+    template = AstCompiler('%div\n  -if a\n    %p x\n  #{b}', '\n',
+                           '  ').parse(Environment())
+    data = jinja_nodes.TemplateData(u'\n    <p>\n      x\n    </p>\n  ')
+    self.assertEqual([jinja_nodes.Output([data])],
+                     template.find(jinja_nodes.If).body)
+    self.assertEqual(2, template.find(jinja_nodes.If).lineno)
+    self.assertEqual([2, 7], [name.lineno for name in
+                              template.find_all(jinja_nodes.Name)])
+
+  def test_tree_is_left_as_it_was(self):
+    compiler = AstCompiler(SOURCES[3], '\n', '  ')
+    expected = compiler.render()
+    compiler.parse(Environment())
+    self.assertEqual(expected, compiler.render())
+
+  def test_compile_template(self):
+    haml = SOURCES[2]
+    environment = Environment(loader=DictLoader({'page.haml': haml}),
+                              extensions=[HamlExtension])
+    for compact in (False, True):
+      environment.haml_compact = compact
+      environment.cache.clear()
+      expected = environment.get_template('page.haml').render(items=['a'])
+      template = compile_template(environment, haml, 'page.haml')
+      self.assertEqual(expected, template.render(items=['a']))
+
+  def test_errors(self):
+    environment = Environment()
+    with self.assertRaises(TemplateSyntaxError) as context:
+      compile_template(environment, '%p\n  -else', 'page.haml')
+    with self.assertRaises(TemplateSyntaxError) as expected:
+      environment.compile(AstCompiler('%p\n  -else', '\n').render())
+    self.assertEqual(expected.exception.message, context.exception.message)
+    self.assertEqual(expected.exception.lineno, context.exception.lineno)
+    self.assertEqual('page.haml', context.exception.name)
+
+    with self.assertRaises(TemplateSyntaxError) as context:
+      compile_template(environment, '%div\n \t%p', 'page.haml')
+    self.assertEqual('page.haml', context.exception.name)
@@ -0,0 +1,27 @@
+import json
+
+import unittest2
+
+from benchmarks import corpus, run
+from pyhaml_jinja.compiler import Compiler
+from pyhaml_jinja.renderer import Renderer
+
+
+class TestBenchmarks(unittest2.TestCase):
+
+  def test_corpus_is_reproducible(self):
+    self.assertEqual(corpus.generate_all(seed=3, scale=4),
+                     corpus.generate_all(seed=3, scale=4))
+    self.assertNotEqual(corpus.generate('mixed', seed=3, scale=4),
+                        corpus.generate('mixed', seed=4, scale=4))
+
+  def test_corpus_is_valid(self):
+    for _, source in corpus.generate_all(scale=3):
+      self.assertEqual(Renderer(source, '\n', '  ').render(),
+                       Compiler(source, '\n', '  ').render())
+
+  def test_run(self):
+    results = run.run(scale=2, repeat=1, number=1, corpora=['long_chains'])
+    self.assertEqual([phase for phase, _ in run.PHASES],
+                     [result['phase'] for result in results['results']])
+    self.assertEqual(results, json.loads(json.dumps(results)))
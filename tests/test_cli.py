@@ -0,0 +1,125 @@
+import os
+import shutil
+import tempfile
+
+import unittest2
+
+from pyhaml_jinja import cli
+
+
+class TestCompileDirectory(unittest2.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.directory)
+    self.source_dir = os.path.join(self.directory, 'src')
+    self.dest_dir = os.path.join(self.directory, 'dest')
+
+    self.write('page.haml', '%p text')
+    self.write('nested/list.haml', '%ul: %li item')
+    self.write('nested/plain.html', '<b>not haml</b>')
+
+  def write(self, path, source):
+    path = os.path.join(self.source_dir, path)
+    if not os.path.isdir(os.path.dirname(path)):
+      os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as source_file:
+      source_file.write(source)
+
+  def read(self, path):
+    with open(os.path.join(self.dest_dir, path), 'r') as output_file:
+      return output_file.read()
+
+  def test_compile(self):
+    compiled, skipped, errors = cli.compile_directory(self.source_dir,
+                                                      self.dest_dir, jobs=2)
+    self.assertEqual(['nested/list.haml', 'page.haml'], sorted(compiled))
+    self.assertEqual(([], []), (skipped, errors))
+    self.assertEqual('<p>\n  text\n</p>', self.read('page.html'))
+    self.assertEqual('<ul>\n  <li>\n    item\n  </li>\n</ul>',
+                     self.read('nested/list.html'))
+    self.assertFalse(os.path.exists(
+        os.path.join(self.dest_dir, 'nested/plain.html')))
+
+  def test_skips_unchanged_templates(self):
+    cli.compile_directory(self.source_dir, self.dest_dir, jobs=1)
+    self.write('page.haml', '%p changed')
+
+    compiled, skipped, _ = cli.compile_directory(self.source_dir,
+                                                 self.dest_dir, jobs=1)
+    self.assertEqual(['page.haml'], compiled)
+    self.assertEqual(['nested/list.haml'], skipped)
+    self.assertEqual('<p>\n  changed\n</p>', self.read('page.html'))
+
+    compiled, _, _ = cli.compile_directory(self.source_dir, self.dest_dir,
+                                           jobs=1, force=True)
+    self.assertEqual(2, len(compiled))
+
+  def test_removes_deleted_templates(self):
+    cli.compile_directory(self.source_dir, self.dest_dir, jobs=1)
+    os.remove(os.path.join(self.source_dir, 'page.haml'))
+
+    cli.compile_directory(self.source_dir, self.dest_dir, jobs=1)
+    self.assertFalse(os.path.exists(os.path.join(self.dest_dir, 'page.html')))
+    self.assertEqual(['nested/list.haml'],
+                     cli.load_manifest(self.dest_dir).keys())
+
+    os.remove(os.path.join(self.source_dir, 'nested/list.haml'))
+    cli.compile_directory(self.source_dir, self.dest_dir, jobs=1, force=True)
+    self.assertFalse(os.path.exists(
+        os.path.join(self.dest_dir, 'nested/list.html')))
+
+  def test_errors(self):
+    self.write('broken.haml', '%hr\n  text')
+
+    compiled, _, errors = cli.compile_directory(self.source_dir,
+                                                self.dest_dir, jobs=1)
+    self.assertEqual(2, len(compiled))
+    self.assertEqual(1, len(errors))
+    self.assertIn('broken.haml:2:', errors[0])
+    self.assertNotIn('broken.haml', cli.load_manifest(self.dest_dir))
+
+  def test_decode_errors(self):
+    cli.compile_directory(self.source_dir, self.dest_dir, jobs=1)
+    self.write('page.haml', '%p\n  caf\xff')
+
+    compiled, _, errors = cli.compile_directory(self.source_dir,
+                                                self.dest_dir, jobs=2)
+    self.assertEqual([], compiled)
+    self.assertEqual(1, len(errors))
+    self.assertIn('page.haml:2:', errors[0])
+    self.assertFalse(os.path.exists(os.path.join(self.dest_dir, 'page.html')))
+    self.assertEqual(['nested/list.haml'],
+                     cli.load_manifest(self.dest_dir).keys())
+
+  def test_write_errors(self):
+    # A directory in the way of the output file.
+    os.makedirs(os.path.join(self.dest_dir, 'page.html'))
+    compiled, _, errors = cli.compile_directory(self.source_dir,
+                                                self.dest_dir, jobs=1)
+    self.assertEqual(['nested/list.haml'], compiled)
+    self.assertEqual(1, len(errors))
+    self.assertIn('page.html', errors[0])
+    self.assertNotIn('page.haml', cli.load_manifest(self.dest_dir))
+
+  def test_errors_remove_previous_output(self):
+    cli.compile_directory(self.source_dir, self.dest_dir, jobs=1)
+    self.write('page.haml', '%hr\n  text')
+
+    _, _, errors = cli.compile_directory(self.source_dir, self.dest_dir,
+                                         jobs=1)
+    self.assertEqual(1, len(errors))
+    self.assertFalse(os.path.exists(os.path.join(self.dest_dir, 'page.html')))
+    self.assertNotIn('page.haml', cli.load_manifest(self.dest_dir))
+
+  def test_main(self):
+    self.write('broken.haml', '%hr\n  text')
+    with open(os.devnull, 'w') as devnull:
+      stdout, stderr = cli.sys.stdout, cli.sys.stderr
+      cli.sys.stdout = cli.sys.stderr = devnull
+      try:
+        status = cli.main(['compile', self.source_dir, self.dest_dir, '-j1'])
+      finally:
+        cli.sys.stdout, cli.sys.stderr = stdout, stderr
+    self.assertEqual(1, status)
+    self.assertTrue(os.path.exists(os.path.join(self.dest_dir, 'page.html')))
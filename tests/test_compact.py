@@ -0,0 +1,110 @@
+import unittest2
+
+from jinja2 import DictLoader, Environment
+
+from pyhaml_jinja import HamlExtension
+from pyhaml_jinja.compact import collapse_whitespace, iter_output
+from pyhaml_jinja.compact import GLUE, JINJA, NEWLINE, SPACE
+from pyhaml_jinja.compiler import Compiler
+from pyhaml_jinja.renderer import Renderer
+
+
+SOURCE = '\n'.join([
+    '%ul.items',
+    '  -for item in items',
+    '    %li',
+    '      %a(href="#{item.url}")   #{item.name}',
+    '      said   {{ "a  b" }}  here',
+    '  -else',
+    '    %li none',
+    '%pre',
+    '  |  keep',
+    '  |    this',
+    ':javascript',
+    '  var a = 1;',
+    '  a  +=  2;',
+    ])
+
+EXPECTED = (
+    '<ul class="items">{%- for item in items -%}<li>'
+    '<a href="{{ item.url }}">{{ item.name }}</a> said {{ "a  b" }} here'
+    '</li>{%- else -%}<li>none</li>{%- endfor -%}</ul>'
+    '<pre>  keep\n    this\n</pre>'
+    '<script type="text/javascript">\nvar a = 1;\na  +=  2;\n</script>')
+
+
+class TestCompact(unittest2.TestCase):
+
+  def test_renderer(self):
+    self.assertEqual(EXPECTED, Renderer(SOURCE, compact=True).render())
+    self.assertEqual(EXPECTED,
+                     Renderer(SOURCE, compact=True, flat=True).render())
+
+  def test_compiler(self):
+    self.assertEqual(EXPECTED, Compiler(SOURCE, compact=True).render())
+
+  def test_empty_preformatted_lines(self):
+    for source in ('a\n|\nb', '%p\n  |x\n  |', '%p\n  |\n  |x'):
+      self.assertEqual(Renderer(source, compact=True).render(),
+                       Compiler(source, compact=True).render())
+
+  def test_render_to(self):
+    parts = []
+    Renderer(SOURCE, '\n', '  ', compact=True).render_to(parts.append)
+    self.assertEqual(EXPECTED, ''.join(parts))
+
+  def test_newline_string(self):
+    output = Compiler('%pre\n  |a\n  |b', '\r\n', compact=True).render()
+    self.assertEqual('<pre>a\r\nb\r\n</pre>', output)
+
+  def test_inline_tags_keep_spaces_between_words(self):
+    source = '%p\n  Hello\n  %b world\n  %img(src="x")\n  again'
+    self.assertEqual('<p>Hello <b>world</b> <img src="x" /> again</p>',
+                     Compiler(source, compact=True).render())
+
+  def test_text_around_jinja_tags(self):
+    source = '%p\n  Hello\n  -if name\n    #{name}\n  and welcome'
+    output = Compiler(source, compact=True).render()
+    self.assertEqual(
+        '<p>Hello {% if name %}{{ name }} {% endif %}and welcome</p>', output)
+    template = Environment().from_string(output)
+    self.assertEqual('<p>Hello Bob and welcome</p>',
+                     template.render(name='Bob'))
+    self.assertEqual('<p>Hello and welcome</p>', template.render())
+
+  def test_jinja_tags_in_preformatted_text(self):
+    source = '%pre\n  |line one\n  -if x\n    |  line two\n  |line three'
+    output = Compiler(source, compact=True).render()
+    self.assertEqual(Renderer(source, compact=True).render(), output)
+    template = Environment().from_string(output)
+    self.assertEqual('<pre>line one\n  line two\nline three\n</pre>',
+                     template.render(x=True))
+    self.assertEqual('<pre>line one\nline three\n</pre>', template.render())
+
+  def test_collapse_whitespace(self):
+    self.assertEqual('a b {{ x  }} c {% if  y %}',
+                     collapse_whitespace('a \t b {{ x  }}   c {% if  y %}'))
+
+  def test_iter_output(self):
+    pieces = [(SPACE, 'a', SPACE), (SPACE, 'b', GLUE), (SPACE, 'c', NEWLINE),
+              (GLUE, 'd', GLUE)]
+    self.assertEqual('a bc\nd', ''.join(iter_output(pieces)))
+
+    pieces = [(JINJA, '{% a %}', JINJA), (SPACE, 'b', SPACE),
+              (JINJA, '{% c %}', JINJA), (JINJA, '{% d %}', JINJA),
+              (GLUE, 'e', NEWLINE), (JINJA, '{% f %}', JINJA)]
+    self.assertEqual('{%- a %} b {% c %}{% d -%}e\n{% f -%}',
+                     ''.join(iter_output(pieces)))
+
+  def test_extension_setting(self):
+    env = Environment(loader=DictLoader({'page.haml': SOURCE}),
+                      extensions=[HamlExtension])
+    env.haml_compact = True
+    self.assertEqual(EXPECTED, env.preprocess(SOURCE, 'page.haml'))
+    output = env.get_template('page.haml').render(
+        items=[{'url': '/a', 'name': 'A'}])
+    self.assertTrue(output.startswith(
+        '<ul class="items"><li><a href="/a">A</a> said a  b here</li></ul>'))
+
+    env.haml_compact = False
+    self.assertNotEqual(EXPECTED, env.preprocess(SOURCE, 'page.haml'))
@@ -0,0 +1,160 @@
+import unittest2
+
+from pyhaml_jinja.compiler import Compiler
+from pyhaml_jinja.errors import TemplateIndentationError, TemplateSyntaxError
+from pyhaml_jinja.renderer import Renderer
+
+
+SOURCES = [
+    '',
+    '%div',
+    (
+        '%div(a="1", \\ \n'
+        '     b="2")\n'
+        '  %h1 heading 1\n'
+        '  %p: %span: %b bold nested\n'
+        ),
+    (
+        '-if True\n'
+        '  %link(a="1", \\\n'
+        '        b="2")\n'
+        '  %script(c="3")\n'
+        '-else\n'
+        '  %link(d="4")\n'
+        ),
+    (
+        'text on base line\n'
+        '  indented for no good reason\n'
+        '    %div\n'
+        ),
+    (
+        '-for item in list\n'
+        '  -if item\n'
+        '    #{item}\n'
+        '  -elif other: other\n'
+        '  -else\n'
+        '    -if nested\n'
+        '      nested\n'
+        '-else\n'
+        '  empty\n'
+        '-if x\n'
+        '-for y in z\n'
+        '-else\n'
+        ),
+    (
+        '%-div\n'
+        '  %p text\n'
+        '  text2\n'
+        '  %-a(href="#") link\n'
+        '  %div content'
+        ),
+    (
+        '%pre\n'
+        '  |line1\n'
+        '  |  line2\n'
+        '|top level\n'
+        '%-pre: |inline\n'
+        ),
+    (
+        '%-div\n'
+        '  %-p\n'
+        '    %pre\n'
+        '      |held back\n'
+        '  %a x\n'
+        '  %b x\n'
+        '  %pre\n'
+        '    |  after two lines\n'
+        '    text\n'
+        ),
+    (
+        ':javascript\n'
+        '  ..\n'
+        '    .###.1\n'
+        ':plain\n'
+        '  %not-a-tag\n'
+        '%div content\n'
+        ),
+    (
+        '-if x:\n'
+        '  under an empty node\n'
+        '-block b: %p: %-span.a#b(c="d") text\n'
+        '! comment\n'
+        '\\%escaped\n'
+        ),
+    ]
+
+
+class TestCompiler(unittest2.TestCase):
+
+  def assertSameAsRenderer(self, source, newline_string, indent_string):
+    self.maxDiff = None
+    expected = Renderer(source, newline_string, indent_string).render()
+    compiled = Compiler(source, newline_string, indent_string).render()
+    self.assertMultiLineEqual(expected, compiled)
+
+  def test_matches_renderer(self):
+    for source in SOURCES:
+      self.assertSameAsRenderer(source, '\n', '  ')
+      self.assertSameAsRenderer(source, '', '')
+      self.assertSameAsRenderer(source, '\n', '\t')
+
+  def test_matches_renderer_on_full_example(self):
+    with open('tests/full_example.haml', 'r') as source_haml:
+      source = source_haml.read()
+
+    self.assertSameAsRenderer(source, '\n', '  ')
+    self.assertSameAsRenderer(source, '', '')
+
+  def test_full_example(self):
+    with open('tests/full_example.haml', 'r') as source_haml:
+      compiler = Compiler(source_haml.read(), '\n', '  ')
+
+    with open('tests/full_example.html', 'r') as expected_html:
+      expected_html = expected_html.read().strip()
+
+    self.maxDiff = None
+    self.assertMultiLineEqual(expected_html, compiler.render())
+
+  def test_compile_lines(self):
+    lines = Compiler.compile_lines('%div\n  %p text\n')
+    self.assertEqual(['<div>', '<p>', 'text', '</p>', '</div>'], lines)
+
+  def test_invalid_indentation(self):
+    source = (
+        '%div\n'
+        '  f\n'
+        ' f\n'
+        )
+    with self.assertRaises(TemplateIndentationError):
+      Compiler(source)
+
+  def test_mixed_tabs_and_spaces(self):
+    with self.assertRaises(TemplateIndentationError):
+      Compiler('  \ttext\n')
+
+  def test_invalid_attributes(self):
+    with self.assertRaises(TemplateSyntaxError):
+      Compiler('%div(a="1" b="2")')
+
+  def test_duplicate_attributes(self):
+    with self.assertRaises(TemplateSyntaxError) as context:
+      Compiler('text\n#a(id="b")')
+    self.assertEqual(2, context.exception.lineno)
+
+  def test_children_of_childless_node(self):
+    source = (
+        '%hr\n'
+        '  text\n'
+        )
+    with self.assertRaises(TemplateSyntaxError):
+      Compiler(source)
+
+  def test_same_errors_as_renderer(self):
+    for source in ('%br(a="1", a="2")', '%p(a="1", a="2") text',
+                   '%br text', '%br: %p', '%br(a="1", a="2"): %p',
+                   '%br\n  %p(a="1", a="2")', '%br\n  %p text'):
+      with self.assertRaises(TemplateSyntaxError) as expected:
+        Renderer(source)
+      with self.assertRaises(TemplateSyntaxError) as context:
+        Compiler(source)
+      self.assertEqual(str(expected.exception), str(context.exception))
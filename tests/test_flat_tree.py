@@ -0,0 +1,72 @@
+import unittest2
+
+from pyhaml_jinja.errors import TemplateIndentationError, TemplateSyntaxError
+from pyhaml_jinja.flat_tree import FlatTree
+from pyhaml_jinja.parser import Parser
+from pyhaml_jinja.renderer import Renderer
+from tests.test_compiler import SOURCES
+
+
+class TestFlatTree(unittest2.TestCase):
+
+  def assertSameAsTree(self, source, newline_string, indent_string):
+    self.maxDiff = None
+    expected = Renderer(source, newline_string, indent_string).render()
+    flat = Renderer(source, newline_string, indent_string, flat=True).render()
+    self.assertMultiLineEqual(expected, flat)
+
+  def test_matches_node_tree(self):
+    for source in SOURCES:
+      self.assertSameAsTree(source, '\n', '  ')
+      self.assertSameAsTree(source, '', '')
+      self.assertSameAsTree(source, '\n', '\t')
+
+  def test_full_example(self):
+    with open('tests/full_example.haml', 'r') as source_haml:
+      renderer = Renderer(source_haml.read(), '\n', '  ', flat=True)
+
+    with open('tests/full_example.html', 'r') as expected_html:
+      expected_html = expected_html.read().strip()
+
+    self.maxDiff = None
+    self.assertMultiLineEqual(expected_html, renderer.render())
+
+  def test_structure(self):
+    tree = Parser.build_flat_tree('%div\n  %p text\n  -if x\n  -else\n')
+    self.assertIsInstance(tree, FlatTree)
+    self.assertEqual(6, len(tree))
+
+    div, = tree.iter_children(0)
+    p, if_, else_ = tree.iter_children(div)
+    self.assertEqual([FlatTree.HTML, FlatTree.JINJA, FlatTree.JINJA],
+                     [tree.kinds[p], tree.kinds[if_], tree.kinds[else_]])
+    self.assertEqual(div, tree.parents[p])
+    self.assertEqual(if_, tree.chains[else_])
+    self.assertEqual(['text'], [tree.strings[tree.texts[child]]
+                                for child in tree.iter_children(p)])
+
+  def test_strings_are_shared(self):
+    tree = Parser.build_flat_tree('%p a\n%p a\n%p a\n')
+    self.assertEqual(7, len(tree))
+    self.assertEqual(3, len(tree.strings))  # 'p', '' (attributes) and 'a'.
+
+  def test_to_bytes(self):
+    with open('tests/full_example.haml', 'r') as source_haml:
+      tree = Parser.build_flat_tree(source_haml.read())
+
+    loaded = FlatTree.from_bytes(tree.to_bytes())
+    self.assertEqual(len(tree), len(loaded))
+    self.assertEqual(tree.render_lines('  '), loaded.render_lines('  '))
+
+  def test_invalid_indentation(self):
+    with self.assertRaises(TemplateIndentationError):
+      Parser.build_flat_tree('%div\n  f\n f\n')
+
+  def test_duplicate_attributes(self):
+    with self.assertRaises(TemplateSyntaxError) as context:
+      Parser.build_flat_tree('text\n#a(id="b")')
+    self.assertEqual(2, context.exception.lineno)
+
+  def test_children_of_childless_node(self):
+    with self.assertRaises(TemplateSyntaxError):
+      Parser.build_flat_tree('%hr\n  text\n')
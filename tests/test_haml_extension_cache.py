@@ -0,0 +1,122 @@
+import sys
+
+import unittest2
+
+from jinja2 import Environment
+
+from pyhaml_jinja.haml_extension import HamlExtension, PreprocessCache
+
+
+class TestPreprocessCache(unittest2.TestCase):
+
+  def test_get_missing_key(self):
+    cache = PreprocessCache()
+    self.assertEqual(None, cache.get('missing'))
+
+  def test_set_and_get(self):
+    cache = PreprocessCache()
+    cache.set('key', u'value')
+    self.assertEqual(u'value', cache.get('key'))
+    self.assertEqual(1, len(cache))
+
+  def test_evicts_least_recently_used_entry(self):
+    cache = PreprocessCache(max_entries=2)
+    cache.set('a', u'1')
+    cache.set('b', u'2')
+    cache.get('a')
+    cache.set('c', u'3')
+    self.assertIn('a', cache)
+    self.assertNotIn('b', cache)
+    self.assertIn('c', cache)
+
+  def test_evicts_to_respect_byte_budget(self):
+    value = u'x' * 100
+    cache = PreprocessCache(max_bytes=int(2.5 * sys.getsizeof(value)))
+    cache.set('a', value)
+    cache.set('b', value)
+    cache.set('c', value)
+    self.assertEqual(2, len(cache))
+    self.assertNotIn('a', cache)
+    self.assertTrue(cache.total_bytes <= cache.max_bytes)
+
+  def test_oversized_values_are_not_stored(self):
+    cache = PreprocessCache(max_bytes=10)
+    cache.set('a', u'x' * 100)
+    self.assertEqual(0, len(cache))
+    self.assertEqual(0, cache.total_bytes)
+
+  def test_zero_entries_disables_cache(self):
+    cache = PreprocessCache(max_entries=0)
+    cache.set('a', u'1')
+    self.assertEqual(0, len(cache))
+
+  def test_clear(self):
+    cache = PreprocessCache()
+    cache.set('a', u'1')
+    cache.clear()
+    self.assertEqual(0, len(cache))
+    self.assertEqual(0, cache.total_bytes)
+
+  def test_invalidate(self):
+    cache = PreprocessCache()
+    cache.set('a', u'1', name='a.haml')
+    cache.set('b', u'2', name='b.haml')
+    cache.invalidate('a.haml')
+    cache.invalidate('missing.haml')
+    self.assertNotIn('a', cache)
+    self.assertIn('b', cache)
+    self.assertEqual(sys.getsizeof(u'2'), cache.total_bytes)
+
+  def test_key_depends_on_settings(self):
+    key = PreprocessCache.make_key(u'%div', '  ', '\n')
+    self.assertEqual(key, PreprocessCache.make_key(u'%div', '  ', '\n'))
+    self.assertNotEqual(key, PreprocessCache.make_key(u'%div', '', '\n'))
+    self.assertNotEqual(key, PreprocessCache.make_key(u'%div', '  ', ''))
+    self.assertNotEqual(key, PreprocessCache.make_key(u'%p', '  ', '\n'))
+
+
+class TestHamlExtensionCache(unittest2.TestCase):
+
+  def setUp(self):
+    self.environment = Environment(extensions=[HamlExtension])
+    self.renders = []
+
+    renders = self.renders
+
+    class CountingRenderer(self.environment.haml_renderer_class):
+      def render(self):
+        renders.append(self)
+        return super(CountingRenderer, self).render()
+
+    self.environment.haml_renderer_class = CountingRenderer
+
+  def preprocess(self, source, name='test.haml'):
+    return self.environment.preprocess(source, name)
+
+  def test_repeated_source_is_rendered_once(self):
+    self.assertEqual(u'<div>\n  text\n</div>', self.preprocess(u'%div text'))
+    self.assertEqual(u'<div>\n  text\n</div>', self.preprocess(u'%div text'))
+    self.assertEqual(1, len(self.renders))
+
+  def test_changed_settings_are_rendered_again(self):
+    self.preprocess(u'%div text')
+    self.environment.haml_indent_string = ''
+    self.assertEqual(u'<div>\ntext\n</div>', self.preprocess(u'%div text'))
+    self.assertEqual(2, len(self.renders))
+
+  def test_cache_clear(self):
+    self.preprocess(u'%div text')
+    self.environment.haml_cache_clear()
+    self.preprocess(u'%div text')
+    self.assertEqual(2, len(self.renders))
+
+  def test_cache_size_setting(self):
+    self.environment.haml_cache_size = 0
+    self.preprocess(u'%div text')
+    self.preprocess(u'%div text')
+    self.assertEqual(2, len(self.renders))
+
+  def test_non_haml_templates_are_untouched(self):
+    self.assertEqual(u'%div text', self.preprocess(u'%div text', 'test.html'))
+    self.assertEqual(0, len(self.renders))
+
@@ -240,3 +240,39 @@ class TestHtmlNode(unittest2.TestCase):
       self.assertEqual({}, node.attributes)
       self.assertFalse(node.has_children())
 
+  def test_scan_attributes_error_messages(self):
+    def get_error(attributes):
+      with self.assertRaises(ValueError) as context:
+        nodes.HtmlNode.scan_attributes(attributes, 0, len(attributes))
+      return str(context.exception)
+
+    mismatched = 'Mismatched quotes (or missing comma) in attributes!'
+    self.assertEqual(mismatched, get_error('a="1'))
+    self.assertEqual(mismatched, get_error('a="1" b="2"'))
+    self.assertEqual(mismatched, get_error('a="1", b=c, d=""e"'))
+    self.assertEqual('Invalid attribute provided: ""1"b=" for key "a"',
+                     get_error('a="1"b="'))
+    self.assertEqual('Invalid attribute provided: " "1"" for key "a "',
+                     get_error('a = "1"'))
+
+  def test_scan_attributes_skips_empty_pairs(self):
+    self.assertEqual([('a', '1'), ('b', 'x, y')],
+                     nodes.HtmlNode.scan_attributes(',a="1",, b="x, y",',
+                                                    0, 18))
+
+  def test_match_haml_matches_like_tag_regex(self):
+    match = nodes.HtmlNode.match_haml
+    self.assertEqual(('a', True, [('class', 'b'), ('id', 'c:d')], (10, 15),
+                      True, ' %i x'),
+                     match('%-a.b#c:d(x="1"): %i x'))
+    # The shortcut attributes end as soon as the rest of the line matches,
+    # and the attribute list at the last ')' it still matches after.
+    self.assertEqual(('p', False, [('class', 'a'), ('class', '')], None,
+                      False, ' b c'), match('%p.a. b c'))
+    self.assertEqual(('p', False, [], (3, 16), False, None),
+                     match('%p(a="1") see (b)'))
+    self.assertEqual(('p', False, [], None, True, None), match('%p:'))
+    for line in ('p', '%', '%-', '%p.', '%p.(a)', '%p(a', '%p()', '%p.a)',
+                 '%p:x', '%p ', '%p.a(b) '):
+      self.assertIsNone(match(line))
+      self.assertIsNone(nodes.HtmlNode.TAG_REGEX.match(line))
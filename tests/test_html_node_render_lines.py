@@ -1,3 +1,5 @@
+import sys
+
 import unittest2
 
 from pyhaml_jinja import nodes
@@ -63,3 +65,39 @@ class TestNodeRenderLines(unittest2.TestCase):
   def test_render_condensed_single_node(self):
     node = nodes.HtmlNode('div', condensed=True)
     self.assertEqual(['<div></div>'], node.render_lines())
+
+  def test_iter_lines_condensed_node(self):
+    parent = nodes.HtmlNode('div', condensed=True)
+    for text in ('a', 'b', 'c'):
+      child = nodes.HtmlNode('p')
+      child.add_child(nodes.TextNode(text))
+      parent.add_child(child)
+
+    lines = parent.iter_lines(indent_string='  ')
+    self.assertFalse(isinstance(lines, list))
+    self.assertEqual(['<div><p>', '    a', '  </p>', '  <p>', '    b',
+                      '  </p>', '  <p>', '    c', '  </p></div>'],
+                     list(lines))
+
+  def test_render_nested_condensed_nodes(self):
+    outer = nodes.HtmlNode('div', condensed=True)
+    inner = nodes.HtmlNode('p', condensed=True)
+    inner.add_child(nodes.TextNode('a'))
+    inner.add_child(nodes.TextNode('b'))
+    outer.add_child(inner)
+    outer.add_child(nodes.TextNode('c'))
+    self.assertEqual(['<div><p>a', '    b</p>', '  c</div>'],
+                     outer.render_lines(indent_string='  '))
+
+  def test_render_deep_tree(self):
+    depth = sys.getrecursionlimit() + 100
+    root = parent = nodes.HtmlNode('div')
+    for _ in xrange(depth - 1):
+      child = nodes.HtmlNode('div')
+      parent.add_child(child)
+      parent = child
+
+    lines = root.render_lines(indent_string=' ')
+    self.assertEqual(2 * depth, len(lines))
+    self.assertEqual(' ' * (depth - 1) + '</div>', lines[depth])
+
@@ -0,0 +1,154 @@
+import random
+import unittest2
+
+from pyhaml_jinja.errors import TemplateSyntaxError
+from pyhaml_jinja.incremental import IncrementalRenderer
+from pyhaml_jinja.renderer import Renderer
+
+
+SOURCE = (
+    '%html\n'
+    '  %body\n'
+    '    %-p: %b bold\n'
+    '    -if x\n'
+    '      %ul\n'
+    '        %li one\n'
+    '        %li two\n'
+    '    -else\n'
+    '      %p none\n'
+    '    %div(a="1", \\\n'
+    '         b="2")\n'
+    '      ; comment\n'
+    '      text\n'
+    )
+
+# Lines random sources and edits are made of.
+LINES = [
+    '%div', '%p text', '%-span', '%-a(href="#") link', '%ul.list',
+    '%li: %b bold', '%br', '%pre', '|  preformatted', '-if x', '-elif y',
+    '-else', '-for item in items', '-set a = 1', 'text #{value}',
+    '; comment', '', '! html comment', ':javascript', 'var a = 1;',
+    '%div(a="1", \\', '     b="2")',
+    ]
+
+
+def random_lines(rng, count, level):
+  """Return count random source lines, starting at indent level."""
+
+  lines = []
+  for _ in range(count):
+    lines.append('  ' * level + rng.choice(LINES))
+    level = max(0, level + rng.choice([-1, 0, 0, 1]))
+  return lines
+
+
+class TestIncrementalRenderer(unittest2.TestCase):
+
+  def assertEdit(self, start_line, end_line, text):
+    renderer = IncrementalRenderer(SOURCE, '\n', '  ')
+    old_lines = list(renderer.lines)
+
+    index, count, lines = renderer.edit(start_line, end_line, text)
+    old_lines[index:index + count] = lines
+
+    source_lines = SOURCE.split('\n')
+    source_lines[start_line - 1:end_line - 1] = text.split('\n')[:-1]
+    expected = Renderer('\n'.join(source_lines), '\n', '  ').render()
+
+    self.maxDiff = None
+    self.assertEqual('\n'.join(source_lines), renderer.source)
+    self.assertMultiLineEqual(expected, renderer.render())
+    self.assertMultiLineEqual(expected, '\n'.join(old_lines))
+    return index, count, lines
+
+  def test_matches_renderer(self):
+    self.assertMultiLineEqual(Renderer(SOURCE, '\n', '  ').render(),
+                              IncrementalRenderer(SOURCE, '\n', '  ').render())
+
+  def test_replace_line(self):
+    # Only the list the line is in gets rendered again.
+    _, count, lines = self.assertEdit(6, 7, '        %li uno\n')
+    self.assertEqual(8, count)
+    self.assertEqual(['      <ul>', '        <li>', '          uno'],
+                     lines[:3])
+
+  def test_insert_and_delete_lines(self):
+    self.assertEdit(8, 8, '      %li three\n      %li four\n')
+    self.assertEdit(6, 8, '')
+    self.assertEdit(4, 8, '')
+
+  def test_change_indentation(self):
+    self.assertEdit(9, 10, '    %p outdented\n')
+    self.assertEdit(2, 3, '%body\n')
+
+  def test_edit_inside_condensed_tag(self):
+    self.assertEdit(4, 4, '      %i italic\n')
+
+  def test_edit_around_continuation(self):
+    self.assertEdit(11, 12, '         b="3")\n')
+    self.assertEdit(13, 14, '      more text\n')
+
+  def test_blank_lines(self):
+    renderer = IncrementalRenderer(SOURCE, '\n', '  ')
+    self.assertEqual((0, 0, []), renderer.edit(3, 3, '\n  \n'))
+    self.assertEdit(3, 3, '\n  \n')
+
+  def test_several_edits(self):
+    renderer = IncrementalRenderer(SOURCE, '\n', '  ')
+    renderer.edit(6, 7, '        %li uno\n')
+    renderer.edit(9, 9, '      %p still none\n')
+    renderer.edit(1, 1, '-extends "base.haml"\n')
+    renderer.edit(3, 4, '    %p: %b not condensed\n')
+    self.assertMultiLineEqual(Renderer(renderer.source, '\n', '  ').render(),
+                              renderer.render())
+
+  def test_invalid_edit(self):
+    renderer = IncrementalRenderer(SOURCE, '\n', '  ')
+    output = renderer.render()
+
+    with self.assertRaises(TemplateSyntaxError) as context:
+      renderer.edit(6, 8, '        %li one\n       %li bad indent\n')
+    self.assertEqual(7, context.exception.lineno)
+    self.assertEqual(output, renderer.render())
+    self.assertEqual(SOURCE, renderer.source)
+
+    with self.assertRaises(IndexError):
+      renderer.edit(3, 2, '')
+
+  def test_random_edits(self):
+    self.maxDiff = None
+    for seed in range(50):
+      rng = random.Random(seed)
+      source = '%div\n  %p start'
+      renderer = IncrementalRenderer(source, '\n', '  ')
+      for _ in range(20):
+        source_lines = list(renderer.source_lines)
+        start = rng.randint(1, len(source_lines) + 1)
+        end = rng.randint(start, min(start + 3, len(source_lines) + 1))
+        level = 0
+        if start > 1:
+          previous = source_lines[start - 2]
+          level = ((len(previous) - len(previous.lstrip())) // 2 +
+                   rng.choice([0, 1]))
+        new_lines = random_lines(rng, rng.randint(0, 3), level)
+        text = ''.join(line + '\n' for line in new_lines)
+        source_lines[start - 1:end - 1] = new_lines
+        new_source = '\n'.join(source_lines)
+
+        try:
+          expected = Renderer(new_source, '\n', '  ').render()
+        except TemplateSyntaxError:
+          old_source, output = renderer.source, renderer.render()
+          self.assertRaises(TemplateSyntaxError, renderer.edit, start, end,
+                            text)
+          self.assertEqual(old_source, renderer.source)
+          self.assertEqual(output, renderer.render())
+          continue
+
+        old_lines = list(renderer.lines)
+        index, count, lines = renderer.edit(start, end, text)
+        old_lines[index:index + count] = lines
+        message = 'seed %d: %r' % (seed, new_source)
+        self.assertEqual(new_source, renderer.source, message)
+        self.assertMultiLineEqual(expected, renderer.render(), message)
+        self.assertMultiLineEqual(expected, '\n'.join(old_lines), message)
@@ -0,0 +1,78 @@
+import unittest2
+
+from pyhaml_jinja.errors import TemplateIndentationError
+from pyhaml_jinja.line_index import LineIndex
+from pyhaml_jinja.parser import Parser
+
+
+SOURCE = '\n'.join([
+    '%div  ',
+    '; comment',
+    '  %p #{name}',
+    '  %a(href="#", \\',
+    '     title="x")',
+    '',
+    '\t\t',
+    ':javascript',
+    '  var a = #{a};',
+    ])
+
+
+class TestLineIndex(unittest2.TestCase):
+
+  def test_same_lines(self):
+    for raw_blocks in (False, True, Parser.RAW_BLOCKS_JINJA):
+      index = Parser.index_source_lines(SOURCE, raw_blocks=raw_blocks)
+      self.assertIsInstance(index, LineIndex)
+      lines = Parser.get_source_lines(SOURCE, raw_blocks=raw_blocks)
+      self.assertEqual(lines, list(index))
+      self.assertEqual(lines, index[:])
+      self.assertEqual(lines[-1], index[-1])
+      self.assertEqual(len(lines), len(index))
+
+  def test_lines_are_offsets(self):
+    index = Parser.index_source_lines(SOURCE)
+    self.assertEqual(LineIndex.SOURCE, index.kinds[0])
+    self.assertEqual((0, 4), (index.starts[0], index.ends[0]))
+    self.assertEqual(LineIndex.BLANK, index.kinds[1])
+    self.assertEqual(LineIndex.INTERPOLATED, index.kinds[2])
+    self.assertEqual('  %p {{ name }}', index[2])
+    self.assertEqual(LineIndex.STRING, index.kinds[3])
+    self.assertEqual({3: '  %a(href="#", title="x")'}, index.strings)
+
+  def test_iter_indented_lines(self):
+    index = Parser.index_source_lines(SOURCE)
+    self.assertEqual([
+        (1, '%div', 0),
+        (3, '  %p {{ name }}', 2),
+        (4, '  %a(href="#", title="x")', None),
+        (8, ':javascript', 0),
+        (9, '  var a = {{ a }};', 2),
+        ], list(index.iter_indented_lines()))
+
+  def test_line_levels(self):
+    index = Parser.index_source_lines(SOURCE)
+    self.assertEqual(list(Parser.iter_line_levels(list(index))),
+                     list(Parser.iter_line_levels(index)))
+
+  def test_mixed_indentation(self):
+    index = Parser.index_source_lines('%div\n \t%p')
+    self.assertEqual(-1, index.indents[1])
+    with self.assertRaises(TemplateIndentationError) as context:
+      list(Parser.iter_line_levels(index))
+    self.assertEqual(2, context.exception.lineno)
+
+  def test_whitespace_is_stripped_like_strip(self):
+    for source in ('%div \r\n\x0b\n  %p\x0c \n\n \t',
+                   u'%div\xa0\n\xa0%p\u3000'):
+      index = Parser.index_source_lines(source)
+      self.assertEqual([line.rstrip() for line in source.rstrip().split('\n')
+                        if line.strip()],
+                       [line for _, line, _ in index.iter_indented_lines()])
+
+  def test_raw_block_body_offsets(self):
+    source = '%div\n  :plain\n\n     a  \n   \n      b\n\n  %p'
+    index = Parser.index_source_lines(source, raw_blocks=True)
+    self.assertEqual('  :plain\na\n\n b', index[1])
+    self.assertEqual(['', '', '', '', ''], index[2:7])
+    self.assertEqual('  %p', index[7])
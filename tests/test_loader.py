@@ -0,0 +1,68 @@
+import os
+import shutil
+import tempfile
+
+import unittest2
+
+from jinja2 import DictLoader, Environment, FileSystemLoader
+
+from pyhaml_jinja import HamlExtension, HamlLoader
+
+
+class TestHamlLoader(unittest2.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.directory)
+    self.write('page.haml', '%p text')
+
+    self.loader = HamlLoader(FileSystemLoader(self.directory), stat_ttl=60)
+    self.env = Environment(loader=self.loader, extensions=[HamlExtension],
+                           auto_reload=True)
+
+    self.stat_calls = []
+    original_stat = os.stat
+    def counting_stat(path):
+      self.stat_calls.append(path)
+      return original_stat(path)
+    os.stat = counting_stat
+    self.addCleanup(setattr, os, 'stat', original_stat)
+
+  def write(self, name, source, mtime=None):
+    path = os.path.join(self.directory, name)
+    with open(path, 'w') as template_file:
+      template_file.write(source)
+    if mtime is not None:
+      os.utime(path, (mtime, mtime))
+
+  def test_uptodate_uses_cached_stat(self):
+    template = self.env.get_template('page.haml')
+    calls = len(self.stat_calls)
+    for _ in range(100):
+      self.assertTrue(template.is_up_to_date)
+    self.assertEqual(calls, len(self.stat_calls))
+
+  def test_stat_ttl(self):
+    template = self.env.get_template('page.haml')
+    self.write('page.haml', '%p new', mtime=1)
+
+    self.assertTrue(template.is_up_to_date)
+    self.loader.stat_ttl = 0
+    self.assertFalse(template.is_up_to_date)
+    self.assertEqual('<p>\n  new\n</p>',
+                     self.env.get_template('page.haml').render())
+
+  def test_clear(self):
+    self.env.get_template('page.haml')
+    calls = len(self.stat_calls)
+    self.loader.clear()
+    self.assertEqual(None, self.loader.get_mtime(
+        os.path.join(self.directory, 'missing.haml')))
+    self.loader.get_mtime(os.path.join(self.directory, 'page.haml'))
+    self.assertEqual(calls + 2, len(self.stat_calls))
+
+  def test_templates_without_filename(self):
+    loader = HamlLoader(DictLoader({'a.haml': '%a'}))
+    env = Environment(loader=loader, extensions=[HamlExtension])
+    self.assertEqual('<a>\n</a>', env.get_template('a.haml').render())
+    self.assertEqual(['a.haml'], env.list_templates())
@@ -39,3 +39,16 @@ class TestNodeGetSiblings(unittest2.TestCase):
     self.assertEqual(child1, child2.get_previous_sibling())
     self.assertEqual(child3, child2.get_next_sibling())
 
+
+  def test_siblings_are_linked(self):
+    parent = nodes.Node()
+    children = [nodes.Node() for _ in range(3)]
+    for child in children:
+      parent.add_child(child)
+
+    self.assertEqual(None, children[0].previous_sibling)
+    self.assertEqual(children[1], children[0].next_sibling)
+    self.assertEqual(children[0], children[1].previous_sibling)
+    self.assertEqual(children[2], children[1].next_sibling)
+    self.assertEqual(children[1], children[2].previous_sibling)
+    self.assertEqual(None, children[2].next_sibling)
@@ -0,0 +1,145 @@
+import unittest2
+
+from pyhaml_jinja import nodes
+from pyhaml_jinja.nodes import node as node_module
+
+
+NODES = [
+    nodes.Node(),
+    nodes.EmptyNode(),
+    nodes.TextNode('text'),
+    nodes.PreformattedTextNode('text'),
+    nodes.CustomBlockNode('plain'),
+    nodes.HtmlNode('div'),
+    nodes.SelfClosingHtmlNode('br'),
+    nodes.HtmlCommentNode('comment'),
+    nodes.JinjaNode('if', 'True'),
+    nodes.SelfClosingJinjaNode('set', 'a = 1'),
+    ]
+
+
+class TestNodeSlots(unittest2.TestCase):
+
+  def test_nodes_have_no_instance_dictionary(self):
+    for node in NODES:
+      self.assertFalse(hasattr(node, '__dict__'), type(node))
+
+  def test_leaf_nodes_share_empty_children(self):
+    self.assertIs(nodes.Node().children, nodes.TextNode('text').children)
+
+  def test_attributes_allocated_lazily(self):
+    node = nodes.HtmlNode('div')
+    self.assertEqual(None, node._attributes)
+    self.assertEqual('<div>', node.render_start())
+    self.assertEqual(None, node._attributes)
+
+    node.add_attribute('id', 'a')
+    self.assertEqual({'id': 'a'}, node._attributes)
+
+  def test_attributes_setter(self):
+    node = nodes.HtmlNode('div')
+    node.attributes = {'a': '1'}
+    self.assertEqual('<div a="1">', node.render_start())
+
+  def test_tag_and_attribute_names_are_interned(self):
+    node1 = nodes.HtmlNode(u''.join([u'd', u'iv']))
+    node2 = nodes.HtmlNode(u''.join([u'di', u'v']))
+    self.assertIs(node1.tag, node2.tag)
+
+    node1.add_attribute(''.join(['cl', 'ass']), 'a')
+    node2.add_attribute(''.join(['c', 'lass']), 'b')
+    self.assertIs(node1.attributes.keys()[0], node2.attributes.keys()[0])
+
+  def test_intern_name(self):
+    self.assertIs(nodes.intern_name(''.join(['a', 'b'])),
+                  nodes.intern_name(''.join(['a', 'b'])))
+    self.assertIs(nodes.intern_name(u''.join([u'a', u'b'])),
+                  nodes.intern_name(u''.join([u'a', u'b'])))
+
+  def test_intern_name_is_bounded(self):
+    names = dict(node_module._NAMES)
+    try:
+      node_module._NAMES.clear()
+      node_module._NAMES.update((unicode(i), unicode(i))
+                                for i in range(node_module.MAX_NAMES))
+      name = u''.join([u'new', u'name'])
+      self.assertIs(name, nodes.intern_name(name))
+      self.assertEqual(node_module.MAX_NAMES, len(node_module._NAMES))
+      self.assertIs(node_module._NAMES[u'0'],
+                    nodes.intern_name(u''.join([u'0'])))
+    finally:
+      node_module._NAMES.clear()
+      node_module._NAMES.update(names)
+
+
+class TestRenderedStrings(unittest2.TestCase):
+
+  def test_html_start_is_memoized(self):
+    node = nodes.HtmlNode('li', {'class': 'item'})
+    start = node.render_start()
+    self.assertIs(start, node.render_start())
+    other = nodes.HtmlNode('li', {'class': 'item'})
+    self.assertIs(start, other.render_start())
+    self.assertIs(node.render_end(), nodes.HtmlNode('li').render_end())
+
+  def test_add_attribute_forgets_start(self):
+    node = nodes.HtmlNode('li')
+    self.assertEqual('<li>', node.render_start())
+    node.add_attribute('id', 'a')
+    self.assertEqual('<li id="a">', node.render_start())
+    node.attributes = {'title': 'b'}
+    self.assertEqual('<li title="b">', node.render_start())
+
+  def test_attributes_getter_keeps_start(self):
+    node = nodes.HtmlNode('li', {'id': 'a'})
+    start = node.render_start()
+    self.assertEqual({'id': 'a'}, node.attributes)
+    self.assertIs(start, node._start)
+    node.attributes['title'] = 'b'
+    self.assertEqual('<li id="a">', node.render_start())
+    node.clear_rendered()
+    self.assertIn('title="b"', node.render_start())
+
+  def test_setting_tag_forgets_start(self):
+    node = nodes.HtmlNode('li')
+    self.assertEqual('</li>', node.render_end())
+    node.tag = 'p'
+    self.assertEqual('<p>', node.render_start())
+    self.assertEqual('</p>', node.render_end())
+
+  def test_setting_jinja_tag_and_data_forgets_strings(self):
+    parent = nodes.Node()
+    parent.add_child(nodes.JinjaNode('if', 'x'))
+    parent.add_child(nodes.JinjaNode('else'))
+    self.assertEqual(None, parent.children[0].render_end())
+    parent.children[1].tag = 'for'
+    self.assertEqual('{% endif %}', parent.children[0].render_end())
+    parent.children[0].data = 'y'
+    self.assertEqual('{% if y %}', parent.children[0].render_start())
+
+  def test_setting_text_forgets_parent_start(self):
+    node = nodes.HtmlNode('pre')
+    node.add_child(nodes.PreformattedTextNode('a'))
+    self.assertEqual('<pre>a', node.render_start())
+    node.children[0].data = 'b'
+    self.assertEqual('<pre>b', node.render_start())
+
+  def test_add_child_forgets_start(self):
+    node = nodes.HtmlNode('pre')
+    self.assertEqual('<pre>', node.render_start())
+    node.add_child(nodes.PreformattedTextNode('text'))
+    self.assertEqual('<pre>text', node.render_start())
+
+  def test_add_child_forgets_previous_sibling_end(self):
+    parent = nodes.Node()
+    parent.add_child(nodes.JinjaNode('if', 'x'))
+    self.assertEqual('{% endif %}', parent.children[0].render_end())
+    parent.add_child(nodes.JinjaNode('else'))
+    self.assertEqual(None, parent.children[0].render_end())
+    self.assertEqual('{% endif %}', parent.children[1].render_end())
+
+  def test_share_string(self):
+    self.assertIs(nodes.share_string(''.join(['<', 'p>'])),
+                  nodes.share_string(''.join(['<p', '>'])))
+    self.assertIsInstance(nodes.share_string(u'<p>'), unicode)
+    self.assertEqual(None, nodes.share_string(None))
@@ -0,0 +1,116 @@
+import os
+import shutil
+import tempfile
+
+import unittest2
+
+from jinja2 import ChoiceLoader, DictLoader, Environment, PrefixLoader
+from jinja2 import TemplateNotFound
+
+from pyhaml_jinja.haml_extension import HamlExtension
+from pyhaml_jinja.pack import PackLoader, TemplatePack, build_pack
+
+
+TEMPLATES = {
+    'base.haml': (
+        '%html\n'
+        '  %body\n'
+        '    -block content\n'
+        ),
+    'page.haml': (
+        '-extends "base.haml"\n'
+        '-block content\n'
+        '  %p(class="greeting") Hello #{name}\n'
+        ),
+    'plain.html': '<b>{{ name }}</b>',
+    }
+
+
+class TestPack(unittest2.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.directory)
+    self.path = os.path.join(self.directory, 'templates.hamlpack')
+
+    self.source_environment = Environment(loader=DictLoader(TEMPLATES),
+                                          extensions=[HamlExtension])
+
+  def pack_environment(self):
+    return Environment(loader=PackLoader(self.path),
+                       extensions=[HamlExtension])
+
+  def test_build_pack_defaults_to_haml_templates(self):
+    names = build_pack(self.source_environment, self.path)
+    self.assertEqual(['base.haml', 'page.haml'], sorted(names))
+
+    pack = TemplatePack(self.path)
+    self.assertEqual(['base.haml', 'page.haml'], pack.names())
+    self.assertNotIn('plain.html', pack)
+
+  def test_pack_stores_preprocessed_source(self):
+    build_pack(self.source_environment, self.path)
+    source, _, preprocessed = TemplatePack(self.path).get('page.haml')
+    self.assertTrue(preprocessed)
+    self.assertEqual(
+        self.source_environment.preprocess(TEMPLATES['page.haml'],
+                                           'page.haml'),
+        source)
+
+  def test_pack_loader_renders_without_parsing(self):
+    build_pack(self.source_environment, self.path, names=TEMPLATES.keys())
+
+    def fail(*args, **kwargs):
+      self.fail('The HAML pipeline should not run for packed templates.')
+
+    environment = self.pack_environment()
+    environment.haml_renderer_class = fail
+    html = environment.get_template('page.haml').render(name='World')
+    self.assertIn('<p class="greeting">', html)
+    self.assertIn('Hello World', html)
+    self.assertEqual('<b>World</b>',
+                     environment.get_template('plain.html').render(
+                         name='World'))
+
+  def test_wrapped_pack_loader(self):
+    build_pack(self.source_environment, self.path)
+    expected = self.pack_environment().get_template('base.haml').render()
+    other = DictLoader({'other.haml': '%i #{name}'})
+    for loader, packed_name, other_name in (
+        (ChoiceLoader([other, PackLoader(self.path)]),
+         'base.haml', 'other.haml'),
+        (PrefixLoader({'pack': PackLoader(self.path), 'other': other}),
+         'pack/base.haml', 'other/other.haml')):
+      environment = Environment(loader=loader, extensions=[HamlExtension])
+      self.assertEqual(expected,
+                       environment.get_template(packed_name).render())
+      self.assertEqual('<i>\n  x\n</i>',
+                       environment.get_template(other_name).render(name='x'))
+
+  def test_pack_loader_missing_template(self):
+    build_pack(self.source_environment, self.path)
+    with self.assertRaises(TemplateNotFound):
+      self.pack_environment().get_template('missing.haml')
+
+  def test_pack_loader_rejects_different_settings(self):
+    build_pack(self.source_environment, self.path)
+    environment = self.pack_environment()
+    environment.haml_indent_string = ''
+    with self.assertRaises(RuntimeError):
+      environment.get_template('page.haml')
+
+    environment = self.pack_environment()
+    environment.haml_compact = True
+    with self.assertRaises(RuntimeError):
+      environment.get_template('page.haml')
+
+    environment = self.pack_environment()
+    environment.haml_raw_blocks = 'jinja'
+    with self.assertRaises(RuntimeError):
+      environment.get_template('page.haml')
+
+  def test_invalid_pack_file(self):
+    with open(self.path, 'wb') as pack_file:
+      pack_file.write('x' * 64)
+    with self.assertRaises(ValueError):
+      TemplatePack(self.path)
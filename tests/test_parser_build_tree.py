@@ -202,6 +202,28 @@ class TestParserBuildTree(unittest2.TestCase):
     self.assertEqual(['{% for item in list %}', 'item', '{% else %}', 'empty',
                       '{% endfor %}'], lines)
 
+  def test_tree_jinja_tag_for_else_after_if(self):
+    source = (
+        '-if True\n'
+        '  true\n'
+        '-for item in list\n'
+        '  item\n'
+        '-else\n'
+        '  empty\n'
+        )
+    tree = Parser.build_tree(source)
+    lines = tree.render_lines()
+    self.assertEqual(['{% if True %}', 'true', '{% endif %}',
+                      '{% for item in list %}', 'item', '{% else %}', 'empty',
+                      '{% endfor %}'], lines)
+
+  def test_tree_jinja_tag_long_elif_chain(self):
+    source = '-if 0\n' + ''.join('-elif %d\n' % i for i in range(1, 500))
+    tree = Parser.build_tree(source)
+    lines = tree.render_lines()
+    self.assertEqual(501, len(lines))
+    self.assertEqual(['{% elif 499 %}', '{% endif %}'], lines[-2:])
+
   def test_tree_jinja_tags_empty(self):
     source = (
         '-for item in list\n'
@@ -0,0 +1,89 @@
+import unittest2
+
+from pyhaml_jinja import nodes
+from pyhaml_jinja.parser import Parser
+
+
+class TestParserDescribeLine(unittest2.TestCase):
+
+  def test_empty_line(self):
+    self.assertEqual(((nodes.EmptyNode, (), ()), ), Parser.describe_line(''))
+
+  def test_text(self):
+    self.assertEqual(((nodes.TextNode, ('text', ), ()), ),
+                     Parser.describe_line('text'))
+
+  def test_html_tag_with_attributes(self):
+    description = Parser.describe_line('%-a.cls#id(href="#") link')
+    self.assertEqual((
+        (nodes.HtmlNode, ('a', None, True),
+         (('class', 'cls'), ('id', 'id'), ('href', '#'))),
+        (nodes.TextNode, ('link', ), ()),
+        ), description)
+
+  def test_nested_tags(self):
+    description = Parser.describe_line('%div: -if x: %br')
+    self.assertEqual((
+        (nodes.HtmlNode, ('div', None, False), ()),
+        (nodes.JinjaNode, ('if', 'x'), ()),
+        (nodes.SelfClosingHtmlNode, ('br', None, False), ()),
+        ), description)
+
+  def test_inline_content_on_self_closing_tag(self):
+    with self.assertRaises(ValueError):
+      Parser.describe_line('%br text')
+    with self.assertRaises(RuntimeError):
+      Parser.describe_line('%br: %p')
+
+  def test_duplicate_attribute_comes_first(self):
+    with self.assertRaisesRegexp(KeyError, 'on node <br a="1" / '):
+      Parser.describe_line('%br(a="1", a="2"): %p')
+
+  def test_unknown_custom_block(self):
+    with self.assertRaises(ValueError):
+      Parser.describe_line(':unknown')
+
+  def test_build_nodes(self):
+    node = Parser.build_nodes(Parser.describe_line('%div.a: %p text'))
+    self.assertIsInstance(node, nodes.HtmlNode)
+    self.assertEqual({'class': 'a'}, node.attributes)
+
+    child = node.get_children()[0]
+    self.assertIsInstance(child, nodes.HtmlNode)
+    self.assertEqual('p', child.tag)
+    self.assertEqual('text', child.get_children()[0].data)
+
+
+class TestParserDescriptionCache(unittest2.TestCase):
+
+  def setUp(self):
+    Parser.clear_description_cache()
+    self.addCleanup(Parser.clear_description_cache)
+
+  def test_tag_lines_are_memoized(self):
+    description = Parser.describe_line('%li.item')
+    self.assertIs(description, Parser.describe_line(''.join(['%li', '.item'])))
+    self.assertIs(Parser.describe_line('-else'), Parser.describe_line('-else'))
+
+  def test_text_lines_are_not_memoized(self):
+    self.assertIsNot(Parser.describe_line('text'), Parser.describe_line('text'))
+
+  def test_errors_are_not_memoized(self):
+    for _ in range(2):
+      with self.assertRaises(ValueError):
+        Parser.describe_line('%br text')
+
+  def test_unicode_lines_are_kept_apart(self):
+    Parser.describe_line('%p')
+    node_class, args, _ = Parser.describe_line(u'%p')[0]
+    self.assertIsInstance(args[0], unicode)
+
+  def test_cache_is_bounded(self):
+    self.addCleanup(setattr, Parser, 'DESCRIPTION_CACHE_SIZE',
+                    Parser.DESCRIPTION_CACHE_SIZE)
+    Parser.DESCRIPTION_CACHE_SIZE = 2
+    description = Parser.describe_line('%a')
+    Parser.describe_line('%b')
+    Parser.describe_line('%i')
+    self.assertIsNot(description, Parser.describe_line('%a'))
+    self.assertTrue(len(Parser._descriptions[str]) <= 2)
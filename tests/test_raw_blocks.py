@@ -0,0 +1,82 @@
+import unittest2
+
+from jinja2 import DictLoader, Environment
+
+from pyhaml_jinja import HamlExtension
+from pyhaml_jinja.compiler import Compiler
+from pyhaml_jinja.parser import Parser
+from pyhaml_jinja.renderer import Renderer
+
+
+SOURCE = '\n'.join([
+    '%div',
+    '  :javascript',
+    '',
+    '      if (a) {',
+    '        b("#{x}"); \\',
+    '    ; c',
+    '      }',
+    '',
+    '  %p #{x}',
+    ])
+
+EXPECTED = '\n'.join([
+    '<div>',
+    '  <script type="text/javascript">',
+    '      if (a) {',
+    '        b("#{x}"); \\',
+    '    ; c',
+    '      }',
+    '  </script>',
+    '  <p>',
+    '    {{ x }}',
+    '  </p>',
+    '</div>',
+    ])
+
+
+class TestRawBlocks(unittest2.TestCase):
+
+  def test_get_source_lines(self):
+    lines = Parser.get_source_lines(SOURCE, raw_blocks=True)
+    self.assertEqual(len(SOURCE.split('\n')), len(lines))
+    self.assertEqual(
+        '  :javascript\n  if (a) {\n    b("#{x}"); \\\n; c\n  }', lines[1])
+    self.assertEqual([''] * 6, lines[2:8])
+    self.assertEqual('  %p {{ x }}', lines[8])
+
+  def test_renderers(self):
+    self.assertEqual(EXPECTED, Renderer(SOURCE, '\n', '  ',
+                                        raw_blocks=True).render())
+    self.assertEqual(EXPECTED, Renderer(SOURCE, '\n', '  ', flat=True,
+                                        raw_blocks=True).render())
+    self.assertEqual(EXPECTED, Compiler(SOURCE, '\n', '  ',
+                                        raw_blocks=True).render())
+
+  def test_jinja_raw(self):
+    source = ':css\n  a { b: "{{ c }}"; }'
+    output = Compiler(source, '\n', '  ', raw_blocks='jinja').render()
+    self.assertEqual('<style type="text/css">\n  {% raw %}\n'
+                     '  a { b: "{{ c }}"; }\n  {% endraw %}\n</style>', output)
+    self.assertEqual('<style type="text/css">\n  \n  a { b: "{{ c }}"; }\n'
+                     '  \n</style>', Environment().from_string(output).render())
+
+  def test_compact(self):
+    output = Renderer(SOURCE, '\r\n', compact=True, raw_blocks=True).render()
+    self.assertEqual(output, Compiler(SOURCE, '\r\n', compact=True,
+                                      raw_blocks=True).render())
+    self.assertIn('<script type="text/javascript">\r\n  if (a) {\r\n',
+                  output)
+
+  def test_inline_block_is_parsed(self):
+    source = '%div: :plain\n  #{x}'
+    self.assertEqual(Renderer(source, '\n', '  ').render(),
+                     Renderer(source, '\n', '  ', raw_blocks=True).render())
+
+  def test_extension_setting(self):
+    env = Environment(loader=DictLoader({'page.haml': SOURCE}),
+                      extensions=[HamlExtension])
+    env.haml_raw_blocks = True
+    self.assertEqual(EXPECTED, env.preprocess(SOURCE, 'page.haml'))
+    env.haml_raw_blocks = False
+    self.assertNotEqual(EXPECTED, env.preprocess(SOURCE, 'page.haml'))
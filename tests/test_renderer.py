@@ -1,3 +1,5 @@
+import io
+
 import unittest2
 
 from pyhaml_jinja.renderer import Renderer
@@ -97,3 +99,48 @@ class TestRenderer(unittest2.TestCase):
       'line2\n'
       '</pre>'), html)
 
+
+  def test_iter_lines(self):
+    source = (
+        '%-div\n'
+        '  %p text\n'
+        '  text2\n'
+        )
+    renderer = Renderer(source, newline_string='\n', indent_string='  ')
+    lines = renderer.iter_lines()
+    self.assertFalse(isinstance(lines, list))
+    self.assertEqual(['<div><p>', '    text', '  </p>', '  text2</div>'],
+                     list(lines))
+
+  def test_iter_lines_with_replacements(self):
+    renderer = Renderer('-if a\n  %p text\n%br', '\n', '  ')
+    jinja_node, br = renderer.parser.tree.get_children()
+    replacements = {jinja_node: ('IF', 'ENDIF'), br: ('BR', None)}
+    self.assertEqual(['IF', '  <p>', '    text', '  </p>', 'ENDIF', 'BR'],
+                     list(renderer.iter_lines(replacements)))
+    self.assertEqual('{% if a %}', renderer.render().split('\n')[0])
+
+  def test_render_to_callable(self):
+    source = (
+        '%div\n'
+        '  %p text\n'
+        )
+    chunks = []
+    renderer = Renderer(source, newline_string='\n', indent_string='  ')
+    renderer.render_to(chunks.append)
+    self.assertEqual(renderer.render(), ''.join(chunks))
+
+  def test_render_to_file_object(self):
+    source = (
+        '%div\n'
+        '  %p text\n'
+        )
+    output = io.StringIO()
+    renderer = Renderer(source, newline_string=u'\n', indent_string=u'  ')
+    renderer.render_to(output)
+    self.assertEqual(renderer.render(), output.getvalue())
+
+  def test_render_to_empty_source(self):
+    chunks = []
+    Renderer('', newline_string='\n').render_to(chunks.append)
+    self.assertEqual([], chunks)
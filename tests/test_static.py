@@ -0,0 +1,93 @@
+import unittest2
+
+from jinja2 import DictLoader, Environment
+
+from pyhaml_jinja import HamlExtension
+from pyhaml_jinja.compiler import Compiler
+from pyhaml_jinja.parser import Parser
+from pyhaml_jinja.renderer import Renderer
+from pyhaml_jinja.static import iter_static_subtrees, measure_static_subtrees
+from pyhaml_jinja.stats import TemplateStats
+
+
+SOURCE = '\n'.join([
+    '%div',
+    '  %p: %b static',
+    '  -if x',
+    '    %ul',
+    '      %li one',
+    '      %li two',
+    '  %p #{name}',
+    '%-span',
+    '  %a condensed',
+    '%pre',
+    '  |text',
+    '  |  more',
+    ':javascript',
+    '  var a = 1;',
+    '',
+    '  var b = 2;',
+    ])
+
+
+class TestStaticSubtrees(unittest2.TestCase):
+
+  def test_iter_static_subtrees(self):
+    tree = Parser.build_tree(SOURCE)
+    subtrees = [(node.render_start(), level, count)
+                for node, level, count in iter_static_subtrees(tree)]
+    self.assertEqual([
+        ('<p>', 1, 3),
+        ('<ul>', 2, 5),
+        ('<span>', 0, 3),
+        ('<script type="text/javascript">', 0, 3),
+        ], subtrees)
+
+  def test_measure_static_subtrees(self):
+    tree = Parser.build_tree(SOURCE)
+    output = Renderer(SOURCE, '\n', '  ').render() + '\n'
+    lines = output.split('\n')
+    # <p> in <div>, <ul> in -if, <span> and <script>, but not <pre>.
+    static_lines = lines[1:6] + lines[7:15] + lines[20:23] + lines[26:30]
+    self.assertEqual((14, sum(len(line) + 1 for line in static_lines)),
+                     measure_static_subtrees(tree, '  ', '\n'))
+
+  def test_stats(self):
+    stats = TemplateStats()
+    output = Renderer('%p: %b text\n%p #{a}', '\n', '  ',
+                      stats=stats).render()
+    self.assertIn('static', stats.wall_times)
+    self.assertEqual(3, stats.static_node_count)
+    self.assertEqual(len('<p>\n  <b>\n    text\n  </b>\n</p>\n'),
+                     stats.static_size)
+    self.assertEqual(output.index('<p>\n  {{'), stats.static_size)
+
+    stats = TemplateStats()
+    Renderer('%p text', '\n', '  ', stats=stats, compact=True).render()
+    self.assertIsNone(stats.static_size)
+
+  def test_compiler_stats(self):
+    for source in (SOURCE, '%p: %b text\n%p #{a}', '-if x\n  %a\n%-b\n  %i y'):
+      expected = TemplateStats()
+      Renderer(source, '\r\n', '  ', stats=expected).render()
+      stats = TemplateStats()
+      Compiler(source, '\r\n', '  ', stats=stats).render()
+      self.assertEqual(
+          (expected.node_count, expected.static_node_count,
+           expected.static_size),
+          (stats.node_count, stats.static_node_count, stats.static_size))
+
+    stats = TemplateStats()
+    Compiler('%p text', '\n', '  ', stats=stats, compact=True).render()
+    self.assertIsNone(stats.static_size)
+
+  def test_extension_stats(self):
+    for renderer_class in (None, Renderer):
+      reports = []
+      env = Environment(loader=DictLoader({'page.haml': SOURCE}),
+                        extensions=[HamlExtension])
+      if renderer_class is not None:
+        env.haml_renderer_class = renderer_class
+      env.haml_stats_callback = reports.append
+      env.get_template('page.haml')
+      self.assertEqual(14, reports[0].static_node_count)
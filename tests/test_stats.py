@@ -0,0 +1,88 @@
+import io
+
+import unittest2
+
+from jinja2 import Environment
+
+from pyhaml_jinja.compiler import Compiler
+from pyhaml_jinja.haml_extension import HamlExtension
+from pyhaml_jinja.renderer import Renderer
+from pyhaml_jinja.stats import TemplateStats
+
+
+SOURCE = '%div\n  %p: %b text\n  -if x\n    y\n'
+
+
+class TestTemplateStats(unittest2.TestCase):
+
+  def test_phase(self):
+    stats = TemplateStats('name')
+    with stats.phase('a'):
+      pass
+    with stats.phase('a'):
+      pass
+    self.assertEqual(['a'], stats.wall_times.keys())
+    self.assertGreaterEqual(stats.wall_times['a'], 0)
+    self.assertEqual(stats.wall_times['a'], stats.wall_time)
+    self.assertEqual(stats.cpu_times['a'], stats.cpu_time)
+
+  def test_renderer(self):
+    stats = TemplateStats()
+    output = Renderer(SOURCE, '\n', '  ', stats=stats).render()
+    self.assertEqual(set(['lines', 'tree', 'static', 'render']),
+                     set(stats.wall_times))
+    self.assertEqual(6, stats.node_count)
+    self.assertEqual(len(output), stats.output_size)
+
+  def test_renderer_flat(self):
+    stats = TemplateStats()
+    Renderer(SOURCE, '\n', '  ', flat=True, stats=stats).render()
+    self.assertEqual(6, stats.node_count)
+
+  def test_renderer_render_to(self):
+    stats = TemplateStats()
+    output = io.BytesIO()
+    Renderer(SOURCE, '\n', '  ', stats=stats).render_to(output)
+    self.assertEqual(len(output.getvalue()), stats.output_size)
+
+  def test_compiler(self):
+    stats = TemplateStats()
+    output = Compiler(SOURCE, '\n', '  ', stats=stats).render()
+    self.assertEqual(set(['lines', 'render']), set(stats.wall_times))
+    self.assertEqual(6, stats.node_count)
+    self.assertEqual(len(output), stats.output_size)
+
+
+class TestHamlExtensionStats(unittest2.TestCase):
+
+  def test_callback(self):
+    collected = []
+    env = Environment(extensions=[HamlExtension])
+    env.haml_stats_callback = collected.append
+
+    output = env.preprocess(SOURCE, 'a.haml')
+    env.preprocess(SOURCE, 'a.haml')  # Cached, so no stats.
+    env.preprocess('text', 'a.html')  # Not HAML.
+
+    self.assertEqual(1, len(collected))
+    self.assertEqual('a.haml', collected[0].name)
+    self.assertEqual(len(output), collected[0].output_size)
+
+  def test_slow_template_threshold(self):
+    env = Environment(extensions=[HamlExtension])
+    env.haml_slow_template_threshold = 0
+
+    with self.assertLogs('pyhaml_jinja', 'WARNING') as logs:
+      env.preprocess(SOURCE, 'slow.haml')
+    self.assertEqual(1, len(logs.output))
+    self.assertIn('slow.haml', logs.output[0])
+
+  def test_custom_renderer_without_stats(self):
+    class PlainRenderer(Renderer):
+      def __init__(self, source, newline_string=None, indent_string=None):
+        super(PlainRenderer, self).__init__(source, newline_string,
+                                            indent_string)
+
+    env = Environment(extensions=[HamlExtension])
+    env.haml_renderer_class = PlainRenderer
+    self.assertEqual('<div>\n</div>', env.preprocess('%div', 'a.haml'))
@@ -0,0 +1,104 @@
+import unittest2
+
+from jinja2 import DictLoader, Environment, TemplateSyntaxError
+
+from pyhaml_jinja import HamlExtension
+from pyhaml_jinja import token_stream
+
+
+SOURCES = [
+    u'',
+    u'<p>\n  text\n</p>\n',
+    u'<a href="{{ url }}">{{ name|e }}</a>\r\n{# note #}\n',
+    u'<ul>\n  {%- for i in {"a": {"b": 1}} -%}\n  <li>{{ i }}</li>\n'
+    u'  {% endfor -%}\n</ul>',
+    u'{% set s = "%}" %}{{ "}}" }}{{ s }}',
+    u'<script>\n{% raw -%}\n  var a = "{{ b }}";\n{%- endraw %}\n</script>',
+    u'<p>{% if a %}\n  x\n{% endif %}\n\n',
+    ]
+
+HAML = '\n'.join([
+    '%ul',
+    '  -for item in items',
+    '    %li(class="#{item}") #{item}',
+    '  -else',
+    '    %li none',
+    ':javascript',
+    '  var a = "{{ \'%}\' }}";',
+    ])
+
+
+class TestTokenStream(unittest2.TestCase):
+
+  def assertSameTokens(self, environment, source):
+    self.assertEqual(list(environment.lexer.tokenize(source, 'n', 'f')),
+                     list(token_stream.tokenize(environment, source, 'n',
+                                                'f')))
+
+  def test_same_tokens(self):
+    for environment in (Environment(), Environment(trim_blocks=True),
+                        Environment(keep_trailing_newline=True)):
+      for source in SOURCES:
+        self.assertSameTokens(environment, source)
+
+  def test_custom_delimiters(self):
+    environment = Environment(
+        block_start_string='<%', block_end_string='%>',
+        variable_start_string='<%=', variable_end_string='%>')
+    self.assertSameTokens(environment,
+                          u'<p><%= a -%>\n <% if b %>x<% endif %>')
+
+  def test_errors(self):
+    environment = Environment()
+    for source in (u'<p>\n{{ a ) }}', u'<p>\n{# a', u'<p>\n{% raw %}x'):
+      with self.assertRaises(TemplateSyntaxError) as expected:
+        list(environment.lexer.tokenize(source))
+      with self.assertRaises(TemplateSyntaxError) as context:
+        list(token_stream.tokenize(environment, source))
+      self.assertEqual(expected.exception.message, context.exception.message)
+      self.assertEqual(expected.exception.lineno, context.exception.lineno)
+
+  def test_supports(self):
+    self.assertTrue(token_stream.supports(Environment(trim_blocks=True)))
+    self.assertFalse(token_stream.supports(Environment(lstrip_blocks=True)))
+    self.assertFalse(token_stream.supports(
+        Environment(line_statement_prefix='#')))
+
+  def test_extension_setting(self):
+    env = Environment(loader=DictLoader({'page.haml': HAML}),
+                      extensions=[HamlExtension])
+    expected = env.get_template('page.haml').render(items=['a', 'b'])
+
+    env.haml_token_stream = True
+    env.cache.clear()
+    output = env.preprocess(HAML, 'page.haml')
+    self.assertIn(u'<ul>', output)
+    self.assertEqual(list(env.lexer.tokenize(output)),
+                     list(env._tokenize(HAML, 'page.haml')))
+    self.assertEqual(expected,
+                     env.get_template('page.haml').render(items=['a', 'b']))
+    self.assertEqual(u'x', env.from_string(u'{{ a }}').render(a='x'))
+
+    overlay = env.overlay()
+    self.assertIs(overlay, overlay._tokenize.im_self.environment)
+    self.assertEqual(expected, overlay.get_template('page.haml').render(
+        items=['a', 'b']))
+
+  def test_hook_installed_when_enabled(self):
+    env = Environment(loader=DictLoader({'page.haml': HAML}),
+                      extensions=[HamlExtension])
+    env.get_template('page.haml')
+    self.assertNotIn('_tokenize', vars(env))
+    self.assertNotIn('_tokenize', vars(env.overlay()))
+
+    env.haml_token_stream = True
+    env.preprocess(HAML, 'page.haml')
+    self.assertIs(env, env._tokenize.im_self.environment)
+
+  def test_unsupported_environment(self):
+    env = Environment(loader=DictLoader({'page.haml': HAML}),
+                      extensions=[HamlExtension], lstrip_blocks=True)
+    env.haml_token_stream = True
+    self.assertEqual(list(env.lexer.tokenize(env.preprocess(HAML,
+                                                           'page.haml'))),
+                     list(env._tokenize(HAML, 'page.haml')))
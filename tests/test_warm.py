@@ -0,0 +1,66 @@
+import unittest2
+
+from jinja2 import BaseLoader, DictLoader, Environment
+
+from pyhaml_jinja.haml_extension import HamlExtension, get_haml_extension
+
+
+TEMPLATES = {
+    'base.haml': '%html\n  %body\n    -block content\n',
+    'page.haml': '-extends "base.haml"\n-block content\n  %p Hello #{name}\n',
+    'admin/page.haml': '%p(class="admin") #{name}\n',
+    'plain.html': '<b>{{ name }}</b>',
+    }
+
+
+class CountingLoader(BaseLoader):
+
+  def __init__(self, mapping):
+    self.loader = DictLoader(mapping)
+    self.loaded = []
+
+  def get_source(self, environment, template):
+    self.loaded.append(template)
+    return self.loader.get_source(environment, template)
+
+  def list_templates(self):
+    return self.loader.list_templates()
+
+
+class TestWarm(unittest2.TestCase):
+
+  def setUp(self):
+    self.loader = CountingLoader(TEMPLATES)
+    self.environment = Environment(loader=self.loader,
+                                   extensions=[HamlExtension])
+
+  def test_warm(self):
+    names = self.environment.haml_warm(workers=2)
+    self.assertEqual(['admin/page.haml', 'base.haml', 'page.haml'], names)
+    self.assertEqual(sorted(names), sorted(self.loader.loaded))
+
+    del self.loader.loaded[:]
+    self.environment.get_template('page.haml').render(name='you')
+    self.assertEqual([], self.loader.loaded)
+
+  def test_patterns(self):
+    names = self.environment.haml_warm(patterns=['admin/*'], workers=1)
+    self.assertEqual(['admin/page.haml'], names)
+    self.assertEqual(['admin/page.haml'], self.loader.loaded)
+
+  def test_processes(self):
+    extension = get_haml_extension(self.environment)
+    self.environment.haml_warm(workers=2, processes=True, freeze=True)
+    self.assertEqual(3, len(extension.cache))
+    # Every source is read once, and the templates come from the cache.
+    self.assertEqual(['admin/page.haml', 'base.haml', 'page.haml'],
+                     sorted(self.loader.loaded))
+    del self.loader.loaded[:]
+    self.environment.get_template('page.haml').render(name='you')
+    self.assertEqual([], self.loader.loaded)
+
+    expected = Environment(loader=DictLoader(TEMPLATES),
+                           extensions=[HamlExtension])
+    for name in TEMPLATES:
+      self.assertEqual(expected.get_template(name).render(name='you'),
+                       self.environment.get_template(name).render(name='you'))
@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+import time
+
+import unittest2
+
+from jinja2 import Environment, FileSystemLoader, TemplateNotFound
+
+from pyhaml_jinja.haml_extension import HamlExtension
+from pyhaml_jinja.watcher import Inotify, WatchedLoader
+
+
+@unittest2.skipUnless(Inotify.is_available(), 'inotify is not available.')
+class TestWatchedLoader(unittest2.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.directory)
+    self.write('page.haml', '%p first')
+
+    self.loader = WatchedLoader(FileSystemLoader(self.directory))
+    self.env = Environment(loader=self.loader, extensions=[HamlExtension],
+                           auto_reload=True)
+    self.loader.start()
+    self.addCleanup(self.loader.stop)
+
+  def write(self, name, source):
+    path = os.path.join(self.directory, name)
+    if not os.path.isdir(os.path.dirname(path)):
+      os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as template_file:
+      template_file.write(source)
+
+  def render_until(self, name, expected, timeout=5):
+    deadline = time.time() + timeout
+    while True:
+      output = self.env.get_template(name).render()
+      if output == expected or time.time() > deadline:
+        return output
+      time.sleep(0.01)
+
+  def test_recompiles_changed_template(self):
+    template = self.env.get_template('page.haml')
+    self.assertEqual('<p>\n  first\n</p>', template.render())
+    self.assertIs(template, self.env.get_template('page.haml'))
+
+    self.write('page.haml', '%p second')
+    self.assertEqual('<p>\n  second\n</p>',
+                     self.render_until('page.haml', '<p>\n  second\n</p>'))
+
+  def test_uptodate_does_not_stat(self):
+    template = self.env.get_template('page.haml')
+    original_stat = os.stat
+    os.stat = None
+    try:
+      self.assertTrue(template.is_up_to_date)
+    finally:
+      os.stat = original_stat
+
+  def test_keeps_last_good_version(self):
+    self.env.get_template('page.haml')
+    with self.assertLogs('pyhaml_jinja.watcher', 'ERROR'):
+      self.write('page.haml', '%p\n  %br\n    oops')
+      time.sleep(0.2)
+    self.assertEqual('<p>\n  first\n</p>',
+                     self.env.get_template('page.haml').render())
+
+  def test_new_directories_are_watched(self):
+    self.write('sub/page.haml', '%p first')
+    time.sleep(0.1)
+    self.env.get_template('sub/page.haml')
+    self.write('sub/page.haml', '%p second')
+    self.assertEqual('<p>\n  second\n</p>',
+                     self.render_until('sub/page.haml', '<p>\n  second\n</p>'))
+
+  def test_deleted_template(self):
+    self.env.get_template('page.haml')
+    os.remove(os.path.join(self.directory, 'page.haml'))
+
+    deadline = time.time() + 5
+    with self.assertRaises(TemplateNotFound):
+      while time.time() < deadline:
+        self.env.get_template('page.haml')
+        time.sleep(0.01)